@@ -0,0 +1,712 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the WhatsApp query layer.
+
+Each benchmark builds a synthetic messages.db (see synthetic_db.py), points
+whatsapp.py at it and reports per-call latency. The `suite` benchmark times
+every public function in whatsapp.py and every MCP tool in main.py.
+
+The `startup` benchmark needs no database: it imports main.py in fresh
+interpreters under `python -X importtime`, the cost Claude Desktop pays each
+time it relaunches the stdio server. The mcp package is imported first and
+reported as a baseline, so the budget only covers this project's modules.
+It fails (exit status 1) when their median import time exceeds
+STARTUP_BUDGET_MS, or when a module in LAZY_MODULES is in sys.modules
+after `import main` instead of being imported on first use.
+
+With --json, every measured row is also written to a file together with the
+run's environment (commit, Python and SQLite versions, database size), and
+--baseline compares the rows against such a file from an earlier run.
+
+Usage: python benchmark.py [benchmark] [--size small|medium|large] [--json out.json] [--baseline old.json]
+"""
+
+import argparse
+import contextlib
+import inspect
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import db
+import metrics
+import schema
+import synthetic_db
+import whatsapp
+
+# Rows measured in this run, for --json: benchmark, label and latency stats
+RESULTS: List[Dict[str, Any]] = []
+_current_benchmark = ""
+# Checks that failed (e.g. the startup budget), turned into the exit status
+FAILURES: List[str] = []
+
+# Median time to `import main` in a fresh interpreter once STARTUP_BASELINE is
+# imported: the project's own share of the cold start
+STARTUP_BUDGET_MS = 150.0
+# Third-party import that dominates the cold start, measured separately
+STARTUP_BASELINE = "mcp.server.fastmcp"
+# Heavy modules the server only needs for rarely used tools, imported on first use
+LAZY_MODULES = ("pandas", "numpy", "requests")
+
+def time_calls(fn: Callable[[], object], calls: int, setup: Callable[[], None] = None) -> List[float]:
+    """Time `calls` invocations of fn, returning per-call latencies in microseconds."""
+    timings = []
+    for _ in range(calls):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """Median / p95 / mean of a list of latencies."""
+    ordered = sorted(timings)
+    return {
+        "median_us": statistics.median(ordered),
+        "p95_us": metrics.percentile(ordered, 0.95),
+        "mean_us": statistics.fmean(ordered),
+    }
+
+def print_row(label: str, stats: Dict[str, float]) -> None:
+    RESULTS.append({"benchmark": _current_benchmark, "label": label, **stats})
+    print(f"{label:<52} median {stats['median_us']:>10.1f} us   p95 {stats['p95_us']:>10.1f} us")
+
+def use_database(db_path: str) -> None:
+    """Point whatsapp.py at db_path, migrate it and drop any pooled connections."""
+    whatsapp.MESSAGES_DB_PATH = db_path
+    # Keep the harvested suppression list next to the benchmark database
+    whatsapp.SUPPRESSION = whatsapp.SuppressionList(db_path + ".suppression")
+    # No bridge writes to it, so migrate whatever the size (ensure_schema leaves large stores alone)
+    schema.migrate(db_path)
+    schema.backfill_epochs(db_path)
+    schema.ensure_schema(db_path)
+    db.close_connections()
+
+def sample_name(db_path: str) -> Tuple[str, str]:
+    """A saved contact's name from the database, and a misspelling of it."""
+    row = db.fetchone(db_path, """
+        SELECT name FROM chats
+        WHERE jid NOT LIKE '%@g.us' AND name GLOB '[A-Za-z]*' AND name LIKE '% %'
+        ORDER BY rowid LIMIT 1
+    """)
+    name = row[0] if row else "Contact 1"
+    return name, name[0] + name[2] + name[1] + name[3:]
+
+def bench_connection(args: argparse.Namespace, db_path: str) -> None:
+    """Per-call latency with a fresh connection per call vs. the warm pool."""
+    chat_jid = whatsapp.list_chats(limit=1)[0].jid
+    name, _ = sample_name(db_path)
+    cases = {
+        # Uncached, so the warm runs still measure the query
+        "get_chat": lambda: whatsapp.get_chat.__wrapped__(chat_jid),
+        "list_messages(chat, no context)": lambda: whatsapp.list_messages(chat_jid=chat_jid, include_context=False),
+        "search_contacts": lambda: whatsapp.search_contacts.__wrapped__(name),
+    }
+
+    print(f"\nConnection benchmark ({args.calls} calls each)")
+    print("-" * 100)
+    for name, fn in cases.items():
+        # "Before": every call pays for open + schema parse + cold page cache
+        cold = summarize(time_calls(fn, args.calls, setup=db.close_connections))
+        fn()
+        warm = summarize(time_calls(fn, args.calls))
+        print_row(f"{name} [connect per call]", cold)
+        print_row(f"{name} [pooled]", warm)
+        print(f"{'':<52} speedup x{cold['median_us'] / warm['median_us']:.1f}")
+
+def bench_context(args: argparse.Namespace, db_path: str) -> None:
+    """list_messages(include_context=True): one get_message_context per match vs. one batched query."""
+    calls = max(1, args.calls // 20)
+
+    def per_match_context():
+        result = []
+        for msg in whatsapp.list_messages(limit=20, include_context=False):
+            context = whatsapp.get_message_context(msg.id, 1, 1)
+            result.extend(context.before)
+            result.append(context.message)
+            result.extend(context.after)
+        return result
+
+    def batched_context():
+        return whatsapp.list_messages(limit=20, include_context=True)
+
+    per_match_context()
+    batched_context()
+    print(f"\nContext benchmark (20 matches per page, {calls} calls each)")
+    print("-" * 100)
+    before = summarize(time_calls(per_match_context, calls))
+    after = summarize(time_calls(batched_context, calls))
+    print_row("list_messages + context [query per match]", before)
+    print_row("list_messages + context [batched]", after)
+    print(f"{'':<52} speedup x{before['median_us'] / after['median_us']:.1f}")
+
+def bench_search(args: argparse.Namespace, db_path: str) -> None:
+    """Content search: LIKE full scan vs. the FTS5 index."""
+    import fts
+
+    indexed = fts.sync(db_path)
+    print(f"\nSearch benchmark ({args.calls} calls each, {indexed} messages newly indexed)")
+    print("-" * 100)
+    for term in ("zoom", "kathak dance"):
+        like = summarize(time_calls(
+            lambda: db.fetchall(db_path, """
+                SELECT messages.id FROM messages
+                JOIN chats ON messages.chat_jid = chats.jid
+                WHERE LOWER(messages.content) LIKE LOWER(?)
+                ORDER BY messages.timestamp DESC LIMIT 20
+            """, (f"%{term}%",)),
+            args.calls
+        ))
+        indexed_search = summarize(time_calls(
+            lambda: whatsapp.list_messages(query=term, include_context=False), args.calls
+        ))
+        ranked = summarize(time_calls(
+            lambda: whatsapp.list_messages(query=term, include_context=False, rank_by_relevance=True, include_snippets=True),
+            args.calls
+        ))
+        print_row(f"'{term}' [LIKE scan]", like)
+        print_row(f"'{term}' [FTS5]", indexed_search)
+        print_row(f"'{term}' [FTS5, bm25 + snippets]", ranked)
+        print(f"{'':<52} speedup x{like['median_us'] / indexed_search['median_us']:.1f}")
+
+def bench_pagination(args: argparse.Namespace, db_path: str) -> None:
+    """Deep pages of the busiest chat: LIMIT/OFFSET vs. keyset cursors."""
+    chat_jid = db.fetchone(db_path, "SELECT chat_jid FROM messages GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 1")[0]
+    calls = max(1, args.calls // 10)
+    print(f"\nPagination benchmark (busiest chat, 20 per page, {calls} calls each)")
+    print("-" * 100)
+    for depth in (0, 50, 500):
+        # Walk to the page with cursors once to find its starting cursor
+        cursor = None
+        for _ in range(depth):
+            page = whatsapp.list_messages(chat_jid=chat_jid, include_context=False, cursor=cursor)
+            if not page:
+                break
+            cursor = page[-1].cursor
+        offset = summarize(time_calls(
+            lambda: whatsapp.list_messages(chat_jid=chat_jid, include_context=False, page=depth), calls
+        ))
+        keyset = summarize(time_calls(
+            lambda: whatsapp.list_messages(chat_jid=chat_jid, include_context=False, cursor=cursor), calls
+        ))
+        print_row(f"page {depth} [OFFSET]", offset)
+        print_row(f"page {depth} [cursor]", keyset)
+
+def bench_inbox(args: argparse.Namespace, db_path: str) -> None:
+    """Chat list with last messages: join on last_message_time vs. the chat_summary table."""
+    print(f"\nInbox benchmark (20 chats per page, {args.calls} calls each)")
+    print("-" * 100)
+    join = summarize(time_calls(
+        lambda: db.fetchall(db_path, """
+            SELECT chats.jid, chats.name, chats.last_message_time, messages.content, messages.sender, messages.is_from_me
+            FROM chats
+            LEFT JOIN messages ON chats.jid = messages.chat_jid AND chats.last_message_time = messages.timestamp
+            ORDER BY chats.last_message_time DESC
+            LIMIT 20
+        """),
+        args.calls
+    ))
+    summary = summarize(time_calls(lambda: whatsapp.list_chats.__wrapped__(limit=20), args.calls))
+    print_row("list_chats [last_message_time join]", join)
+    print_row("list_chats [chat_summary]", summary)
+    print(f"{'':<52} speedup x{join['median_us'] / summary['median_us']:.1f}")
+
+@dataclass
+class LegacyMessage:
+    """Message as it was before slots and lazy timestamps, for comparison."""
+    timestamp: datetime
+    sender: str
+    content: str
+    is_from_me: bool
+    chat_jid: str
+    id: str
+    chat_name: Optional[str] = None
+    snippet: Optional[str] = None
+    cursor: Optional[str] = None
+
+def bench_rows(args: argparse.Namespace, db_path: str) -> None:
+    """Materialize 1M messages: eager dataclass rows vs. slots + lazy timestamps."""
+    total = 1_000_000
+    rows = db.fetchall(db_path, f"""
+        SELECT messages.timestamp, {whatsapp._MESSAGE_COLUMNS}
+        FROM messages JOIN chats ON messages.chat_jid = chats.jid
+        LIMIT ?
+    """, (total,))
+    # Reuse the rows if the database is smaller than a million messages
+    rows = (rows * (total // len(rows) + 1))[:total]
+    legacy_rows = [(row[0], row[2], row[4], row[5], row[6], row[7], row[3]) for row in rows]
+    slot_rows = [row[1:] for row in rows]
+    del rows
+
+    def legacy():
+        return [
+            LegacyMessage(
+                timestamp=datetime.fromisoformat(row[0]),
+                sender=row[1],
+                content=row[2],
+                is_from_me=row[3],
+                chat_jid=row[4],
+                id=row[5],
+                chat_name=row[6]
+            )
+            for row in legacy_rows
+        ]
+
+    def slotted():
+        return [whatsapp._message_row(None, row) for row in slot_rows]
+
+    print(f"\nRow materialization benchmark ({total} messages from {args.messages} rows)")
+    print("-" * 100)
+    for label, build in (("dataclass + fromisoformat per row", legacy), ("slots + lazy epoch timestamps", slotted)):
+        start = time.perf_counter()
+        build()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        messages = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del messages
+        print(f"{label:<52} {total / elapsed / 1e6:>6.2f} M rows/s   {size / 2**20:>8.1f} MiB")
+
+def bench_export(args: argparse.Namespace, db_path: str) -> None:
+    """Read every message: one list_messages call vs. streaming with iter_messages."""
+    def listed():
+        return sum(1 for _ in whatsapp.list_messages(limit=10**9, include_context=False))
+
+    def streamed():
+        return sum(1 for _ in whatsapp.iter_messages())
+
+    print(f"\nExport benchmark (all {args.messages} messages)")
+    print("-" * 100)
+    for label, read in (("list_messages (whole result in memory)", listed), ("iter_messages (fetchmany stream)", streamed)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        count = read()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{label:<52} {count / elapsed / 1e6:>6.2f} M rows/s   peak {peak / 2**20:>8.1f} MiB")
+
+def bench_concurrency(args: argparse.Namespace, db_path: str) -> None:
+    """Fast tool calls issued while slow ones run: one at a time (the old sync tools) vs. async tools."""
+    import asyncio
+    import main
+    import tool_pool
+
+    chats = [chat.jid for chat in whatsapp.list_chats(limit=50, include_last_message=False)]
+    slow_calls = 2
+    slow_limit = min(args.messages, 50_000)
+
+    def slow():
+        whatsapp.list_messages(limit=slow_limit, include_context=False)
+
+    def fast(jid: str):
+        whatsapp.get_chat(jid)
+
+    # The sync server ran each call to completion before reading the next request
+    fast_latencies = []
+    start = time.perf_counter()
+    for i in range(slow_calls):
+        slow()
+        for jid in chats[i::slow_calls]:
+            fast(jid)
+            fast_latencies.append(time.perf_counter() - start)
+    sequential_total = time.perf_counter() - start
+    sequential_fast = statistics.median(fast_latencies) * 1000
+
+    async def concurrent():
+        latencies = []
+        async def timed_fast(jid: str):
+            await main.get_chat(jid)
+            latencies.append(time.perf_counter() - start)
+        tasks = [main.list_messages(limit=slow_limit, include_context=False) for _ in range(slow_calls)]
+        tasks += [timed_fast(jid) for jid in chats]
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start, statistics.median(latencies) * 1000
+
+    async def cancelled():
+        # A call that times out must free its worker straight away
+        start = time.perf_counter()
+        try:
+            await tool_pool.run_tool("list_messages", slow, timeout=0.01)
+        except tool_pool.ToolTimeout:
+            pass
+        await tool_pool.run_tool("get_chat", fast, chats[0], timeout=10)
+        return (time.perf_counter() - start) * 1000
+
+    concurrent_total, concurrent_fast = asyncio.run(concurrent())
+    cancel_ms = asyncio.run(cancelled())
+    tool_pool.shutdown()
+
+    print(f"\nConcurrency benchmark ({slow_calls} x list_messages(limit={slow_limit}) + {len(chats)} x get_chat)")
+    print("-" * 100)
+    print(f"{'one call at a time':<52} total {sequential_total * 1000:>9.1f} ms   get_chat done after (median) {sequential_fast:>9.1f} ms")
+    print(f"{'async tools, {0} DB workers'.format(tool_pool.DB_WORKERS):<52} total {concurrent_total * 1000:>9.1f} ms   get_chat done after (median) {concurrent_fast:>9.1f} ms")
+    print(f"{'timed-out call, then get_chat':<52} {cancel_ms:>9.1f} ms")
+
+def bench_cache(args: argparse.Namespace, db_path: str) -> None:
+    """Repeat calls to the hot read functions: uncached vs. result cache hits."""
+    chat_jid = whatsapp.list_chats(limit=1)[0].jid
+    contact = chat_jid.split("@")[0]
+    name, _ = sample_name(db_path)
+    cases = {
+        "list_chats": lambda fn: fn(limit=20),
+        "search_contacts": lambda fn: fn(name),
+        "get_chat": lambda fn: fn(chat_jid),
+        "get_last_interaction": lambda fn: fn(contact),
+    }
+
+    print(f"\nResult cache benchmark ({args.calls} calls each)")
+    print("-" * 100)
+    whatsapp.RESULT_CACHE.clear()
+    for name, call in cases.items():
+        cached = getattr(whatsapp, name)
+        uncached = summarize(time_calls(lambda: call(cached.__wrapped__), args.calls))
+        hit = summarize(time_calls(lambda: call(cached), args.calls))
+        print_row(f"{name} [uncached]", uncached)
+        print_row(f"{name} [cache hit]", hit)
+        print(f"{'':<52} speedup x{uncached['median_us'] / hit['median_us']:.1f}")
+    print(f"cache stats: {whatsapp.cache_stats()}")
+
+def bench_contacts(args: argparse.Namespace, db_path: str) -> None:
+    """search_contacts: LIKE scan over chats vs. the in-memory trigram index."""
+    def like_scan(query: str):
+        pattern = f"%{query}%"
+        return db.fetchall(db_path, """
+            SELECT DISTINCT jid, name FROM chats
+            WHERE (LOWER(name) LIKE LOWER(?) OR LOWER(jid) LIKE LOWER(?)) AND jid NOT LIKE '%@g.us'
+            ORDER BY name, jid
+            LIMIT 50
+        """, (pattern, pattern))
+
+    start = time.perf_counter()
+    whatsapp.load_contact_index()
+    load_ms = (time.perf_counter() - start) * 1000
+    phone = whatsapp.list_chats(limit=1)[0].jid.split("@")[0]
+    name, typo = sample_name(db_path)
+    queries = {"name": name, "number": phone[-5:], "typo": typo}
+
+    print(f"\nContact search benchmark ({len(whatsapp.CONTACT_INDEX)} contacts, index built in {load_ms:.0f} ms)")
+    print("-" * 100)
+    for label, query in queries.items():
+        scan = summarize(time_calls(lambda: like_scan(query), args.calls))
+        index = summarize(time_calls(lambda: whatsapp.search_contacts.__wrapped__(query), args.calls))
+        print_row(f"{label} {query!r} [LIKE scan]", scan)
+        print_row(f"{label} {query!r} [trigram index]", index)
+
+def _fixtures(db_path: str) -> Dict[str, Any]:
+    """Arguments for the suite: the busiest chat and direct contact, a group, a message."""
+    busiest = db.fetchone(db_path, """
+        SELECT chat_jid FROM messages GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 1
+    """)[0]
+    contact = db.fetchone(db_path, """
+        SELECT chat_jid FROM messages WHERE chat_jid NOT LIKE '%@g.us'
+        GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 1
+    """)[0]
+    group = db.fetchone(db_path, "SELECT jid FROM chats WHERE jid LIKE '%@g.us' ORDER BY rowid LIMIT 1")
+    message_id = db.fetchone(db_path, """
+        SELECT id FROM messages WHERE chat_jid = ? ORDER BY rowid
+        LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM messages WHERE chat_jid = ?)
+    """, (busiest, busiest))[0]
+    name, _ = sample_name(db_path)
+    latest = db.fetchone(db_path, "SELECT MAX(rowid) FROM messages")[0]
+    return {
+        "feed_cursor": whatsapp._encode_cursor("feed", max(0, latest - 1000)),
+        "chat_jid": busiest,
+        "group_jid": group[0] if group else busiest,
+        "phone": contact.split("@")[0],
+        "message_id": message_id,
+        "name": name,
+        # A word of the synthetic vocabulary (matches nothing in a real database)
+        "word": max(synthetic_db.WORDS, key=len),
+    }
+
+# Functions and tools the suite leaves out, with the reason
+SUITE_SKIPPED = {
+    "check_connection": "calls the bridge's HTTP API",
+    "is_connected": "calls the bridge's HTTP API",
+    "send_message": "sends a WhatsApp message through the bridge",
+    "send_bulk_messages_from_excel": "sends WhatsApp messages through the bridge",
+}
+
+def bench_suite(args: argparse.Namespace, db_path: str) -> None:
+    """Every public function in whatsapp.py and every MCP tool in main.py, result cache cleared before each call."""
+    import asyncio
+    import main
+    import tool_pool
+
+    f = _fixtures(db_path)
+    chat, phone = f["chat_jid"], f["phone"]
+    messages = whatsapp.list_messages(chat_jid=chat, limit=20, include_context=False)
+    chats = whatsapp.list_chats(limit=20)
+    batch = [c.jid for c in whatsapp.list_chats(limit=50, include_last_message=False)]
+    devnull = open(os.devnull, "w")
+
+    def quiet(fn: Callable[[], object]) -> Callable[[], object]:
+        def call():
+            with contextlib.redirect_stdout(devnull):
+                return fn()
+        return call
+
+    # (function, label, call)
+    functions: List[Tuple[str, str, Callable[[], object]]] = [
+        ("list_messages", "list_messages(chat_jid)", lambda: whatsapp.list_messages(chat_jid=chat, include_context=False)),
+        ("list_messages", "list_messages(chat_jid, context)", lambda: whatsapp.list_messages(chat_jid=chat)),
+        ("list_messages", "list_messages(query)", lambda: whatsapp.list_messages(query=f["word"], include_context=False)),
+        ("list_messages", "list_messages(query, ranked)", lambda: whatsapp.list_messages(query=f["word"], include_context=False, rank_by_relevance=True)),
+        ("list_messages", "list_messages(chat_jid, fields, max_content_length=80)", lambda: whatsapp.list_messages(chat_jid=chat, fields=("sender", "content"), max_content_length=80)),
+        ("list_messages", "list_messages(chat_jid, max_bytes=4000)", lambda: whatsapp.list_messages(chat_jid=chat, max_bytes=4000)),
+        ("list_messages", "list_messages(sender)", lambda: whatsapp.list_messages(sender_phone_number=phone, include_context=False)),
+        ("iter_messages", "iter_messages(chat_jid) first 1000", lambda: sum(1 for _, __ in zip(range(1000), whatsapp.iter_messages(chat_jid=chat)))),
+        ("get_message_context", "get_message_context", lambda: whatsapp.get_message_context(f["message_id"], chat_jid=chat)),
+        ("list_chats", "list_chats", lambda: whatsapp.list_chats()),
+        ("list_chats", "list_chats(query)", lambda: whatsapp.list_chats(query=f["name"].split()[0])),
+        ("list_chats", "list_chats(sort_by=name)", lambda: whatsapp.list_chats(sort_by="name")),
+        ("list_chats", "list_chats(fields=name, max_bytes=2000)", lambda: whatsapp.list_chats(limit=200, fields=("name",), max_bytes=2000)),
+        ("search_contacts", "search_contacts", lambda: whatsapp.search_contacts(f["name"])),
+        ("load_contact_index", "load_contact_index (incremental)", whatsapp.load_contact_index),
+        ("get_contact_chats", "get_contact_chats", lambda: whatsapp.get_contact_chats(phone)),
+        ("get_last_interaction", "get_last_interaction", lambda: whatsapp.get_last_interaction(phone)),
+        ("get_chat", "get_chat", lambda: whatsapp.get_chat(chat)),
+        ("get_chat", "get_chat(group)", lambda: whatsapp.get_chat(f["group_jid"])),
+        ("get_chats", "get_chats(50 chats)", lambda: whatsapp.get_chats(batch)),
+        ("get_last_interactions", "get_last_interactions(50 jids)", lambda: whatsapp.get_last_interactions(batch)),
+        ("get_direct_chat_by_contact", "get_direct_chat_by_contact", lambda: whatsapp.get_direct_chat_by_contact(phone)),
+        ("get_new_messages", "get_new_messages(1000 rows back)", lambda: whatsapp.get_new_messages(f["feed_cursor"])),
+        ("wait_for_messages", "wait_for_messages(timeout=0)", lambda: whatsapp.wait_for_messages(timeout=0)),
+        ("refresh_suppression", "refresh_suppression (incremental)", whatsapp.refresh_suppression),
+        ("is_suppressed", "is_suppressed", lambda: whatsapp.is_suppressed(phone)),
+        ("cache_stats", "cache_stats", whatsapp.cache_stats),
+        ("print_recent_messages", "print_recent_messages", quiet(whatsapp.print_recent_messages)),
+        ("print_message", "print_message", quiet(lambda: whatsapp.print_message(messages[0]))),
+        ("print_messages_list", "print_messages_list", quiet(lambda: whatsapp.print_messages_list(messages))),
+        ("print_chat", "print_chat", quiet(lambda: whatsapp.print_chat(chats[0]))),
+        ("print_chats_list", "print_chats_list", quiet(lambda: whatsapp.print_chats_list(chats))),
+        ("print_paginated_messages", "print_paginated_messages", quiet(lambda: whatsapp.print_paginated_messages(messages, 1, 5, chat))),
+    ]
+    tools: Dict[str, Dict[str, Any]] = {
+        "search_contacts": {"query": f["name"]},
+        "list_messages": {"chat_jid": chat},
+        "list_chats": {},
+        "get_chat": {"chat_jid": chat},
+        "get_chats": {"chat_jids": batch},
+        "get_direct_chat_by_contact": {"sender_phone_number": phone},
+        "get_contact_chats": {"jid": phone},
+        "get_last_interaction": {"jid": phone},
+        "get_last_interactions": {"jids": batch},
+        "get_message_context": {"message_id": f["message_id"], "chat_jid": chat},
+        "get_new_messages": {"since_cursor": f["feed_cursor"]},
+        "wait_for_messages": {"timeout": 0},
+        "get_server_stats": {},
+    }
+
+    public = {
+        name for name, fn in inspect.getmembers(whatsapp, inspect.isfunction)
+        if fn.__module__ == whatsapp.__name__ and not name.startswith("_")
+    }
+    registered = {tool.name for tool in asyncio.run(main.mcp.list_tools())}
+    missing = sorted(((public - {name for name, _, _ in functions}) | (registered - set(tools))) - set(SUITE_SKIPPED))
+
+    print(f"\nSuite ({args.calls} calls each, result cache cleared before every call)")
+    print("-" * 100)
+    for _, label, fn in functions:
+        fn()
+        print_row(label, summarize(time_calls(fn, args.calls, setup=whatsapp.RESULT_CACHE.clear)))
+
+    # One event loop for all calls, so loop startup isn't measured
+    loop = asyncio.new_event_loop()
+    try:
+        for name, arguments in tools.items():
+            call = lambda: loop.run_until_complete(main.mcp.call_tool(name, arguments))
+            call()
+            print_row(f"tool {name}", summarize(time_calls(call, args.calls, setup=whatsapp.RESULT_CACHE.clear)))
+    finally:
+        loop.close()
+        tool_pool.shutdown()
+        devnull.close()
+
+    for name, reason in sorted(SUITE_SKIPPED.items()):
+        print(f"{'skipped ' + name:<52} {reason}")
+    for name in missing:
+        print(f"{'NOT BENCHMARKED ' + name:<52} add it to bench_suite")
+        RESULTS.append({"benchmark": _current_benchmark, "label": name, "missing": True})
+
+def import_times(*modules: str) -> Dict[str, Tuple[int, int, int]]:
+    """Import modules, in order, in a fresh interpreter under -X importtime.
+
+    A module's time excludes whatever an earlier one already imported.
+
+    Returns:
+        {imported module: (self microseconds, cumulative microseconds, nesting depth)}
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {module}" for module in modules)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=120, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        fields = line.partition("import time:")[2].split("|")
+        # Skips the header and anything else the import printed
+        if len(fields) == 3 and fields[0].strip().isdigit():
+            name = fields[2].strip()
+            depth = (len(fields[2]) - len(fields[2].lstrip()) - 1) // 2
+            # A module can be listed twice (e.g. a failed optional import retried later);
+            # keep the last listing, in its place in the order
+            times.pop(name, None)
+            times[name] = (int(fields[0]), int(fields[1]), depth)
+    return times
+
+def eagerly_imported(module: str, lazy: Tuple[str, ...]) -> List[str]:
+    """The modules of `lazy` in sys.modules after importing module in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(*(name for name in {lazy!r} if name in sys.modules))"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=120, check=True
+    )
+    return result.stdout.split()
+
+def bench_startup(args: argparse.Namespace, db_path: str) -> None:
+    """Cold start of the MCP server: `import main` in fresh interpreters."""
+    runs = [import_times(STARTUP_BASELINE, "main") for _ in range(args.startup_runs)]
+    print(f"\nStartup ({args.startup_runs} fresh interpreters, budget {STARTUP_BUDGET_MS:.0f} ms for main after {STARTUP_BASELINE})")
+    print("-" * 100)
+    print_row(f"import {STARTUP_BASELINE} (baseline)", summarize([run[STARTUP_BASELINE][1] for run in runs]))
+    stats = summarize([run["main"][1] for run in runs])
+    print_row(f"import main after {STARTUP_BASELINE}", stats)
+
+    # Modules main.py imports itself, most expensive first. A module is
+    # listed after everything it imported, so they are the depth 1 entries
+    # between the previous top-level import and main
+    direct: Dict[str, int] = {}
+    for name, (_, cumulative, depth) in runs[0].items():
+        if depth == 0:
+            if name == "main":
+                break
+            direct = {}
+        elif depth == 1:
+            direct[name] = cumulative
+    for name in sorted(direct, key=direct.get, reverse=True)[:8]:
+        print(f"{'  ' + name:<52} {direct[name] / 1000:>9.1f} ms (first run)")
+
+    eager = eagerly_imported("main", LAZY_MODULES)
+    if eager:
+        FAILURES.append(f"startup: {', '.join(eager)} imported by main at startup")
+    if stats["median_us"] / 1000 > STARTUP_BUDGET_MS:
+        FAILURES.append(
+            f"startup: import main took {stats['median_us'] / 1000:.0f} ms after {STARTUP_BASELINE}, "
+            f"budget {STARTUP_BUDGET_MS:.0f} ms"
+        )
+
+BENCHMARKS = {
+    "connection": bench_connection,
+    "context": bench_context,
+    "search": bench_search,
+    "pagination": bench_pagination,
+    "inbox": bench_inbox,
+    "rows": bench_rows,
+    "export": bench_export,
+    "concurrency": bench_concurrency,
+    "cache": bench_cache,
+    "contacts": bench_contacts,
+    "suite": bench_suite,
+    "startup": bench_startup,
+}
+# Benchmarks that don't use the synthetic database
+NO_DATABASE = {"startup"}
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_metadata(args: argparse.Namespace, db_path: str) -> Dict[str, Any]:
+    """What a result file needs to be compared with another one."""
+    return {
+        "started_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "calls": args.calls,
+        "size": args.size,
+        "seed": args.seed,
+        "database": {
+            "path": db_path if args.db else None,
+            "bytes": os.path.getsize(db_path),
+            "messages": db.fetchone(db_path, "SELECT COUNT(*) FROM messages")[0],
+            "chats": db.fetchone(db_path, "SELECT COUNT(*) FROM chats")[0],
+        } if os.path.exists(db_path) else None,
+    }
+
+def compare(baseline_path: str) -> None:
+    """Print each row's median next to the same row in an earlier result file."""
+    with open(baseline_path) as f:
+        baseline = {(row["benchmark"], row["label"]): row for row in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (median, new / old)")
+    print("-" * 100)
+    for row in RESULTS:
+        old = baseline.get((row["benchmark"], row["label"]))
+        if "median_us" not in row or not old or "median_us" not in old:
+            continue
+        ratio = row["median_us"] / old["median_us"] if old["median_us"] else float("inf")
+        print(f"{row['benchmark'] + ': ' + row['label']:<60} {old['median_us']:>10.1f} -> {row['median_us']:>10.1f} us   x{ratio:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the WhatsApp query layer")
+    parser.add_argument("benchmark", nargs="?", choices=sorted(BENCHMARKS) + ["all"], default="all")
+    parser.add_argument("--db", help="Use this messages.db (generated there first if it doesn't exist) instead of a temporary one")
+    parser.add_argument("--size", choices=sorted(synthetic_db.SIZES), help="Synthetic database preset (overrides --messages and --chats)")
+    parser.add_argument("--messages", type=int, default=100_000, help="Synthetic messages to generate (default: 100000)")
+    parser.add_argument("--chats", type=int, default=500, help="Synthetic chats to generate (default: 500)")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic database seed (default: 0)")
+    parser.add_argument("--calls", type=int, default=200, help="Calls per measurement (default: 200)")
+    parser.add_argument("--startup-runs", type=int, default=10, help="Fresh interpreters for the startup benchmark (default: 10)")
+    parser.add_argument("--json", metavar="PATH", help="Write the results and run metadata to PATH as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare the results with an earlier --json file")
+    args = parser.parse_args()
+    if args.size:
+        args.messages, args.chats = synthetic_db.SIZES[args.size]
+
+    global _current_benchmark
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, "messages.db")
+        selected = BENCHMARKS if args.benchmark == "all" else {args.benchmark: BENCHMARKS[args.benchmark]}
+        if set(selected) - NO_DATABASE:
+            if not os.path.exists(db_path):
+                print(f"Generating {args.messages} messages in {args.chats} chats...")
+                synthetic_db.generate(db_path, messages=args.messages, chats=args.chats, seed=args.seed)
+            use_database(db_path)
+
+        for name, bench in selected.items():
+            _current_benchmark = name
+            bench(args, db_path)
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"meta": run_metadata(args, db_path), "results": RESULTS}, f, indent=2)
+            print(f"\nWrote {len(RESULTS)} results to {args.json}")
+        if args.baseline:
+            compare(args.baseline)
+        db.close_connections()
+
+    for failure in FAILURES:
+        print(f"FAILED {failure}")
+    return 1 if FAILURES else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Cached connection state of the WhatsApp bridge.
+
+Every connection check used to be a fresh `GET /api/qrcode` with no
+timeout, so a stalled bridge hung its caller forever and a loop of checks
+paid for a new TCP connection each time. `ConnectionState` asks the
+bridge through one pooled `requests.Session` with short connect/read
+timeouts. It keeps the answer for TTL_SECONDS, and concurrent callers
+share a single request.
+
+The bridge also reports changes itself: it writes `whatsapp_connected.txt`
+when it connects and `latest_qr.txt` whenever a QR code or reconnect
+error comes up. A change to either file (seen with a cheap stat) drops the
+cached state right away, so a repeated check costs nothing while nothing
+changes and still notices a login or logout without waiting for the TTL.
+
+`session()` is the same pooled session, for the bridge's other endpoints.
+`requests` is only imported once the bridge is first asked something, so
+importing this module (and whatsapp.py) stays cheap.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional, Tuple
+
+if TYPE_CHECKING:
+    import requests
+
+WHATSAPP_API_BASE_URL = "http://localhost:9090/api"
+WHATSAPP_BRIDGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'whatsapp-bridge')
+CONNECTED_FILE = os.path.join(WHATSAPP_BRIDGE_PATH, 'whatsapp_connected.txt')
+QR_FILE = os.path.join(WHATSAPP_BRIDGE_PATH, 'latest_qr.txt')
+
+# How long a status is reused without asking the bridge again
+TTL_SECONDS = 2.0
+# (connect, read) seconds for a status request: the bridge is local, so a
+# slow answer means it is stuck
+STATUS_TIMEOUT = (1, 3)
+# Keep-alive connections to the bridge
+POOL_CONNECTIONS = 4
+
+_MESSAGES = {
+    "connected": "Connected to WhatsApp",
+    "qrcode": "QR code available for scanning",
+    "needs_qr": "Waiting for QR code generation",
+}
+
+@dataclass(frozen=True)
+class ConnectionStatus:
+    connected: bool
+    # "connected", "qrcode" or "needs_qr" as reported by the bridge, or
+    # "http_error" / "unreachable" / "error" when it couldn't be asked
+    status: str
+    message: str
+    checked_at: float
+
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
+
+def session() -> "requests.Session":
+    """The shared keep-alive session for requests to the bridge."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_CONNECTIONS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+class ConnectionState:
+    """The bridge's connection status, refreshed at most every `ttl` seconds."""
+
+    def __init__(self, base_url: str = WHATSAPP_API_BASE_URL, ttl: float = TTL_SECONDS,
+                 timeout: Tuple[float, float] = STATUS_TIMEOUT,
+                 signal_files: Tuple[str, ...] = (CONNECTED_FILE, QR_FILE)):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.signal_files = signal_files
+        self._lock = threading.Lock()
+        self._status: Optional[ConnectionStatus] = None
+        self._signature = None
+        self.requests = 0
+
+    def _signals(self):
+        return tuple(_file_signature(path) for path in self.signal_files)
+
+    def get(self, max_age: Optional[float] = None) -> ConnectionStatus:
+        """The current status, from the cache while it is fresh.
+
+        Args:
+            max_age: Accept a cached status at most this old (default: the TTL;
+                     0 always asks the bridge)
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            signature = self._signals()
+            status = self._status
+            if status and signature == self._signature and time.monotonic() - status.checked_at < max_age:
+                return status
+            # Holding the lock: concurrent callers wait for this request instead of sending their own
+            self._status = self._fetch()
+            self._signature = signature
+            return self._status
+
+    def changed(self) -> bool:
+        """Whether the bridge's status files changed since the last request (no request made)."""
+        with self._lock:
+            return self._signals() != self._signature
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._status = None
+
+    def _fetch(self) -> ConnectionStatus:
+        import requests
+
+        self.requests += 1
+        now = time.monotonic()
+        try:
+            response = session().get(f"{self.base_url}/qrcode", timeout=self.timeout)
+            if response.status_code != 200:
+                return ConnectionStatus(False, "http_error", f"Error: HTTP {response.status_code}", now)
+            data = response.json()
+            status = data.get("status")
+            message = _MESSAGES.get(status) or f"Status: {status} - {data.get('message', '')}"
+            return ConnectionStatus(status == "connected", status or "error", message, now)
+        except requests.RequestException as e:
+            return ConnectionStatus(False, "unreachable", f"Request error: {str(e)}", now)
+        except ValueError as e:
+            return ConnectionStatus(False, "error", f"Unexpected error: {str(e)}", now)
+
+STATE = ConnectionState()
+
+def check_connection(max_age: Optional[float] = None) -> Tuple[bool, str]:
+    """Check if WhatsApp is connected and return status.
+
+    Returns:
+        tuple: (connected status boolean, status message string)
+    """
+    status = STATE.get(max_age)
+    return status.connected, status.message
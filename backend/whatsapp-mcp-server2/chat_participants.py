@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Materialized (participant, chat) index: who has written in which chat.
+
+Finding every chat a contact takes part in used to mean walking all of the
+contact's messages and de-duplicating their chats. `chat_participants`
+keeps one row per (sender, chat) pair instead, with the first and last
+time the sender wrote there, so get_contact_chats and get_last_interaction
+read one row per chat the contact is in. Like chat_summary.py, it is kept
+current by core-SQL triggers on `messages`, including the BEFORE INSERT
+step that takes a row replaced by the bridge's INSERT OR REPLACE back out.
+
+`participant_jid` holds the user part of `messages.sender` (e.g. a phone
+number), without server or device. The bridge records the bare user part
+for live messages but the full JID for messages from a history sync, so
+both land on the same row, and lookups take a JID's user part too
+(phones.jid_user).
+
+`fill` computes the rows of existing messages a range of chats at a time,
+committing each range, as chat_summary.fill does.
+
+Usage: python chat_participants.py rebuild [db_path]
+"""
+
+import sqlite3
+import sys
+from typing import Optional
+
+import db
+import phones
+
+PARTICIPANTS_TABLE = "chat_participants"
+# Messages per fill transaction (a range holds whole chats, so it can be more)
+POPULATE_BATCH_ROWS = 50_000
+
+# Messages whose sender has the user part {0}: the bare user, "user@server"
+# or "user:device@server", as ranges the sender index can serve
+_SENT_BY = "(sender = {0} OR (sender >= {0} || ':' AND sender < {0} || ';') OR (sender >= {0} || '@' AND sender < {0} || 'A'))"
+
+def drop_triggers(conn: sqlite3.Connection) -> None:
+    """Drop the triggers, so create_table installs the current ones."""
+    conn.execute(f"DROP TRIGGER IF EXISTS {PARTICIPANTS_TABLE}_replace")
+    conn.execute(f"DROP TRIGGER IF EXISTS {PARTICIPANTS_TABLE}_insert")
+
+def create_table(conn: sqlite3.Connection) -> None:
+    """Create the participants table, its index and triggers if they don't exist.
+
+    Runs inside the caller's transaction (see schema.py); does not commit.
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PARTICIPANTS_TABLE} (
+            participant_jid TEXT NOT NULL,
+            chat_jid TEXT NOT NULL,
+            first_seen INTEGER,
+            last_seen INTEGER,
+            last_rowid INTEGER,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (participant_jid, chat_jid)
+        ) WITHOUT ROWID
+    """)
+    # A contact's most recent message across all their chats
+    conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_{PARTICIPANTS_TABLE}_last_seen
+        ON {PARTICIPANTS_TABLE}(participant_jid, last_seen, last_rowid)
+    """)
+
+    old = "(SELECT {column} FROM messages WHERE id = NEW.id AND chat_jid = NEW.chat_jid)"
+    old_rowid = old.format(column="rowid")
+    old_sender = phones.JID_USER_EXPRESSION.format(old.format(column="sender"))
+    # The pair's remaining messages, newest or oldest first
+    remaining = f"""(
+        SELECT {{column}} FROM messages
+        WHERE {_SENT_BY.format(old_sender)} AND chat_jid = NEW.chat_jid AND rowid <> {old_rowid}
+        ORDER BY ts_epoch {{direction}}, rowid {{direction}}
+        LIMIT 1
+    )"""
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {PARTICIPANTS_TABLE}_replace BEFORE INSERT ON messages
+        WHEN EXISTS (SELECT 1 FROM messages WHERE id = NEW.id AND chat_jid = NEW.chat_jid AND sender IS NOT NULL)
+        BEGIN
+            UPDATE {PARTICIPANTS_TABLE} SET message_count = message_count - 1
+            WHERE participant_jid = {old_sender} AND chat_jid = NEW.chat_jid;
+            DELETE FROM {PARTICIPANTS_TABLE}
+            WHERE participant_jid = {old_sender} AND chat_jid = NEW.chat_jid AND message_count <= 0;
+            -- Replacing the pair's last or first message: fall back to its neighbour
+            -- (the insert trigger then considers NEW)
+            UPDATE {PARTICIPANTS_TABLE} SET
+                last_seen = {remaining.format(column="ts_epoch", direction="DESC")},
+                last_rowid = {remaining.format(column="rowid", direction="DESC")}
+            WHERE participant_jid = {old_sender} AND chat_jid = NEW.chat_jid AND last_rowid = {old_rowid};
+            UPDATE {PARTICIPANTS_TABLE} SET
+                first_seen = {remaining.format(column="ts_epoch", direction="ASC")}
+            WHERE participant_jid = {old_sender} AND chat_jid = NEW.chat_jid
+            AND first_seen = {db.EPOCH_EXPRESSION.format(old.format(column="timestamp"))};
+        END
+    """)
+    epoch = db.EPOCH_EXPRESSION.format("NEW.timestamp")
+    new_sender = phones.JID_USER_EXPRESSION.format("NEW.sender")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {PARTICIPANTS_TABLE}_insert AFTER INSERT ON messages
+        WHEN NEW.sender IS NOT NULL
+        BEGIN
+            -- Not INSERT OR IGNORE: the bridge's OR REPLACE would override it
+            INSERT INTO {PARTICIPANTS_TABLE} (participant_jid, chat_jid)
+            SELECT {new_sender}, NEW.chat_jid WHERE NOT EXISTS (
+                SELECT 1 FROM {PARTICIPANTS_TABLE} WHERE participant_jid = {new_sender} AND chat_jid = NEW.chat_jid
+            );
+            UPDATE {PARTICIPANTS_TABLE} SET
+                message_count = message_count + 1,
+                first_seen = MIN(COALESCE(first_seen, {epoch}), {epoch})
+            WHERE participant_jid = {new_sender} AND chat_jid = NEW.chat_jid;
+            UPDATE {PARTICIPANTS_TABLE} SET last_seen = {epoch}, last_rowid = NEW.rowid
+            WHERE participant_jid = {new_sender} AND chat_jid = NEW.chat_jid
+            AND (last_rowid IS NULL OR ({epoch}, NEW.rowid) > (last_seen, last_rowid));
+        END
+    """)
+
+def populate(conn: sqlite3.Connection, after: str = "", upto: Optional[str] = None) -> None:
+    """Recompute the rows of the chats in (after, upto] from `messages`.
+
+    Two passes over those chats' messages. By default every chat. Runs
+    inside the caller's transaction; does not commit.
+    """
+    epoch = db.EPOCH_EXPRESSION.format("timestamp")
+    participant = phones.JID_USER_EXPRESSION.format("sender")
+    in_range, bounds = db.chat_range_condition("chat_jid", after, upto)
+    conn.execute(f"DELETE FROM {PARTICIPANTS_TABLE} WHERE {in_range}", bounds)
+    # With a single MAX(), SQLite takes the bare columns from the row holding the maximum
+    conn.execute(f"""
+        INSERT INTO {PARTICIPANTS_TABLE} (participant_jid, chat_jid, last_seen, last_rowid, message_count)
+        SELECT participant, chat_jid, last_seen, row_id, message_count
+        FROM (
+            SELECT {participant} AS participant, chat_jid, {epoch} AS last_seen, rowid AS row_id,
+                COUNT(*) AS message_count, MAX(printf('%020d:%020d', {epoch}, rowid))
+            FROM messages
+            WHERE sender IS NOT NULL AND {in_range}
+            GROUP BY participant, chat_jid
+        )
+    """, bounds)
+    # A second MIN() in the query above would make its bare columns arbitrary
+    conn.execute(f"""
+        UPDATE {PARTICIPANTS_TABLE} SET first_seen = firsts.first_seen
+        FROM (
+            SELECT {participant} AS participant, chat_jid, MIN({epoch}) AS first_seen
+            FROM messages
+            WHERE sender IS NOT NULL AND {in_range}
+            GROUP BY participant, chat_jid
+        ) AS firsts
+        WHERE firsts.participant = {PARTICIPANTS_TABLE}.participant_jid AND firsts.chat_jid = {PARTICIPANTS_TABLE}.chat_jid
+    """, bounds)
+
+def fill(db_path: str) -> None:
+    """Recompute every row, committing about POPULATE_BATCH_ROWS messages at a time."""
+    conn = db.get_write_connection(db_path)
+    for after, upto in db.chat_ranges(db_path, POPULATE_BATCH_ROWS):
+        with db.write_transaction(conn):
+            populate(conn, after, upto)
+
+def rebuild(db_path: str) -> int:
+    """Recompute the table from scratch, e.g. after editing messages by hand.
+
+    Returns:
+        Number of (participant, chat) pairs
+    """
+    conn = db.get_write_connection(db_path)
+    with db.write_transaction(conn):
+        create_table(conn)
+    fill(db_path)
+    return db.fetchone(db_path, f"SELECT COUNT(*) FROM {PARTICIPANTS_TABLE}")[0]
+
+if __name__ == "__main__":
+    from whatsapp import MESSAGES_DB_PATH
+
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Usage: python chat_participants.py rebuild [db_path]")
+        sys.exit(1)
+
+    path = sys.argv[2] if len(sys.argv) > 2 else MESSAGES_DB_PATH
+    print(f"Indexed {rebuild(path)} participant/chat pairs")
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Materialized per-chat summary: last message, message count and unread count.
+
+Chat listings used to find each chat's last message by joining `messages`
+on `chats.last_message_time = messages.timestamp`, which needs a lookup
+per chat and returns duplicate chats when two messages share a timestamp.
+`chat_summary` keeps one row per chat instead, updated by triggers on
+`messages` as the bridge writes. The triggers use only core SQL so the
+bridge's SQLite build can run them.
+
+The bridge writes with INSERT OR REPLACE. A replace deletes the old row
+without firing delete triggers, so a BEFORE INSERT trigger takes the
+replaced message back out of the counts first.
+
+`unread_count` is the number of incoming messages after my latest outgoing
+message in the chat, or all incoming messages if I never replied.
+
+`fill` computes the rows of existing messages a range of chats at a time,
+each range in its own transaction, so the bridge is never locked out for
+long. The triggers are live meanwhile: chats already filled are kept
+current by them, and any row a trigger writes for a chat not yet filled is
+recomputed when its range comes up.
+
+Usage: python chat_summary.py rebuild [db_path]
+"""
+
+import sqlite3
+import sys
+from typing import Optional
+
+import db
+
+SUMMARY_TABLE = "chat_summary"
+# Characters of the last message kept as its preview
+PREVIEW_CHARS = 200
+# Messages per fill transaction (a range holds whole chats, so it can be more)
+POPULATE_BATCH_ROWS = 50_000
+
+# Orders rows by (epoch, rowid) as text, for picking a row with MAX()
+_POSITION = "printf('%020d:%020d', {epoch}, {rowid})"
+
+def create_table(conn: sqlite3.Connection) -> None:
+    """Create the summary table and its triggers if they don't exist.
+
+    Runs inside the caller's transaction (see schema.py); does not commit.
+    """
+    epoch = db.EPOCH_EXPRESSION.format("NEW.timestamp")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+            chat_jid TEXT PRIMARY KEY,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            last_rowid INTEGER,
+            last_message_id TEXT,
+            last_epoch INTEGER,
+            last_preview TEXT,
+            last_sender TEXT,
+            last_is_from_me BOOLEAN,
+            last_reply_epoch INTEGER,
+            last_reply_rowid INTEGER,
+            unread_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Runs while the row about to be replaced still exists
+    old_rowid = "(SELECT rowid FROM messages WHERE id = NEW.id AND chat_jid = NEW.chat_jid)"
+    latest_reply = f"""(
+        SELECT {{column}} FROM messages
+        WHERE chat_jid = NEW.chat_jid AND is_from_me AND rowid <> {old_rowid} AND ts_epoch IS NOT NULL
+        ORDER BY ts_epoch DESC, rowid DESC
+        LIMIT 1
+    )"""
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {SUMMARY_TABLE}_replace BEFORE INSERT ON messages
+        WHEN EXISTS (SELECT 1 FROM messages WHERE id = NEW.id AND chat_jid = NEW.chat_jid)
+        BEGIN
+            UPDATE {SUMMARY_TABLE} SET
+                message_count = message_count - 1,
+                unread_count = unread_count - (
+                    SELECT COUNT(*) FROM messages old
+                    WHERE old.rowid = {old_rowid} AND NOT old.is_from_me
+                    AND (old.ts_epoch, old.rowid) > (COALESCE(last_reply_epoch, -1), COALESCE(last_reply_rowid, -1))
+                )
+            WHERE chat_jid = NEW.chat_jid;
+            -- Replacing the last message: fall back to the one before it
+            -- (the insert trigger then considers NEW)
+            UPDATE {SUMMARY_TABLE} SET
+                (last_rowid, last_message_id, last_epoch, last_preview, last_sender, last_is_from_me) = (
+                    SELECT rowid, id, ts_epoch, substr(content, 1, {PREVIEW_CHARS}), sender, is_from_me
+                    FROM messages
+                    WHERE chat_jid = NEW.chat_jid AND rowid <> {old_rowid} AND ts_epoch IS NOT NULL
+                    ORDER BY ts_epoch DESC, rowid DESC
+                    LIMIT 1
+                )
+            WHERE chat_jid = NEW.chat_jid AND last_rowid = {old_rowid};
+            -- Replacing my last reply: count unread from the reply before it
+            UPDATE {SUMMARY_TABLE} SET
+                unread_count = (
+                    SELECT COUNT(*) FROM messages m
+                    WHERE m.chat_jid = NEW.chat_jid AND NOT m.is_from_me AND m.rowid <> {old_rowid}
+                    AND (m.ts_epoch, m.rowid) > (
+                        COALESCE({latest_reply.format(column="ts_epoch")}, -1),
+                        COALESCE({latest_reply.format(column="rowid")}, -1)
+                    )
+                ),
+                last_reply_epoch = {latest_reply.format(column="ts_epoch")},
+                last_reply_rowid = {latest_reply.format(column="rowid")}
+            WHERE chat_jid = NEW.chat_jid AND last_reply_rowid = {old_rowid};
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {SUMMARY_TABLE}_insert AFTER INSERT ON messages
+        BEGIN
+            -- Not INSERT OR IGNORE: the bridge's OR REPLACE would override it
+            INSERT INTO {SUMMARY_TABLE} (chat_jid)
+            SELECT NEW.chat_jid WHERE NOT EXISTS (SELECT 1 FROM {SUMMARY_TABLE} WHERE chat_jid = NEW.chat_jid);
+            UPDATE {SUMMARY_TABLE} SET message_count = message_count + 1
+            WHERE chat_jid = NEW.chat_jid;
+            -- Newer than the current last message (history sync can arrive out of order)
+            UPDATE {SUMMARY_TABLE} SET
+                last_rowid = NEW.rowid,
+                last_message_id = NEW.id,
+                last_epoch = {epoch},
+                last_preview = substr(NEW.content, 1, {PREVIEW_CHARS}),
+                last_sender = NEW.sender,
+                last_is_from_me = NEW.is_from_me
+            WHERE chat_jid = NEW.chat_jid
+            AND (last_rowid IS NULL OR ({epoch}, NEW.rowid) > (last_epoch, last_rowid));
+            -- Incoming after my last reply
+            UPDATE {SUMMARY_TABLE} SET unread_count = unread_count + 1
+            WHERE chat_jid = NEW.chat_jid AND NOT NEW.is_from_me
+            AND ({epoch}, NEW.rowid) > (COALESCE(last_reply_epoch, -1), COALESCE(last_reply_rowid, -1));
+            -- A newer reply of mine: only what came in after it is unread
+            UPDATE {SUMMARY_TABLE} SET
+                last_reply_epoch = {epoch},
+                last_reply_rowid = NEW.rowid,
+                unread_count = (
+                    SELECT COUNT(*) FROM messages m
+                    WHERE m.chat_jid = NEW.chat_jid AND m.ts_epoch >= {epoch}
+                    AND (m.ts_epoch, m.rowid) > ({epoch}, NEW.rowid) AND NOT m.is_from_me
+                )
+            WHERE chat_jid = NEW.chat_jid AND NEW.is_from_me
+            AND ({epoch}, NEW.rowid) > (COALESCE(last_reply_epoch, -1), COALESCE(last_reply_rowid, -1));
+        END
+    """)
+
+def populate(conn: sqlite3.Connection, after: str = "", upto: Optional[str] = None) -> None:
+    """Recompute the summary rows of the chats in (after, upto] from `messages`.
+
+    Three passes over those chats' messages. By default every chat. Runs
+    inside the caller's transaction; does not commit.
+    """
+    epoch = db.EPOCH_EXPRESSION.format("timestamp")
+    position = _POSITION.format(epoch=epoch, rowid="rowid")
+    in_range, bounds = db.chat_range_condition("chat_jid", after, upto)
+    m_in_range, _ = db.chat_range_condition("m.chat_jid", after, upto)
+    conn.execute(f"DELETE FROM {SUMMARY_TABLE} WHERE {in_range}", bounds)
+    # With a single MAX(), SQLite takes the bare columns from the row holding the maximum
+    conn.execute(f"""
+        INSERT INTO {SUMMARY_TABLE} (
+            chat_jid, message_count, last_rowid, last_message_id, last_epoch,
+            last_preview, last_sender, last_is_from_me
+        )
+        SELECT chat_jid, message_count, row_id, id, epoch, substr(content, 1, {PREVIEW_CHARS}), sender, is_from_me
+        FROM (
+            SELECT chat_jid, COUNT(*) AS message_count, rowid AS row_id, id, {epoch} AS epoch,
+                content, sender, is_from_me, MAX({position})
+            FROM messages
+            WHERE {in_range}
+            GROUP BY chat_jid
+        )
+    """, bounds)
+    conn.execute(f"""
+        UPDATE {SUMMARY_TABLE} SET last_reply_epoch = replies.epoch, last_reply_rowid = replies.row_id
+        FROM (
+            SELECT chat_jid, {epoch} AS epoch, rowid AS row_id, MAX({position})
+            FROM messages
+            WHERE is_from_me AND {in_range}
+            GROUP BY chat_jid
+        ) AS replies
+        WHERE replies.chat_jid = {SUMMARY_TABLE}.chat_jid
+    """, bounds)
+    conn.execute(f"""
+        UPDATE {SUMMARY_TABLE} SET unread_count = counts.unread
+        FROM (
+            SELECT m.chat_jid, COUNT(*) AS unread
+            FROM messages m
+            JOIN {SUMMARY_TABLE} s ON s.chat_jid = m.chat_jid
+            WHERE NOT m.is_from_me AND {m_in_range}
+            AND ({db.EPOCH_EXPRESSION.format('m.timestamp')}, m.rowid)
+                > (COALESCE(s.last_reply_epoch, -1), COALESCE(s.last_reply_rowid, -1))
+            GROUP BY m.chat_jid
+        ) AS counts
+        WHERE counts.chat_jid = {SUMMARY_TABLE}.chat_jid
+    """, bounds)
+
+def fill(db_path: str) -> None:
+    """Recompute every summary row, committing about POPULATE_BATCH_ROWS messages at a time."""
+    conn = db.get_write_connection(db_path)
+    for after, upto in db.chat_ranges(db_path, POPULATE_BATCH_ROWS):
+        with db.write_transaction(conn):
+            populate(conn, after, upto)
+
+def rebuild(db_path: str) -> int:
+    """Recompute the summary from scratch, e.g. after editing messages by hand.
+
+    Returns:
+        Number of chats summarized
+    """
+    conn = db.get_write_connection(db_path)
+    with db.write_transaction(conn):
+        create_table(conn)
+    fill(db_path)
+    return db.fetchone(db_path, f"SELECT COUNT(*) FROM {SUMMARY_TABLE}")[0]
+
+if __name__ == "__main__":
+    from whatsapp import MESSAGES_DB_PATH
+
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Usage: python chat_summary.py rebuild [db_path]")
+        sys.exit(1)
+
+    path = sys.argv[2] if len(sys.argv) > 2 else MESSAGES_DB_PATH
+    print(f"Summarized {rebuild(path)} chats")
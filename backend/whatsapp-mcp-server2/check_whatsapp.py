@@ -4,7 +4,7 @@ Simple utility to check WhatsApp connection status.
 """
 
 import sys
-from whatsapp import check_connection
+from bridge_status import check_connection
 
 def main():
     """
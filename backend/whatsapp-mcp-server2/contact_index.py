@@ -0,0 +1,239 @@
+"""In-memory trigram index for contact search.
+
+search_contacts used to run `LOWER(name) LIKE '%q%' OR LOWER(jid) LIKE
+'%q%'` over every chat on each call, returning up to 50 unranked rows and
+nothing at all for a misspelled name. `ContactIndex` keeps the personal
+chats in memory instead, indexed by trigrams of their names (lowercased,
+accents removed, each word padded as in PostgreSQL's pg_trgm) and of their
+number digits, plus sorted lists for prefix matches. Matches are ranked:
+
+1. the number (for numeric queries), name or a word of it starts with the query
+2. the query appears anywhere in the name or number
+3. if nothing matches that way, names sharing at least MIN_SIMILARITY of the query's
+   trigrams, so "rahl" still finds "Rahul"
+
+Prefix matches come from a binary search and stop at the result limit, and
+fuzzy matching counts shared trigrams in C, which keeps
+typical lookups under a millisecond for tens of thousands of contacts.
+
+The bridge writes chats with INSERT OR REPLACE, which always gives the row
+a new rowid, so `refresh` picks up new and renamed chats by reading the
+rows past the highest rowid seen. It never deletes chats; a full reload
+every RELOAD_SECONDS covers hand edits.
+"""
+
+import bisect
+import heapq
+import math
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import db
+
+# Share of the query's name trigrams a fuzzy match must have
+MIN_SIMILARITY = 0.5
+# Full reload interval, for changes that don't add rows
+RELOAD_SECONDS = 600.0
+
+def _fold(text: str) -> str:
+    """Lowercase, strip accents and collapse whitespace."""
+    if text.isascii():
+        return " ".join(text.lower().split())
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return " ".join("".join(ch for ch in decomposed if not unicodedata.combining(ch)).split())
+
+def _substrings(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _word_trigrams(text: str) -> Set[str]:
+    """Trigrams of each word padded with two leading spaces and one trailing."""
+    grams = set()
+    for word in text.split():
+        grams |= _substrings(f"  {word} ")
+    return grams
+
+def _name_trigrams(folded: str) -> Set[str]:
+    """The word trigrams of a name plus those spanning its spaces, so
+    substrings across words are found too."""
+    grams = _substrings(f"  {folded} ")
+    # The only word trigrams the padded whole name lacks: later words' "  x"
+    grams.update("  " + word[0] for word in folded.split()[1:])
+    return grams
+
+def _word_suffixes(folded: str) -> List[str]:
+    """The name from each word after the first onwards ("b c" and "c" for "a b c")."""
+    words = folded.split(" ")
+    return [" ".join(words[i:]) for i in range(1, len(words))]
+
+def _starting_with(entries: List[Tuple[str, str]], prefix: str) -> Iterator[str]:
+    """jids of the sorted (key, jid) entries whose key starts with prefix, in order."""
+    i = bisect.bisect_left(entries, (prefix,))
+    while i < len(entries) and entries[i][0].startswith(prefix):
+        yield entries[i][1]
+        i += 1
+
+def _insert(entries: List[Tuple[str, str]], entry: Tuple[str, str]) -> None:
+    bisect.insort(entries, entry)
+
+def _delete(entries: List[Tuple[str, str]], entry: Tuple[str, str]) -> None:
+    i = bisect.bisect_left(entries, entry)
+    if i < len(entries) and entries[i] == entry:
+        del entries[i]
+
+class ContactIndex:
+    """Trigram and prefix index over the names and numbers of personal chats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db_path: Optional[str] = None
+        self._loaded_at = 0.0
+        self._clear()
+
+    def _clear(self) -> None:
+        self._watermark = 0
+        # jid -> (folded name, number digits, original name)
+        self._contacts: Dict[str, Tuple[str, str, Optional[str]]] = {}
+        self._grams: Dict[str, Tuple[Set[str], Set[str]]] = {}
+        self._name_postings: Dict[str, Set[str]] = defaultdict(set)
+        self._number_postings: Dict[str, Set[str]] = defaultdict(set)
+        # Sorted (key, jid) lists for prefix matches
+        self._names: List[Tuple[str, str]] = []
+        self._word_starts: List[Tuple[str, str]] = []
+        self._numbers: List[Tuple[str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._contacts)
+
+    def _remove(self, jid: str) -> None:
+        contact = self._contacts.pop(jid, None)
+        if not contact:
+            return
+        folded, digits, _ = contact
+        _delete(self._names, (folded, jid))
+        for suffix in _word_suffixes(folded):
+            _delete(self._word_starts, (suffix, jid))
+        _delete(self._numbers, (digits, jid))
+        name_grams, number_grams = self._grams.pop(jid)
+        for postings, keys in ((self._name_postings, name_grams), (self._number_postings, number_grams)):
+            for gram in keys:
+                entries = postings.get(gram)
+                if entries is not None:
+                    entries.discard(jid)
+                    if not entries:
+                        del postings[gram]
+
+    def _add(self, jid: str, name: Optional[str], bulk: bool = False) -> None:
+        """Index a contact; with bulk, the sorted lists are appended to and sorted by the caller."""
+        self._remove(jid)
+        folded = _fold(name or "")
+        digits = jid.split("@")[0]
+        name_grams = _name_trigrams(folded)
+        number_grams = _substrings(digits)
+        self._contacts[jid] = (folded, digits, name)
+        self._grams[jid] = (name_grams, number_grams)
+        for gram in name_grams:
+            self._name_postings[gram].add(jid)
+        for gram in number_grams:
+            self._number_postings[gram].add(jid)
+        add = list.append if bulk else _insert
+        add(self._names, (folded, jid))
+        for suffix in _word_suffixes(folded):
+            add(self._word_starts, (suffix, jid))
+        add(self._numbers, (digits, jid))
+
+    def refresh(self, db_path: str) -> int:
+        """Bring the index up to date with `chats`.
+
+        Returns:
+            Number of contacts (re)indexed
+        """
+        with self._lock:
+            reload = db_path != self._db_path or time.monotonic() - self._loaded_at > RELOAD_SECONDS
+            latest = db.fetchone(db_path, "SELECT MAX(rowid) FROM chats")[0] or 0
+            if not reload and latest == self._watermark:
+                return 0
+            if reload:
+                self._clear()
+                self._db_path = db_path
+                self._loaded_at = time.monotonic()
+            rows = db.fetchall(db_path, """
+                SELECT rowid, jid, name FROM chats
+                WHERE rowid > ? AND jid NOT LIKE '%@g.us'
+                ORDER BY rowid
+            """, (self._watermark,))
+            for _, jid, name in rows:
+                self._add(jid, name, bulk=reload)
+            if reload:
+                # jid is the key of chats, so a full load adds each contact once
+                for entries in (self._names, self._word_starts, self._numbers):
+                    entries.sort()
+            self._watermark = max(latest, self._watermark)
+            return len(rows)
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[str, Optional[str]]]:
+        """Best matches for query, as (jid, name) pairs, most relevant first.
+
+        Tiers, each alphabetical: number prefix and number substring (for
+        numeric queries), name prefix, word prefix, substring anywhere in
+        the name. Later tiers are only searched while fewer than `limit`
+        matches have been found. Only if none of these match, names are
+        matched fuzzily by shared trigrams.
+        """
+        folded = _fold(query)
+        if not folded:
+            return []
+        found: Dict[str, None] = {}
+
+        def take(jids: Iterable[str]) -> bool:
+            """Add jids in order until limit is reached; returns whether it was."""
+            for jid in jids:
+                found.setdefault(jid)
+                if len(found) >= limit:
+                    return True
+            return False
+
+        with self._lock:
+            digits = "".join(ch for ch in folded if ch.isdigit())
+            if len(digits) >= 3 and not any(ch.isalpha() for ch in folded):
+                if take(_starting_with(self._numbers, digits)):
+                    return self._result(found)
+                inner = _substrings(digits)
+                matches = set.intersection(*(self._number_postings.get(gram, set()) for gram in inner))
+                if take(heapq.nsmallest(limit, (jid for jid in matches if digits in self._contacts[jid][1]),
+                                        key=lambda jid: self._contacts[jid][1])):
+                    return self._result(found)
+
+            if take(_starting_with(self._names, folded)) or take(_starting_with(self._word_starts, folded)):
+                return self._result(found)
+            if len(folded) < 3:
+                return self._result(found)
+
+            inner = _substrings(folded)
+            matches = set.intersection(*(self._name_postings.get(gram, set()) for gram in inner))
+            if take(heapq.nsmallest(limit, (jid for jid in matches if jid not in found and folded in self._contacts[jid][0]),
+                                    key=lambda jid: (self._contacts[jid][0], jid))):
+                return self._result(found)
+
+            if found:
+                return self._result(found)
+            # Nothing contains the query (a typo?): fall back to names sharing
+            # `needed` of its trigrams. Any such name is in one of the
+            # len - needed + 1 rarest posting lists; the shared trigrams of
+            # those candidates are then counted with C-level set operations.
+            query_grams = _word_trigrams(folded)
+            needed = max(1, math.ceil(len(query_grams) * MIN_SIMILARITY))
+            postings = [self._name_postings.get(gram, set()) for gram in query_grams]
+            postings.sort(key=len)
+            candidates = set().union(*postings[:len(postings) - needed + 1])
+            shared = Counter()
+            for entries in postings:
+                shared.update(entries & candidates)
+            scored = [(-count, self._contacts[jid][0], jid) for jid, count in shared.items() if count >= needed]
+            take(jid for _, _, jid in heapq.nsmallest(limit, scored))
+            return self._result(found)
+
+    def _result(self, found: Dict[str, None]) -> List[Tuple[str, Optional[str]]]:
+        return [(jid, self._contacts[jid][2]) for jid in found]
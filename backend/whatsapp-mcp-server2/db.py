@@ -0,0 +1,333 @@
+"""Pooled read-only SQLite connections for the WhatsApp message store.
+
+The Go bridge owns messages.db and is its only writer. The MCP server only
+reads it, so instead of opening (and re-parsing the schema of) a fresh
+connection for every tool call, each thread keeps one warm read-only
+connection per database path. Connections are opened through a `mode=ro`
+URI and tuned with a busy timeout, a larger page cache, memory-mapped I/O
+and a prepared-statement cache.
+
+All reads go through `fetchall` / `fetchone`, which close their cursor
+before returning so no statement is left holding a shared lock that would
+block the bridge's writes (`iterate` streams instead, and closes its
+cursor when the generator finishes or is closed). A separate pooled read-write connection exists
+only for maintaining the server's own derived data. Hooks registered with
+`add_query_hook` see every read's row count and wall time (query_log.py).
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Connection tuning
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16 * 1024
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 128
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+_registry: List[sqlite3.Connection] = []
+
+# SQL for the bridge's text timestamps ("2006-01-02 15:04:05-07:00") as Unix
+# seconds; format with the column or expression to convert
+EPOCH_EXPRESSION = "CAST(strftime('%s', {}) AS INTEGER)"
+
+# Called with (db_path, sql, params) before every read query
+_statement_hooks: List[Callable[[str, str, Sequence[Any]], None]] = []
+# Called with (conn, db_path, sql, params, rows, seconds, error) after every
+# read query, on the thread that ran it (see query_log.py)
+QueryHook = Callable[[sqlite3.Connection, str, str, Sequence[Any], int, float, Optional[BaseException]], None]
+_query_hooks: List[QueryHook] = []
+
+
+def _readonly_uri(db_path: str) -> str:
+    """Build a `mode=ro` URI for the database path."""
+    return Path(db_path).resolve().as_uri() + "?mode=ro"
+
+
+def _open(db_path: str, readonly: bool = True) -> sqlite3.Connection:
+    """Open and tune a new connection (read-only unless asked otherwise)."""
+    uri = _readonly_uri(db_path) if readonly else Path(db_path).resolve().as_uri() + "?mode=rw"
+    conn = sqlite3.connect(
+        uri,
+        uri=True,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def thread_connections() -> Dict[Tuple[str, bool], sqlite3.Connection]:
+    """The calling thread's pool, keyed on (db_path, readonly).
+
+    The same dict object stays in use for the life of the thread, so
+    another thread can hold on to it to interrupt this thread's queries
+    (see tool_pool.py).
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    return connections
+
+
+def _pooled(db_path: str, readonly: bool) -> sqlite3.Connection:
+    """Return (opening if needed) the calling thread's pooled connection."""
+    key = (db_path, readonly)
+    connections = thread_connections()
+
+    conn = connections.get(key)
+    if conn is None or not _is_open(conn):
+        conn = _open(db_path, readonly)
+        connections[key] = conn
+        with _registry_lock:
+            _registry.append(conn)
+    return conn
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """Return the calling thread's warm read-only connection to db_path.
+
+    The connection is opened on first use and reused by every later call
+    from the same thread. Raises sqlite3.Error if the database cannot be
+    opened (e.g. the bridge has not created it yet).
+    """
+    return _pooled(db_path, readonly=True)
+
+
+def get_write_connection(db_path: str) -> sqlite3.Connection:
+    """Return the calling thread's pooled read-write connection to db_path.
+
+    Only for maintaining the server's own derived structures, such as the
+    full-text index in fts.py; queries always use `get_connection`.
+    Callers are responsible for committing.
+    """
+    return _pooled(db_path, readonly=False)
+
+
+@contextmanager
+def write_transaction(conn: sqlite3.Connection) -> Iterator[None]:
+    """A BEGIN IMMEDIATE transaction, committed on success and rolled back on error.
+
+    Taking the write lock up front serializes writers, so state read inside
+    the block can't be changed by another thread or process before the commit.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _is_open(conn: sqlite3.Connection) -> bool:
+    """Whether conn is still usable (close_connections may have closed it)."""
+    try:
+        conn.total_changes
+        return True
+    except sqlite3.ProgrammingError:
+        return False
+
+
+def close_connections() -> None:
+    """Close every pooled connection, in all threads.
+
+    Each thread transparently reopens its connection on its next call to
+    `get_connection`. Meant for shutdown, tests and benchmarks.
+    """
+    with _registry_lock:
+        connections = list(_registry)
+        _registry.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+@contextmanager
+def capture_statements() -> Iterator[List[Tuple[str, str, Sequence[Any]]]]:
+    """Record every (db_path, sql, params) read while the block runs.
+
+    Used to EXPLAIN the exact statements the query functions issue.
+    """
+    captured: List[Tuple[str, str, Sequence[Any]]] = []
+    hook = lambda db_path, sql, params: captured.append((db_path, sql, params))
+    _statement_hooks.append(hook)
+    try:
+        yield captured
+    finally:
+        _statement_hooks.remove(hook)
+
+
+def _notify(db_path: str, sql: str, params: Sequence[Any]) -> None:
+    for hook in _statement_hooks:
+        hook(db_path, sql, params)
+
+
+def add_query_hook(hook: QueryHook) -> None:
+    """Call hook after every read query with its row count and wall time."""
+    _query_hooks.append(hook)
+
+
+def remove_query_hook(hook: QueryHook) -> None:
+    if hook in _query_hooks:
+        _query_hooks.remove(hook)
+
+
+def _observe(conn: sqlite3.Connection, db_path: str, sql: str, params: Sequence[Any],
+             rows: int, start: float, error: Optional[BaseException] = None) -> None:
+    """Report a finished query to the hooks; a failing hook never fails the query."""
+    elapsed = time.perf_counter() - start
+    for hook in list(_query_hooks):
+        try:
+            hook(conn, db_path, sql, params, rows, elapsed, error)
+        except Exception:
+            pass
+
+
+def data_version(db_path: str) -> int:
+    """`PRAGMA data_version` of the calling thread's connection.
+
+    Changes whenever another connection commits to the database. Values
+    from different connections can't be compared.
+    """
+    conn = get_connection(db_path)
+    with closing(conn.execute("PRAGMA data_version")) as cursor:
+        return cursor.fetchone()[0]
+
+
+def error_count() -> int:
+    """Number of failed queries on the calling thread so far.
+
+    Lets callers tell a real empty result from an error that a query
+    function reported and swallowed.
+    """
+    return getattr(_local, "errors", 0)
+
+
+def _count_error() -> None:
+    _local.errors = error_count() + 1
+
+
+RowFactory = Callable[[sqlite3.Cursor, Tuple], Any]
+
+
+def fetchall(db_path: str, sql: str, params: Sequence[Any] = (), row_factory: Optional[RowFactory] = None) -> List[Any]:
+    """Run a read query on the pooled connection and return all rows.
+
+    With a row_factory, rows are built by it (as in sqlite3) instead of
+    being returned as tuples.
+    """
+    if _statement_hooks:
+        _notify(db_path, sql, params)
+    try:
+        conn = get_connection(db_path)
+        if _query_hooks:
+            return _observed(conn, db_path, sql, params, row_factory, many=True)
+        with closing(conn.execute(sql, params)) as cursor:
+            cursor.row_factory = row_factory
+            return cursor.fetchall()
+    except sqlite3.Error:
+        _count_error()
+        raise
+
+
+def _observed(conn: sqlite3.Connection, db_path: str, sql: str, params: Sequence[Any],
+              row_factory: Optional[RowFactory], many: bool) -> Any:
+    """fetchall / fetchone with the query hooks told how it went."""
+    start = time.perf_counter()
+    try:
+        with closing(conn.execute(sql, params)) as cursor:
+            cursor.row_factory = row_factory
+            result = cursor.fetchall() if many else cursor.fetchone()
+    except sqlite3.Error as e:
+        _observe(conn, db_path, sql, params, 0, start, e)
+        raise
+    _observe(conn, db_path, sql, params, len(result) if many else int(result is not None), start)
+    return result
+
+
+def iterate(db_path: str, sql: str, params: Sequence[Any] = (), batch_size: int = 1000) -> Iterator[Tuple]:
+    """Run a read query and yield its rows, fetched `batch_size` at a time.
+
+    The statement holds a read lock until the rows are exhausted or the
+    generator is closed, so keep the result set bounded (see
+    whatsapp.iter_messages).
+    """
+    if _statement_hooks:
+        _notify(db_path, sql, params)
+    conn = get_connection(db_path)
+    start = time.perf_counter()
+    count = 0
+    error = None
+    try:
+        with closing(conn.execute(sql, params)) as cursor:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                count += len(rows)
+                yield from rows
+    except sqlite3.Error as e:
+        error = e
+        raise
+    finally:
+        # Wall time includes the time the consumer spent between batches
+        if _query_hooks:
+            _observe(conn, db_path, sql, params, count, start, error)
+
+
+def fetchone(db_path: str, sql: str, params: Sequence[Any] = (), row_factory: Optional[RowFactory] = None) -> Optional[Any]:
+    """Run a read query on the pooled connection and return the first row."""
+    if _statement_hooks:
+        _notify(db_path, sql, params)
+    try:
+        conn = get_connection(db_path)
+        if _query_hooks:
+            return _observed(conn, db_path, sql, params, row_factory, many=False)
+        with closing(conn.execute(sql, params)) as cursor:
+            cursor.row_factory = row_factory
+            return cursor.fetchone()
+    except sqlite3.Error:
+        _count_error()
+        raise
+
+
+def chat_ranges(db_path: str, batch_rows: int) -> Iterator[Tuple[str, Optional[str]]]:
+    """Split the messages into chat_jid ranges (after, upto] of about batch_rows messages.
+
+    For rebuilding per-chat tables a range at a time, each range in its own
+    transaction. A chat is never split, so a range holds more messages when
+    one chat alone has more. The last range has no upper bound (upto None),
+    so chats that appear meanwhile are still covered.
+    """
+    after = ""
+    while True:
+        row = fetchone(
+            db_path, "SELECT chat_jid FROM messages WHERE chat_jid > ? ORDER BY chat_jid LIMIT 1 OFFSET ?",
+            (after, batch_rows - 1)
+        )
+        upto = row[0] if row else None
+        yield after, upto
+        if upto is None:
+            return
+        after = upto
+
+
+def chat_range_condition(column: str, after: str, upto: Optional[str]) -> Tuple[str, Tuple[str, ...]]:
+    """SQL condition (and its parameters) for column in a range from chat_ranges."""
+    if upto is None:
+        return f"{column} > ?", (after,)
+    return f"{column} > ? AND {column} <= ?", (after, upto)
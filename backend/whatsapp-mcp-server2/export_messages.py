@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Export WhatsApp messages to JSON Lines or CSV.
+
+Messages are streamed with whatsapp.iter_messages and written one at a
+time, so memory use stays flat no matter how large the chat or date range.
+Output is ordered oldest first.
+
+Usage: python export_messages.py [--chat JID] [--since DATE] [--until DATE]
+                                 [--sender PHONE] [--query TEXT]
+                                 [--format jsonl|csv] [--output PATH] [--db PATH]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Iterable, TextIO
+
+import whatsapp
+from whatsapp import Message
+
+FIELDS = ("id", "chat_jid", "chat_name", "sender", "timestamp", "is_from_me", "content")
+FORMATS = ("jsonl", "csv")
+
+def _record(message: Message) -> dict:
+    return {
+        "id": message.id,
+        "chat_jid": message.chat_jid,
+        "chat_name": message.chat_name,
+        "sender": message.sender,
+        "timestamp": message.timestamp.isoformat(),
+        "is_from_me": bool(message.is_from_me),
+        "content": message.content,
+    }
+
+def write_jsonl(messages: Iterable[Message], out: TextIO) -> int:
+    """Write one JSON object per line. Returns the number of messages written."""
+    count = 0
+    for message in messages:
+        out.write(json.dumps(_record(message), ensure_ascii=False))
+        out.write("\n")
+        count += 1
+    return count
+
+def write_csv(messages: Iterable[Message], out: TextIO) -> int:
+    """Write a header row and one row per message. Returns the number of messages written."""
+    writer = csv.DictWriter(out, fieldnames=FIELDS)
+    writer.writeheader()
+    count = 0
+    for message in messages:
+        writer.writerow(_record(message))
+        count += 1
+    return count
+
+def _parse_date(value: str, end_of_day: bool = False) -> datetime:
+    """Parse an ISO date or datetime; a bare date covers the whole day."""
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Export WhatsApp messages to JSON Lines or CSV")
+    parser.add_argument("--chat", help="Only messages in this chat JID")
+    parser.add_argument("--since", help="Only messages on or after this ISO date/datetime (local time if no offset)")
+    parser.add_argument("--until", help="Only messages on or before this ISO date/datetime (local time if no offset)")
+    parser.add_argument("--sender", help="Only messages from this sender")
+    parser.add_argument("--query", help="Only messages matching this search text")
+    parser.add_argument("--search-mode", choices=("prefix", "words", "phrase", "raw"), default="prefix",
+                        help="How --query is matched (default: prefix)")
+    parser.add_argument("--format", choices=FORMATS, help="Output format (default: from the output extension, else jsonl)")
+    parser.add_argument("--output", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--db", help="Path to messages.db (default: the bridge's store)")
+    args = parser.parse_args()
+
+    if args.db:
+        whatsapp.MESSAGES_DB_PATH = args.db
+
+    output_format = args.format
+    if not output_format:
+        output_format = "csv" if args.output.lower().endswith(".csv") else "jsonl"
+
+    date_range = None
+    if args.since or args.until:
+        date_range = (
+            _parse_date(args.since) if args.since else datetime.fromtimestamp(0),
+            _parse_date(args.until, end_of_day=True) if args.until else datetime.now(),
+        )
+
+    messages = whatsapp.iter_messages(
+        date_range=date_range,
+        sender_phone_number=args.sender,
+        chat_jid=args.chat,
+        query=args.query,
+        search_mode=args.search_mode,
+    )
+    write = write_csv if output_format == "csv" else write_jsonl
+
+    if args.output == "-":
+        try:
+            count = write(messages, sys.stdout)
+        except BrokenPipeError:
+            # Reader went away (e.g. piped into head); don't fail again flushing stdout at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return
+    else:
+        with open(args.output, "w", encoding="utf-8", newline="") as out:
+            count = write(messages, out)
+    print(f"Exported {count} messages", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
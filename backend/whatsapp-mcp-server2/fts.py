@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Full-text search index for message content.
+
+`messages_fts` is an FTS5 table over `messages.content` (external content,
+keyed on the messages rowid). It is kept in sync by an incremental catch-up
+indexer rather than triggers: the Go bridge's go-sqlite3 build does not
+include FTS5, so a trigger touching the index would make every bridge
+insert fail. Before each search, rows past the indexed watermark are added
+in small batches; when nothing is new this costs two index lookups.
+
+Usage: python fts.py [sync|rebuild] [db_path]
+"""
+
+import sqlite3
+import sys
+from typing import Optional
+
+import db
+
+FTS_TABLE = "messages_fts"
+STATE_TABLE = "messages_fts_state"
+SYNC_BATCH_ROWS = 50_000
+
+SEARCH_MODES = ("prefix", "words", "phrase", "raw")
+
+def create_index(conn: sqlite3.Connection) -> None:
+    """Create the FTS5 table and its watermark table if they don't exist.
+
+    Runs inside the caller's transaction (see schema.py); does not commit.
+    """
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            content,
+            content='messages',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            indexed_rowid INTEGER NOT NULL
+        )
+    """)
+    conn.execute(f"INSERT OR IGNORE INTO {STATE_TABLE} (id, indexed_rowid) VALUES (0, 0)")
+
+def ensure_index(db_path: str) -> None:
+    """Create the index tables in their own transaction."""
+    conn = db.get_write_connection(db_path)
+    with conn:
+        create_index(conn)
+
+def _watermark(db_path: str) -> Optional[int]:
+    """Highest messages rowid already indexed, or None if there is no index yet."""
+    try:
+        row = db.fetchone(db_path, f"SELECT indexed_rowid FROM {STATE_TABLE} WHERE id = 0")
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def sync(db_path: str) -> int:
+    """Index every message added since the last sync.
+
+    Creates the index on first use. Work is committed in batches so the
+    bridge is never locked out for long while a large backlog is indexed.
+
+    Returns:
+        Number of messages indexed
+    """
+    watermark = _watermark(db_path)
+    latest = db.fetchone(db_path, "SELECT MAX(rowid) FROM messages")[0] or 0
+    if watermark is not None and watermark >= latest:
+        return 0
+    if watermark is None:
+        ensure_index(db_path)
+        watermark = 0
+
+    conn = db.get_write_connection(db_path)
+    indexed = 0
+    while watermark < latest:
+        with db.write_transaction(conn):
+            # Re-read under the write lock: another worker may have indexed these rows
+            # meanwhile, and FTS5 would accept the same rowids twice
+            watermark = conn.execute(f"SELECT indexed_rowid FROM {STATE_TABLE} WHERE id = 0").fetchone()[0]
+            if watermark >= latest:
+                break
+            upper = min(watermark + SYNC_BATCH_ROWS, latest)
+            cursor = conn.execute(f"""
+                INSERT INTO {FTS_TABLE} (rowid, content)
+                SELECT rowid, content FROM messages
+                WHERE rowid > ? AND rowid <= ? AND content IS NOT NULL
+            """, (watermark, upper))
+            indexed += cursor.rowcount
+            conn.execute(f"UPDATE {STATE_TABLE} SET indexed_rowid = ? WHERE id = 0", (upper,))
+        watermark = upper
+    return indexed
+
+def rebuild(db_path: str) -> int:
+    """Rebuild the index from scratch.
+
+    Drops entries left behind by messages the bridge replaced (INSERT OR
+    REPLACE gives the new row a new rowid) and re-indexes everything.
+
+    Returns:
+        Number of messages indexed
+    """
+    ensure_index(db_path)
+    conn = db.get_write_connection(db_path)
+    with db.write_transaction(conn):
+        latest = conn.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+        conn.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+        conn.execute(f"UPDATE {STATE_TABLE} SET indexed_rowid = ? WHERE id = 0", (latest,))
+    return db.fetchone(db_path, "SELECT COUNT(*) FROM messages WHERE content IS NOT NULL")[0]
+
+def check_match_query(db_path: str, expression: str) -> None:
+    """Raise ValueError if an FTS5 MATCH expression doesn't parse.
+
+    Raw queries come from the user, and FTS5 only reports a syntax error
+    (or an unknown column filter) when the query runs.
+    """
+    try:
+        db.fetchone(db_path, f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? LIMIT 1", (expression,))
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Invalid search query {expression!r}: {e}") from None
+
+def _quote(term: str) -> str:
+    """Quote a term as an FTS5 string so operators in user input are literal."""
+    return '"' + term.replace('"', '""') + '"'
+
+def build_match_query(text: str, mode: str = "prefix") -> str:
+    """Translate a user search string into an FTS5 MATCH expression.
+
+    Args:
+        text: The search text
+        mode: "prefix" (every word, matching word starts), "words" (every
+              word, exact), "phrase" (the words in order) or "raw" (FTS5
+              query syntax, passed through unchanged)
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}, expected one of {', '.join(SEARCH_MODES)}")
+    if mode == "raw":
+        return text
+
+    terms = text.split()
+    if mode == "phrase":
+        return _quote(" ".join(terms))
+    if mode == "prefix":
+        return " ".join(_quote(term) + "*" for term in terms)
+    return " ".join(_quote(term) for term in terms)
+
+if __name__ == "__main__":
+    from whatsapp import MESSAGES_DB_PATH
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("sync", "rebuild"):
+        print("Usage: python fts.py [sync|rebuild] [db_path]")
+        sys.exit(1)
+
+    path = sys.argv[2] if len(sys.argv) > 2 else MESSAGES_DB_PATH
+    if sys.argv[1] == "sync":
+        print(f"Indexed {sync(path)} new messages")
+    else:
+        print(f"Rebuilt index over {rebuild(path)} messages")
@@ -1,34 +1,65 @@
-from typing import List, Dict, Any, Optional, Tuple
+import os
+import threading
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from mcp.server.fastmcp import FastMCP
 from datetime import datetime
-import pandas as pd
 from whatsapp import (
+    cache_stats,
+    load_contact_index,
     search_contacts as whatsapp_search_contacts,
     list_messages as whatsapp_list_messages,
     list_chats as whatsapp_list_chats,
     get_chat as whatsapp_get_chat,
+    get_chats as whatsapp_get_chats,
     get_direct_chat_by_contact as whatsapp_get_direct_chat_by_contact,
     get_contact_chats as whatsapp_get_contact_chats,
     get_last_interaction as whatsapp_get_last_interaction,
+    get_last_interactions as whatsapp_get_last_interactions,
     get_message_context as whatsapp_get_message_context,
-    send_message as whatsapp_send_message
+    get_new_messages as whatsapp_get_new_messages,
+    wait_for_messages as whatsapp_wait_for_messages,
+    MAX_WAIT_SECONDS,
+    refresh_suppression,
+    send_message as whatsapp_send_message,
+    OPTED_OUT_MESSAGE,
+    SUPPRESSION
 )
+from metrics import MetricsRegistry
+from suppression import filter_recipients
+from tool_pool import HTTP_POOL, WAIT_POOL, ToolTimeout, run_tool
+
+# Seconds each tool may take, including time queued for a worker
+QUERY_TIMEOUT = 30
+SEND_TIMEOUT = 60
+
+# Calls, errors, latency and response size of every tool
+METRICS = MetricsRegistry()
+
+class InstrumentedFastMCP(FastMCP):
+    """FastMCP that records every tool call in METRICS."""
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Sequence[Any]:
+        with METRICS.track(name) as call:
+            content = await super().call_tool(name, arguments)
+            # The response as the client receives it: the tool's result converted to content
+            call.response_bytes = sum(len(getattr(item, "text", "").encode()) for item in content)
+            return content
 
 # Initialize FastMCP server
-mcp = FastMCP("whatsapp-bulkmsg")
+mcp = InstrumentedFastMCP("whatsapp-bulkmsg")
 
 @mcp.tool()
-def search_contacts(query: str) -> List[Dict[str, Any]]:
+async def search_contacts(query: str) -> List[Dict[str, Any]]:
     """Search WhatsApp contacts by name or phone number.
     
     Args:
         query: Search term to match against contact names or phone numbers
     """
-    contacts = whatsapp_search_contacts(query)
+    contacts = await run_tool("search_contacts", whatsapp_search_contacts, query, timeout=QUERY_TIMEOUT)
     return contacts
 
 @mcp.tool()
-def list_messages(
+async def list_messages(
     date_range: Optional[Tuple[datetime, datetime]] = None,
     sender_phone_number: Optional[str] = None,
     chat_jid: Optional[str] = None,
@@ -37,12 +68,19 @@ def list_messages(
     page: int = 0,
     include_context: bool = True,
     context_before: int = 1,
-    context_after: int = 1
+    context_after: int = 1,
+    search_mode: str = "prefix",
+    rank_by_relevance: bool = False,
+    include_snippets: bool = False,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    max_content_length: Optional[int] = None,
+    max_bytes: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """Get WhatsApp messages matching specified criteria with optional context.
     
     Args:
-        date_range: Optional tuple of (start_date, end_date) to filter messages by date
+        date_range: Optional tuple of (start_date, end_date) to filter messages by date, inclusive; dates without a timezone are taken as local time
         sender_phone_number: Optional phone number to filter messages by sender
         chat_jid: Optional chat JID to filter messages by chat
         query: Optional search term to filter messages by content
@@ -51,8 +89,24 @@ def list_messages(
         include_context: Whether to include messages before and after matches (default True)
         context_before: Number of messages to include before each match (default 1)
         context_after: Number of messages to include after each match (default 1)
+        search_mode: How query is matched: "prefix" (all words, matching word starts), "words" (all words, exact),
+                     "phrase" (words in order) or "raw" (FTS5 query syntax, e.g. 'kathak OR dance') (default "prefix").
+                     If the search index is unavailable, query is matched as a plain substring in every mode
+        rank_by_relevance: Order query matches by relevance (BM25) instead of recency (default False)
+        include_snippets: Include a highlighted snippet of the matching text for query matches (default False)
+        cursor: To get the next page, pass the last non-null `cursor` from the previous result (only matched
+                messages carry one). Faster than page for deep pages; page is ignored when a cursor is given
+        fields: Only return these fields of each message (any of timestamp, sender, content, is_from_me,
+                chat_jid, id, chat_name, snippet); cursor is always included (default: all fields)
+        max_content_length: Cut message content to this many characters, ending in "…" (default: no limit)
+        max_bytes: Stop adding messages once the response reaches about this many bytes (roughly 4 per token),
+                   possibly returning fewer than limit; continue with the last non-null cursor. Not available
+                   with rank_by_relevance
     """
-    messages = whatsapp_list_messages(
+    messages = await run_tool(
+        "list_messages",
+        whatsapp_list_messages,
+        timeout=QUERY_TIMEOUT,
         date_range=date_range,
         sender_phone_number=sender_phone_number,
         chat_jid=chat_jid,
@@ -61,17 +115,28 @@ def list_messages(
         page=page,
         include_context=include_context,
         context_before=context_before,
-        context_after=context_after
+        context_after=context_after,
+        search_mode=search_mode,
+        rank_by_relevance=rank_by_relevance,
+        include_snippets=include_snippets,
+        cursor=cursor,
+        fields=tuple(fields) if fields else None,
+        max_content_length=max_content_length,
+        max_bytes=max_bytes
     )
-    return messages
+    return [message.to_dict(fields) for message in messages]
 
 @mcp.tool()
-def list_chats(
+async def list_chats(
     query: Optional[str] = None,
     limit: int = 20,
     page: int = 0,
     include_last_message: bool = True,
-    sort_by: str = "last_active"
+    sort_by: str = "last_active",
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    max_content_length: Optional[int] = None,
+    max_bytes: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """Get WhatsApp chats matching specified criteria.
     
@@ -81,64 +146,111 @@ def list_chats(
         page: Page number for pagination (default 0)
         include_last_message: Whether to include the last message in each chat (default True)
         sort_by: Field to sort results by, either "last_active" or "name" (default "last_active")
+        cursor: To get the next page, pass the `cursor` of the last chat from the previous result
+                (page is ignored when a cursor is given)
+        fields: Only return these fields of each chat (any of jid, name, last_message_time, last_message,
+                last_sender, last_is_from_me, last_message_id, message_count, unread_count); cursor is
+                always included (default: all fields)
+        max_content_length: Cut each last message to this many characters, ending in "…" (default: no limit)
+        max_bytes: Stop adding chats once the response reaches about this many bytes (roughly 4 per token),
+                   possibly returning fewer than limit; continue with the cursor of the last chat
     """
-    chats = whatsapp_list_chats(
+    chats = await run_tool(
+        "list_chats",
+        whatsapp_list_chats,
+        timeout=QUERY_TIMEOUT,
         query=query,
         limit=limit,
         page=page,
         include_last_message=include_last_message,
-        sort_by=sort_by
+        sort_by=sort_by,
+        cursor=cursor,
+        fields=tuple(fields) if fields else None,
+        max_content_length=max_content_length,
+        max_bytes=max_bytes
     )
-    return chats
+    return [chat.to_dict(fields) for chat in chats]
 
 @mcp.tool()
-def get_chat(chat_jid: str, include_last_message: bool = True) -> Dict[str, Any]:
+async def get_chat(chat_jid: str, include_last_message: bool = True) -> Dict[str, Any]:
     """Get WhatsApp chat metadata by JID.
     
     Args:
         chat_jid: The JID of the chat to retrieve
         include_last_message: Whether to include the last message (default True)
     """
-    chat = whatsapp_get_chat(chat_jid, include_last_message)
+    chat = await run_tool("get_chat", whatsapp_get_chat, chat_jid, include_last_message, timeout=QUERY_TIMEOUT)
     return chat
 
 @mcp.tool()
-def get_direct_chat_by_contact(sender_phone_number: str) -> Dict[str, Any]:
+async def get_chats(chat_jids: List[str], include_last_message: bool = True) -> Dict[str, Any]:
+    """Get metadata of many WhatsApp chats at once (instead of one get_chat call per chat).
+
+    Args:
+        chat_jids: The JIDs of the chats to retrieve
+        include_last_message: Whether to include each chat's last message (default True)
+
+    Returns:
+        A dictionary keyed by chat JID; unknown chats map to null
+    """
+    return await run_tool("get_chats", whatsapp_get_chats, chat_jids, include_last_message, timeout=QUERY_TIMEOUT)
+
+@mcp.tool()
+async def get_direct_chat_by_contact(sender_phone_number: str) -> Dict[str, Any]:
     """Get WhatsApp chat metadata by sender phone number.
     
     Args:
         sender_phone_number: The phone number to search for
     """
-    chat = whatsapp_get_direct_chat_by_contact(sender_phone_number)
+    chat = await run_tool(
+        "get_direct_chat_by_contact", whatsapp_get_direct_chat_by_contact, sender_phone_number, timeout=QUERY_TIMEOUT
+    )
     return chat
 
 @mcp.tool()
-def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Dict[str, Any]]:
+async def get_contact_chats(jid: str, limit: int = 20, page: int = 0, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
     """Get all WhatsApp chats involving the contact.
     
     Args:
         jid: The contact's JID to search for
         limit: Maximum number of chats to return (default 20)
         page: Page number for pagination (default 0)
+        cursor: To get the next page, pass the `cursor` of the last chat from the previous result
+                (page is ignored when a cursor is given)
     """
-    chats = whatsapp_get_contact_chats(jid, limit, page)
+    chats = await run_tool("get_contact_chats", whatsapp_get_contact_chats, jid, limit, page, cursor, timeout=QUERY_TIMEOUT)
     return chats
 
 @mcp.tool()
-def get_last_interaction(jid: str) -> Dict[str, Any]:
+async def get_last_interaction(jid: str) -> Dict[str, Any]:
     """Get most recent WhatsApp message involving the contact.
     
     Args:
         jid: The JID of the contact to search for
     """
-    message = whatsapp_get_last_interaction(jid)
-    return message
+    message = await run_tool("get_last_interaction", whatsapp_get_last_interaction, jid, timeout=QUERY_TIMEOUT)
+    return message.to_dict() if message else None
+
+@mcp.tool()
+async def get_last_interactions(jids: List[str]) -> Dict[str, Any]:
+    """Get the most recent WhatsApp message of many contacts at once (instead of one
+    get_last_interaction call per contact).
+
+    Args:
+        jids: The JIDs of the contacts
+
+    Returns:
+        A dictionary keyed by JID; contacts without messages map to null
+    """
+    messages = await run_tool("get_last_interactions", whatsapp_get_last_interactions, jids, timeout=QUERY_TIMEOUT)
+    return {jid: message.to_dict() if message else None for jid, message in messages.items()}
 
 @mcp.tool()
-def get_message_context(
+async def get_message_context(
     message_id: str,
     before: int = 5,
-    after: int = 5
+    after: int = 5,
+    chat_jid: Optional[str] = None
 ) -> Dict[str, Any]:
     """Get context around a specific WhatsApp message.
     
@@ -146,12 +258,64 @@ def get_message_context(
         message_id: The ID of the message to get context for
         before: Number of messages to include before the target message (default 5)
         after: Number of messages to include after the target message (default 5)
+        chat_jid: Optional JID of the chat the message is in; message IDs are only unique per chat
+    """
+    context = await run_tool(
+        "get_message_context", whatsapp_get_message_context, message_id, before, after, chat_jid, timeout=QUERY_TIMEOUT
+    )
+    return context.to_dict()
+
+@mcp.tool()
+async def get_new_messages(
+    since_cursor: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    limit: int = 100
+) -> Dict[str, Any]:
+    """Get WhatsApp messages that arrived since the previous call, oldest first.
+
+    Call it once without a cursor to start following new messages; it returns no
+    messages, only a cursor. Then pass the returned cursor each time to get just
+    what arrived since. Cheap to call repeatedly.
+
+    Args:
+        since_cursor: The `cursor` returned by the previous call (omit to start from now)
+        chat_jid: Optional JID of a chat to follow instead of all chats
+        limit: Maximum number of messages to return (default 100); if `has_more` is true,
+               call again right away with the new cursor
+    """
+    feed = await run_tool(
+        "get_new_messages", whatsapp_get_new_messages, since_cursor, chat_jid, limit, timeout=QUERY_TIMEOUT
+    )
+    return feed.to_dict()
+
+@mcp.tool()
+async def wait_for_messages(
+    chat_jid: Optional[str] = None,
+    timeout: float = 30,
+    since_cursor: Optional[str] = None,
+    limit: int = 100
+) -> Dict[str, Any]:
+    """Wait until new WhatsApp messages arrive, then return them (long poll).
+
+    Use this instead of calling get_new_messages in a loop. Returns as soon as a
+    message arrives, or with no messages once `timeout` passes.
+
+    Args:
+        chat_jid: Optional JID of a chat to wait for instead of any chat
+        timeout: Seconds to wait at most (default 30, at most 300)
+        since_cursor: The `cursor` from the previous get_new_messages or wait_for_messages
+                      call, so messages arriving between calls aren't missed (omit to wait from now)
+        limit: Maximum number of messages to return (default 100)
     """
-    context = whatsapp_get_message_context(message_id, before, after)
-    return context
+    timeout = min(max(timeout, 0), MAX_WAIT_SECONDS)
+    feed = await run_tool(
+        "wait_for_messages", whatsapp_wait_for_messages, chat_jid, timeout, since_cursor, limit,
+        timeout=timeout + QUERY_TIMEOUT, pool=WAIT_POOL, cancel_arg="cancel"
+    )
+    return feed.to_dict()
 
 @mcp.tool()
-def send_message(
+async def send_message(
     recipient: str,
     message: str
 ) -> Dict[str, Any]:
@@ -163,7 +327,9 @@ def send_message(
         message: The message text to send
     
     Returns:
-        A dictionary containing success status and a status message
+        A dictionary containing success status and a status message. Recipients
+        who opted out (replied STOP) are not messaged; the result then has
+        "skipped": "opted_out".
     """
     # Validate input
     if not recipient:
@@ -173,14 +339,30 @@ def send_message(
         }
     
     # Call the whatsapp_send_message function with the unified recipient parameter
-    success, status_message = whatsapp_send_message(recipient, message)
+    try:
+        success, status_message = await run_tool(
+            "send_message", whatsapp_send_message, recipient, message, timeout=SEND_TIMEOUT, pool=HTTP_POOL
+        )
+    except ToolTimeout as e:
+        # The request may still reach the bridge, so the outcome is unknown
+        return {
+            "success": False,
+            "message": f"{e}; the message may or may not have been sent"
+        }
+    # whatsapp_send_message checks the suppression list itself
+    if status_message == OPTED_OUT_MESSAGE.format(recipient=recipient):
+        return {
+            "success": False,
+            "skipped": "opted_out",
+            "message": status_message
+        }
     return {
         "success": success,
         "message": status_message
     }
 
 @mcp.tool()
-def send_bulk_messages_from_excel(
+async def send_bulk_messages_from_excel(
     excel_path: str,
     message: str,
     phone_column: str = "phone_number"
@@ -193,8 +375,22 @@ def send_bulk_messages_from_excel(
         phone_column: Name of the column containing phone numbers (default "phone_number")
     
     Returns:
-        A dictionary containing overall success status and detailed results for each number
+        A dictionary containing overall success status and detailed results for each number.
+        Numbers that opted out (replied STOP) or appear more than once are not messaged
+        (again) and are listed under "skipped" with the reason.
     """
+    # No overall timeout: each send has its own HTTP timeout, and a batch
+    # can't be abandoned halfway without losing track of who was messaged
+    return await run_tool(
+        "send_bulk_messages_from_excel", _send_bulk_messages_from_excel, excel_path, message, phone_column,
+        timeout=None, pool=HTTP_POOL
+    )
+
+def _send_bulk_messages_from_excel(excel_path: str, message: str, phone_column: str) -> Dict[str, Any]:
+    """Blocking body of send_bulk_messages_from_excel, run on the HTTP pool."""
+    # Imported on first use: pandas alone takes longer to import than the rest of the server
+    import pandas as pd
+
     try:
         # Read the Excel file
         df = pd.read_excel(excel_path)
@@ -203,18 +399,30 @@ def send_bulk_messages_from_excel(
             return {
                 "success": False,
                 "message": f"Column '{phone_column}' not found in Excel file",
-                "details": []
+                "details": [],
+                "skipped": []
             }
         
         results = []
         success_count = 0
         failed_count = 0
+
+        # Normalize (formatting, trunk prefix, missing country code), then drop
+        # duplicates and numbers that opted out
+        refresh_suppression()
+        recipients, skipped = filter_recipients(df[phone_column].dropna(), SUPPRESSION)
+        for entry in skipped:
+            if entry["reason"] == "invalid":
+                results.append({
+                    "phone_number": entry["phone_number"],
+                    "success": False,
+                    "message": "Not a valid phone number"
+                })
+                failed_count += 1
+        skipped = [entry for entry in skipped if entry["reason"] != "invalid"]
         
         # Process each phone number
-        for phone in df[phone_column].dropna():
-            # Clean the phone number - remove any spaces, +, or other characters
-            clean_phone = str(phone).strip().replace("+", "").replace(" ", "").replace("-", "")
-            
+        for clean_phone in recipients:
             # Send message
             success, status_message = whatsapp_send_message(clean_phone, message)
             
@@ -232,17 +440,34 @@ def send_bulk_messages_from_excel(
         
         return {
             "success": True,
-            "message": f"Processed {len(results)} numbers. Success: {success_count}, Failed: {failed_count}",
-            "details": results
+            "message": f"Processed {len(results)} numbers. Success: {success_count}, Failed: {failed_count}, Skipped: {len(skipped)}",
+            "details": results,
+            "skipped": skipped
         }
         
     except Exception as e:
         return {
             "success": False,
             "message": f"Error processing Excel file: {str(e)}",
-            "details": []
+            "details": [],
+            "skipped": []
         }
 
+@mcp.tool()
+async def get_server_stats() -> Dict[str, Any]:
+    """Get this server's per-tool call counts, error rates, latency percentiles and response sizes.
+
+    Tools are listed busiest first (by total time spent in them). Also
+    includes the query result cache's hit rate.
+    """
+    return {**METRICS.snapshot(), "result_cache": cache_stats()}
+
 if __name__ == "__main__":
+    METRICS.register(tool.name for tool in mcp._tool_manager.list_tools())
+    # Optional Prometheus text dump, e.g. for node_exporter's textfile collector
+    if os.environ.get("WHATSAPP_METRICS_FILE"):
+        METRICS.start_dumping(os.environ["WHATSAPP_METRICS_FILE"])
+    # Build the contact search index in the background while the server starts
+    threading.Thread(target=load_contact_index, name="contact-index", daemon=True).start()
     # Initialize and run the server
     mcp.run(transport='stdio')
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""Per-tool call metrics for the MCP server.
+
+`MetricsRegistry.track` wraps one tool call and records, per tool:
+
+- calls and errors (a tool that raised, or whose arguments didn't validate)
+- latency, as a cumulative histogram (for Prometheus) and a window of the
+  most recent calls (for exact percentiles)
+- response size in bytes, as the client receives it
+
+main.py records every tool call this way and serves `snapshot()` through
+the get_server_stats tool. Setting WHATSAPP_METRICS_FILE also has the
+registry written to that file in the Prometheus text format every
+DUMP_INTERVAL_SECONDS, for node_exporter's textfile collector or a
+plain `cat`. The file is replaced atomically, so readers never see half a
+dump.
+"""
+
+import bisect
+import math
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Histogram bucket upper bounds, as in Prometheus's client defaults (plus slower ones)
+LATENCY_BUCKETS_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Calls kept per tool for percentiles
+RECENT_CALLS = 1024
+DUMP_INTERVAL_SECONDS = 15.0
+
+def percentile(sorted_values: Sequence[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of already sorted values.
+
+    Nearest rank always returns one of the observed values, so small samples
+    still give a p95 at or above the median.
+
+    Args:
+        sorted_values: The samples, in ascending order
+        p: The percentile as a fraction, e.g. 0.95
+
+    Returns:
+        The percentile, or None if there are no samples
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(len(sorted_values) * p) - 1)]
+
+class Histogram:
+    """Cumulative-bucket histogram with a sum and count, like a Prometheus histogram."""
+
+    def __init__(self, bounds: Iterable[float]):
+        self.bounds = tuple(bounds)
+        # The last bucket is +Inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, count of observations <= le) pairs, ending with "+Inf"."""
+        total = 0
+        result = []
+        for bound, count in zip([*map(_format_number, self.bounds), "+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+class ToolMetrics:
+    """Counters and histograms of a single tool."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latency = Histogram(LATENCY_BUCKETS_SECONDS)
+        self.response_bytes = Histogram(SIZE_BUCKETS_BYTES)
+        self.max_seconds = 0.0
+        self.max_bytes = 0
+        self.recent: Deque[float] = deque(maxlen=RECENT_CALLS)
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+
+        def recent_ms(p: float) -> Optional[float]:
+            value = percentile(recent, p)
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.calls, 4) if self.calls else 0.0,
+            "in_flight": self.in_flight,
+            "total_ms": round(self.latency.sum * 1000, 3),
+            "latency_ms": {
+                "mean": round(self.latency.sum / self.latency.count * 1000, 3) if self.latency.count else None,
+                "p50": round(statistics.median(recent) * 1000, 3) if recent else None,
+                "p95": recent_ms(0.95),
+                "p99": recent_ms(0.99),
+                "max": round(self.max_seconds * 1000, 3),
+            },
+            "response_bytes": {
+                "mean": round(self.response_bytes.sum / self.response_bytes.count) if self.response_bytes.count else None,
+                "max": self.max_bytes,
+                "total": int(self.response_bytes.sum),
+            },
+        }
+
+class _Call:
+    """Handed to the body of `track`; set `response_bytes` once the response is known."""
+
+    def __init__(self):
+        self.response_bytes: Optional[int] = None
+
+class MetricsRegistry:
+    """Thread-safe per-tool metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tools: Dict[str, ToolMetrics] = {}
+        self.started = time.time()
+
+    def _tool(self, name: str) -> ToolMetrics:
+        tool = self._tools.get(name)
+        if tool is None:
+            tool = self._tools[name] = ToolMetrics()
+        return tool
+
+    def register(self, names: Iterable[str]) -> None:
+        """Make tools show up (with zero calls) before they are first called."""
+        with self._lock:
+            for name in names:
+                self._tool(name)
+
+    @contextmanager
+    def track(self, name: str) -> Iterator[_Call]:
+        """Record one call of tool `name`; an exception leaving the block counts as an error."""
+        call = _Call()
+        with self._lock:
+            self._tool(name).in_flight += 1
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield call
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                tool = self._tool(name)
+                tool.in_flight -= 1
+                tool.calls += 1
+                tool.errors += failed
+                tool.latency.observe(elapsed)
+                tool.recent.append(elapsed)
+                tool.max_seconds = max(tool.max_seconds, elapsed)
+                if call.response_bytes is not None:
+                    tool.response_bytes.observe(call.response_bytes)
+                    tool.max_bytes = max(tool.max_bytes, call.response_bytes)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Every tool's counters and latency/size summary, busiest (by total time) first."""
+        with self._lock:
+            tools = {name: tool.snapshot() for name, tool in self._tools.items()}
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "calls": sum(tool["calls"] for tool in tools.values()),
+            "errors": sum(tool["errors"] for tool in tools.values()),
+            "tools": dict(sorted(tools.items(), key=lambda item: item[1]["total_ms"], reverse=True)),
+        }
+
+    def prometheus(self, prefix: str = "whatsapp_mcp") -> str:
+        """The registry in the Prometheus text exposition format."""
+        lines = []
+
+        def header(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        with self._lock:
+            tools = sorted(self._tools.items())
+            header("tool_calls_total", "counter", "Tool calls, including failed ones.")
+            lines += [f'{prefix}_tool_calls_total{{tool="{name}"}} {tool.calls}' for name, tool in tools]
+            header("tool_errors_total", "counter", "Tool calls that failed.")
+            lines += [f'{prefix}_tool_errors_total{{tool="{name}"}} {tool.errors}' for name, tool in tools]
+            header("tool_in_flight", "gauge", "Tool calls currently running.")
+            lines += [f'{prefix}_tool_in_flight{{tool="{name}"}} {tool.in_flight}' for name, tool in tools]
+            for metric, attribute, help_text in (
+                ("tool_duration_seconds", "latency", "Tool call latency."),
+                ("tool_response_bytes", "response_bytes", "Size of tool responses."),
+            ):
+                header(metric, "histogram", help_text)
+                for name, tool in tools:
+                    histogram: Histogram = getattr(tool, attribute)
+                    for le, count in histogram.cumulative():
+                        lines.append(f'{prefix}_{metric}_bucket{{tool="{name}",le="{le}"}} {count}')
+                    lines.append(f'{prefix}_{metric}_sum{{tool="{name}"}} {_format_number(histogram.sum)}')
+                    lines.append(f'{prefix}_{metric}_count{{tool="{name}"}} {histogram.count}')
+        header("uptime_seconds", "gauge", "Seconds since the server started.")
+        lines.append(f"{prefix}_uptime_seconds {time.time() - self.started:.1f}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """Write `prometheus()` to path, replacing the file atomically."""
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(temporary, path)
+
+    def start_dumping(self, path: str, interval: float = DUMP_INTERVAL_SECONDS) -> threading.Thread:
+        """Dump to path every `interval` seconds on a daemon thread."""
+        def run():
+            while True:
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    # stderr: the MCP server owns stdout
+                    print(f"Could not write metrics to {path}: {e}", file=sys.stderr)
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        thread.start()
+        return thread
+
+def _format_number(value: float) -> str:
+    return f"{value:g}" if isinstance(value, float) else str(value)
@@ -0,0 +1,101 @@
+"""Phone number normalization and mapping to WhatsApp JIDs.
+
+Numbers reach the server in every format people type or spreadsheets
+store: "+91 98765-43210", "098765 43210", "9876543210", "919876543210.0"
+(a number read from Excel as a float) or a full JID. `normalize` reduces
+them all to the international digits WhatsApp uses in personal JIDs
+("919876543210"), so a contact can be looked up by exact match instead of
+a substring search.
+
+Numbers written without a country code get DEFAULT_COUNTRY_CODE, matching
+the bulk sender's long-standing assumption that contacts are Indian. Only
+numbers that look like Indian mobile numbers (ten digits starting with 6-9)
+count as national ones; other ten-digit numbers such as 4512345678 (Denmark)
+are taken to already start with their country code. Some international
+numbers, e.g. Singapore's 6591234567, look like Indian ones too; lookups
+try the digits exactly as given before the expanded form (see
+get_direct_chat_by_contact), and the bulk sender needs them with a "+".
+"""
+
+import re
+from typing import Optional
+
+DEFAULT_COUNTRY_CODE = "91"
+# A national (mobile) number in the default country, without trunk prefix
+NATIONAL_NUMBER = re.compile(r"[6-9]\d{9}")
+# E.164 allows at most 15 digits; anything much shorter isn't a full number
+MIN_DIGITS = 8
+MAX_DIGITS = 15
+
+USER_SERVER = "s.whatsapp.net"
+GROUP_SERVER = "g.us"
+
+_USER_PART = "substr({0}, 1, instr({0} || '@', '@') - 1)"
+_BEFORE_DEVICE = "substr({0}, 1, instr({0} || ':', ':') - 1)"
+# SQL for the user part of a JID without its device ("9198...:12@s.whatsapp.net"
+# gives "9198..."); a bare user part is kept as it is. Format with the column
+# or expression to convert; it is evaluated once.
+JID_USER_EXPRESSION = "(SELECT " + _BEFORE_DEVICE.format(_USER_PART.format("jid")) + " FROM (SELECT {0} AS jid))"
+# SQL for the user part of a personal JID as digits ("9198...@s.whatsapp.net"
+# and device JIDs like "9198...:12@s.whatsapp.net"), NULL for groups and
+# non-numeric users; format with the column or expression to convert
+JID_DIGITS_EXPRESSION = (
+    "(SELECT CASE WHEN jid_user <> '' AND jid_user NOT GLOB '*[^0-9]*' AND {0} NOT LIKE '%@" + GROUP_SERVER + "' "
+    "THEN jid_user END FROM (SELECT " + _BEFORE_DEVICE.format(_USER_PART.format("{0}")) + " AS jid_user))"
+)
+
+def jid_user(jid: str) -> str:
+    """The user part of a JID without its device, as JID_USER_EXPRESSION computes it in SQL."""
+    return jid.partition("@")[0].partition(":")[0]
+
+def normalize(number: object, default_country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """Reduce a phone number or personal JID to its international digits.
+
+    Args:
+        number: The number as typed, read from a spreadsheet, or a JID
+        default_country_code: Country code for numbers given without one
+                              ("" keeps the digits as given)
+
+    Returns:
+        The digits (country code first, no "+"), or None if the input
+        isn't a plausible phone number (including group JIDs)
+    """
+    text = str(number).strip()
+    if "@" in text:
+        user, _, server = text.partition("@")
+        if server == GROUP_SERVER:
+            return None
+        # Drop the device and agent parts of "user.agent:device@server"; the
+        # user part already starts with the country code
+        text = "+" + user.split(":")[0].split(".")[0]
+    elif re.fullmatch(r"\+?\d+\.0", text):
+        # Spreadsheet cells read as floats
+        text = text[:-2]
+
+    digits = re.sub(r"\D", "", text)
+    if text.startswith("+"):
+        pass
+    elif text.startswith("00"):
+        digits = digits[2:]
+    else:
+        # National formats: an optional trunk "0", then the national number
+        if digits.startswith("0") and NATIONAL_NUMBER.fullmatch(digits[1:]):
+            digits = digits[1:]
+        if NATIONAL_NUMBER.fullmatch(digits):
+            digits = default_country_code + digits
+
+    if not MIN_DIGITS <= len(digits) <= MAX_DIGITS:
+        return None
+    return digits
+
+def to_jid(recipient: str, default_country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """Canonical JID for a phone number or JID.
+
+    Group JIDs are returned unchanged; phone numbers and personal JIDs
+    become "<digits>@s.whatsapp.net". Returns None for anything else.
+    """
+    recipient = recipient.strip()
+    if recipient.endswith("@" + GROUP_SERVER):
+        return recipient
+    digits = normalize(recipient, default_country_code)
+    return f"{digits}@{USER_SERVER}" if digits else None
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Opt-in slow-query log for the message store.
+
+When a tool call is slow, the log says which statement was to blame. Once
+enabled it sees every read made through db.py (so every query in
+whatsapp.py). It writes one JSON object per line to a file with:
+
+- `sql`: the statement, whitespace collapsed, and a short `fingerprint` of it
+- `params`: the parameters' types, never their values (they hold phone
+  numbers and message text)
+- `rows` returned, wall time in `ms`, and the `caller` that issued it
+- `plan`: the EXPLAIN QUERY PLAN rows, for statements slower than the threshold
+- `error`, if the statement failed (e.g. interrupted by a tool timeout)
+
+By default only statements at or above the threshold are written; with
+`log_all` every statement is, so whole runs can be compared. The server
+turns the log on from the environment:
+
+    WHATSAPP_QUERY_LOG=/tmp/queries.jsonl     enables it, writing to that file
+    WHATSAPP_SLOW_QUERY_MS=50                  threshold (default 100)
+    WHATSAPP_QUERY_LOG_ALL=1                   log every statement
+
+`python query_log.py summary <file>` groups a log by fingerprint with
+count, median, p95 and max time, slowest first.
+
+Usage: python query_log.py summary <log_file>
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+from collections import defaultdict
+from contextlib import closing
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import db
+import metrics
+
+SLOW_QUERY_MS = 100.0
+# The log is moved to <path>.1 once it grows past this
+MAX_LOG_BYTES = 64 * 1024 * 1024
+
+# Frames in these modules are plumbing, not the caller to report
+_PLUMBING = {"db", "query_log", "result_cache", "tool_pool", "contextlib", "threading", "concurrent.futures.thread"}
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(sql.split())
+
+def fingerprint(sql: str) -> str:
+    """Short stable id of a statement, for grouping log entries."""
+    return hashlib.sha1(normalize_sql(sql).encode()).hexdigest()[:12]
+
+def params_shape(params: Sequence[Any]) -> List[str]:
+    """Type names of the parameters, e.g. ["str", "int", "NoneType"]."""
+    return [type(value).__name__ for value in params]
+
+def _caller() -> Optional[str]:
+    """module.function of the nearest frame outside the database plumbing."""
+    frame = sys._getframe(2)
+    while frame:
+        module = frame.f_globals.get("__name__", "")
+        if module not in _PLUMBING and not frame.f_code.co_name.startswith("_fetch"):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+def explain(conn: sqlite3.Connection, sql: str, params: Sequence[Any]) -> List[str]:
+    """EXPLAIN QUERY PLAN of sql as indented lines, like the sqlite3 shell prints it."""
+    with closing(conn.execute("EXPLAIN QUERY PLAN " + sql, params)) as cursor:
+        rows = cursor.fetchall()
+    depth: Dict[int, int] = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return lines
+
+class QueryLog:
+    """Writes db.py's read queries to a JSON-lines file."""
+
+    def __init__(self, path: str, slow_ms: float = SLOW_QUERY_MS, log_all: bool = False):
+        self.path = path
+        self.slow_ms = slow_ms
+        self.log_all = log_all
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, conn: sqlite3.Connection, db_path: str, sql: str, params: Sequence[Any],
+                 rows: int, seconds: float, error: Optional[BaseException]) -> None:
+        ms = seconds * 1000
+        slow = ms >= self.slow_ms
+        if not (slow or self.log_all or error):
+            return
+        entry = {
+            "time": datetime.now().astimezone().isoformat(timespec="milliseconds"),
+            "db": os.path.basename(db_path),
+            "fingerprint": fingerprint(sql),
+            "sql": normalize_sql(sql),
+            "params": params_shape(params),
+            "rows": rows,
+            "ms": round(ms, 3),
+            "slow": slow,
+            "caller": _caller(),
+            "thread": threading.current_thread().name,
+        }
+        if error:
+            entry["error"] = str(error)
+        elif slow:
+            try:
+                entry["plan"] = explain(conn, sql, params)
+            except sqlite3.Error as e:
+                entry["plan_error"] = str(e)
+        self._write(json.dumps(entry, default=str))
+
+    def _write(self, line: str) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._file.tell() > MAX_LOG_BYTES:
+                self._file.close()
+                os.replace(self.path, self.path + ".1")
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+_active: Optional[QueryLog] = None
+
+def enable(path: str, slow_ms: float = SLOW_QUERY_MS, log_all: bool = False) -> QueryLog:
+    """Start logging to path (replacing any log already enabled).
+
+    Args:
+        path: The JSON-lines file to append to
+        slow_ms: Statements taking at least this long are logged with their plan
+        log_all: Also log statements under the threshold (without a plan)
+    """
+    global _active
+    disable()
+    _active = QueryLog(path, slow_ms, log_all)
+    db.add_query_hook(_active)
+    return _active
+
+def disable() -> None:
+    global _active
+    if _active:
+        db.remove_query_hook(_active)
+        _active.close()
+        _active = None
+
+def enable_from_env() -> Optional[QueryLog]:
+    """Enable the log if WHATSAPP_QUERY_LOG is set (see the module docstring)."""
+    path = os.environ.get("WHATSAPP_QUERY_LOG")
+    if not path:
+        return None
+    try:
+        slow_ms = float(os.environ.get("WHATSAPP_SLOW_QUERY_MS", SLOW_QUERY_MS))
+    except ValueError:
+        slow_ms = SLOW_QUERY_MS
+    log_all = os.environ.get("WHATSAPP_QUERY_LOG_ALL", "") not in ("", "0", "false")
+    try:
+        return enable(path, slow_ms, log_all)
+    except OSError as e:
+        # stderr: the MCP server owns stdout
+        print(f"Query log disabled, can't open {path}: {e}", file=sys.stderr)
+        return None
+
+def summarize(path: str) -> List[Dict[str, Any]]:
+    """Per-fingerprint statistics of a log file, slowest total time first."""
+    groups: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"times": [], "rows": 0, "errors": 0})
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            group = groups[entry["fingerprint"]]
+            group["times"].append(entry["ms"])
+            group["rows"] += entry.get("rows", 0)
+            group["errors"] += "error" in entry
+            group.setdefault("sql", entry["sql"])
+            group.setdefault("callers", set()).add(entry.get("caller"))
+            if entry.get("plan") and entry["ms"] >= group.get("plan_ms", -1):
+                group["plan"], group["plan_ms"] = entry["plan"], entry["ms"]
+
+    summary = []
+    for key, group in groups.items():
+        times = sorted(group["times"])
+        summary.append({
+            "fingerprint": key,
+            "count": len(times),
+            "total_ms": round(sum(times), 3),
+            "median_ms": statistics.median(times),
+            "p95_ms": metrics.percentile(times, 0.95),
+            "max_ms": times[-1],
+            "rows": group["rows"],
+            "errors": group["errors"],
+            "callers": sorted(caller for caller in group["callers"] if caller),
+            "sql": group["sql"],
+            "plan": group.get("plan", []),
+        })
+    summary.sort(key=lambda row: row["total_ms"], reverse=True)
+    return summary
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "summary":
+        print("Usage: python query_log.py summary <log_file>")
+        sys.exit(1)
+
+    for row in summarize(sys.argv[2]):
+        print(f"{row['fingerprint']}  {row['count']:>6} calls  total {row['total_ms']:>10.1f} ms  "
+              f"median {row['median_ms']:>8.2f}  p95 {row['p95_ms']:>8.2f}  max {row['max_ms']:>8.2f} ms"
+              + (f"  {row['errors']} errors" if row["errors"] else ""))
+        print(f"    {', '.join(row['callers'])}")
+        print(f"    {row['sql'][:200]}")
+        for line in row["plan"]:
+            print(f"      {line}")
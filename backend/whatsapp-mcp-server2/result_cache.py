@@ -0,0 +1,139 @@
+"""Change-aware LRU cache for query results.
+
+Agents call the same read tools with the same arguments over and over,
+usually with no new messages in between. `cached` memoizes a query
+function on its arguments and drops every entry as soon as the database
+changes, so a repeat call costs one `PRAGMA data_version` instead of a
+query and never returns stale data.
+
+`PRAGMA data_version` changes whenever another connection commits to the
+database (the bridge, or this server's own write connection). Its value
+is only meaningful per connection, and each thread has its own pooled
+connection, so every thread remembers the last value its connection
+reported. A change seen by any thread bumps a shared generation, which
+invalidates all entries made before it. A thread's first check also bumps
+the generation, since it can't know what changed before it started
+looking. Entries also expire after a TTL as a backstop.
+
+Cached results are shared between callers: lists are copied on the way
+out, but the objects in them must be treated as read-only.
+"""
+
+import functools
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import db
+
+MAX_ENTRIES = 1024
+TTL_SECONDS = 300.0
+
+class ResultCache:
+    """A thread-safe LRU/TTL cache invalidated by database writes."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_seconds: float = TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[int, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _current_generation(self, db_path: str) -> int:
+        """Check this thread's connection for new commits and return the generation."""
+        versions: Dict[str, Tuple[Any, int]] = getattr(self._local, "versions", None)
+        if versions is None:
+            versions = self._local.versions = {}
+        # A reopened connection counts as a first check
+        seen = (db.get_connection(db_path), db.data_version(db_path))
+        with self._lock:
+            last = versions.get(db_path)
+            if last is None or last[0] is not seen[0] or last[1] != seen[1]:
+                versions[db_path] = seen
+                self._generation += 1
+                self._entries.clear()
+                self.invalidations += 1
+            return self._generation
+
+    def get_or_compute(self, db_path: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached result for key, or compute and cache it.
+
+        Results computed while a database error occurred (e.g. an
+        interrupted query, which the query functions turn into an empty
+        result) are returned but not cached.
+        """
+        try:
+            generation = self._current_generation(db_path)
+        except sqlite3.Error:
+            return compute()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == generation and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(entry[2])
+            self.misses += 1
+
+        errors = db.error_count()
+        result = compute()
+        if db.error_count() != errors:
+            return result
+
+        with self._lock:
+            # Tagged with the generation seen before the query ran, so a
+            # write detected meanwhile leaves the entry already invalid
+            self._entries[key] = (generation, now + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return _copy(result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+def _copy(result: Any) -> Any:
+    return list(result) if isinstance(result, list) else result
+
+def cached(cache: ResultCache, db_path: Callable[[], str]) -> Callable:
+    """Decorate a query function to memoize its results in cache.
+
+    Args:
+        cache: The cache to use
+        db_path: Returns the database the function reads (looked up on
+                 every call, so the path can be changed at runtime)
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            path = db_path()
+            key = (path, fn.__name__, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                return fn(*args, **kwargs)
+            return cache.get_or_compute(path, key, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
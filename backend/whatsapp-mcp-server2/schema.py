@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for the server's additions to messages.db.
+
+The bridge (whatsapp-bridge/main.go, NewMessageStore) creates `chats` and
+`messages` with nothing but their primary keys, so every ordered listing,
+per-chat window and sender lookup in whatsapp.py would be a full scan plus
+a temp B-tree sort. The indexes and tables the query layer relies on are
+added here, as numbered migrations recorded in `mcp_schema_migrations`.
+Each migration runs once, in its own `BEGIN IMMEDIATE` transaction and
+committed on its own, and everything is created with IF NOT EXISTS so a
+half-migrated or hand-edited database converges on the same schema.
+Migrations that derive tables from every message create them (and their
+triggers) in that transaction and fill them afterwards in separately
+committed batches; the migration is recorded once the fill is done, so an
+interrupted one is simply run again. ANALYZE runs after any migration so
+the planner has statistics for the new indexes.
+
+Migrating still takes the write lock for seconds at a time on a large
+store (index builds can't be split), while the bridge gives up on a write
+after its 5 s busy timeout and drops the message. So the server only
+migrates by itself while the store is small (AUTO_MIGRATE_MAX_MESSAGES);
+beyond that, stop the bridge, run `python schema.py migrate`, and start it
+again. Alternatively, open the bridge's database with a longer busy
+timeout (`_busy_timeout=60000` in its sqlite3 DSN) so its writes wait
+instead of failing.
+
+`backfill_epochs` fills the `ts_epoch` column of pre-existing rows in small
+batches.
+
+`explain_report` runs every query function in whatsapp.py against a
+database and prints EXPLAIN QUERY PLAN for each statement it issues,
+flagging tables read without an index.
+
+Usage: python schema.py [migrate|backfill|status|explain] [db_path]
+"""
+
+import contextlib
+import io
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import chat_participants
+import chat_summary
+import db
+import fts
+import phones
+
+MIGRATIONS_TABLE = "mcp_schema_migrations"
+# Rows sampled per index by ANALYZE; approximate stats are plenty for the planner
+ANALYSIS_LIMIT = 1000
+# After a failed migration (database missing, locked, read-only), wait this long before retrying
+RETRY_SECONDS = 30
+# Rows per backfill transaction, so the bridge is never locked out for long
+BACKFILL_BATCH_ROWS = 50_000
+# ensure_schema leaves pending migrations of larger stores to `python schema.py migrate`
+AUTO_MIGRATE_MAX_MESSAGES = 100_000
+
+def _create_query_indexes(conn: sqlite3.Connection) -> None:
+    """Indexes for the access paths of whatsapp.py.
+
+    SQLite appends the rowid to every index entry, so each of these also
+    serves the `(timestamp, rowid)` keyset order used for pagination.
+    """
+    # Recent messages overall: ORDER BY timestamp DESC, date_range filters
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)")
+    # One chat's messages in order: list_messages(chat_jid), context windows,
+    # and the (chat_jid, last_message_time) join for a chat's last message
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_chat_timestamp ON messages(chat_jid, timestamp)")
+    # Messages by sender: list_messages(sender_phone_number), get_contact_chats,
+    # get_last_interaction; chat_jid is included so the chat lookup needs no row fetch
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_sender_timestamp ON messages(sender, timestamp, chat_jid)")
+    # Chat listings ordered by activity or by name
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_last_message_time ON chats(last_message_time, jid)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_name ON chats(name, jid)")
+
+def _add_epoch_column(conn: sqlite3.Connection) -> None:
+    """Integer `ts_epoch` shadow of `messages.timestamp`, kept current by triggers.
+
+    The text timestamps carry the bridge's UTC offset, so comparing them as
+    strings orders messages wrongly across offsets (and against Python's
+    isoformat). Existing rows are filled in batches by backfill_epochs.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "ts_epoch" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN ts_epoch INTEGER")
+    # Plain core SQL, so the bridge's own SQLite build can run them
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS messages_ts_epoch_insert AFTER INSERT ON messages
+        BEGIN
+            UPDATE messages SET ts_epoch = {db.EPOCH_EXPRESSION.format('NEW.timestamp')} WHERE rowid = NEW.rowid;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS messages_ts_epoch_update AFTER UPDATE OF timestamp ON messages
+        BEGIN
+            UPDATE messages SET ts_epoch = {db.EPOCH_EXPRESSION.format('NEW.timestamp')} WHERE rowid = NEW.rowid;
+        END
+    """)
+    # Epoch replacements for the timestamp indexes of migration 1. The
+    # (chat_jid, timestamp) one is left here; migration 4 used to drop it,
+    # and migration 7 brings it back for the bridge's per-chat history query.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_epoch ON messages(ts_epoch)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_chat_epoch ON messages(chat_jid, ts_epoch)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_sender_epoch ON messages(sender, ts_epoch, chat_jid)")
+    conn.execute("DROP INDEX IF EXISTS idx_messages_timestamp")
+    conn.execute("DROP INDEX IF EXISTS idx_messages_sender_timestamp")
+
+def _add_chat_summary(conn: sqlite3.Connection) -> None:
+    """The chat_summary table, which replaces the last-message join.
+
+    This used to drop idx_messages_chat_timestamp as well, which the bridge's
+    own GetMessages needs; migration 7 restores it where that happened.
+    """
+    chat_summary.create_table(conn)
+
+def _add_chat_participants(conn: sqlite3.Connection) -> None:
+    """The chat_participants table, which replaces the per-sender message walk."""
+    chat_participants.create_table(conn)
+
+def _add_phone_digits(conn: sqlite3.Connection) -> None:
+    """Indexed `phone_digits` of personal chats, for exact lookup by phone number.
+
+    Kept current by triggers like ts_epoch: the bridge's INSERT OR REPLACE
+    leaves the column NULL and the insert trigger fills it in.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+    if "phone_digits" not in columns:
+        conn.execute("ALTER TABLE chats ADD COLUMN phone_digits TEXT")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS chats_phone_digits_insert AFTER INSERT ON chats
+        BEGIN
+            UPDATE chats SET phone_digits = {phones.JID_DIGITS_EXPRESSION.format('NEW.jid')} WHERE rowid = NEW.rowid;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS chats_phone_digits_update AFTER UPDATE OF jid ON chats
+        BEGIN
+            UPDATE chats SET phone_digits = {phones.JID_DIGITS_EXPRESSION.format('NEW.jid')} WHERE rowid = NEW.rowid;
+        END
+    """)
+    conn.execute(f"UPDATE chats SET phone_digits = {phones.JID_DIGITS_EXPRESSION.format('chats.jid')}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_phone_digits ON chats(phone_digits)")
+
+def _restore_bridge_chat_index(conn: sqlite3.Connection) -> None:
+    """Bring back the (chat_jid, timestamp) index that migration 4 dropped.
+
+    whatsapp.py no longer uses it, but the bridge's GetMessages (main.go)
+    reads `WHERE chat_jid = ? ORDER BY timestamp DESC` and sorts the whole
+    chat without it.
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_chat_timestamp ON messages(chat_jid, timestamp)")
+
+def _participant_user_parts(conn: sqlite3.Connection) -> None:
+    """Triggers that key chat_participants on the sender's user part.
+
+    Before this, history-synced messages (whose sender is a full JID) and
+    live ones (bare user part) made two rows per contact and chat.
+    """
+    chat_participants.drop_triggers(conn)
+    chat_participants.create_table(conn)
+
+def _refill_participants(db_path: str) -> None:
+    # Nothing to redo if every sender was a bare user part (or migration 5 just ran)
+    if db.fetchone(db_path, "SELECT 1 FROM chat_participants WHERE participant_jid GLOB '*[@:]*' LIMIT 1"):
+        chat_participants.fill(db_path)
+
+# (version, name, apply, fill) - append only; never renumber or edit an applied
+# migration. apply runs in the migration's transaction; fill (if any) gets the
+# database path and commits its own work afterwards, before the version is recorded
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None], Optional[Callable[[str], None]]]] = [
+    (1, "query indexes", _create_query_indexes, None),
+    (2, "full-text search index", fts.create_index, None),
+    (3, "integer epoch timestamps", _add_epoch_column, None),
+    (4, "chat summary", _add_chat_summary, chat_summary.fill),
+    (5, "chat participants", _add_chat_participants, chat_participants.fill),
+    (6, "phone digits", _add_phone_digits, None),
+    (7, "bridge chat index", _restore_bridge_chat_index, None),
+    (8, "participant user parts", _participant_user_parts, _refill_participants),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_ready = set()
+_failed_at: Dict[str, float] = {}
+_lock = threading.Lock()
+
+def current_version(db_path: str) -> int:
+    """Highest migration applied to the database, 0 if none."""
+    try:
+        row = db.fetchone(db_path, f"SELECT MAX(version) FROM {MIGRATIONS_TABLE}")
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+def _record(conn: sqlite3.Connection, version: int, name: str) -> None:
+    conn.execute(
+        f"INSERT OR IGNORE INTO {MIGRATIONS_TABLE} (version, name, applied_at) VALUES (?, ?, ?)",
+        (version, name, datetime.now().astimezone().isoformat())
+    )
+
+def migrate(db_path: str) -> List[int]:
+    """Apply every pending migration, then refresh the planner statistics.
+
+    Each migration is committed on its own, so the write lock is given up
+    between them (and between the batches of a fill).
+
+    Returns:
+        The versions applied by this call (empty if already up to date)
+    """
+    if current_version(db_path) >= LATEST_VERSION:
+        return []
+
+    conn = db.get_write_connection(db_path)
+    with db.write_transaction(conn):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        """)
+    applied_now = []
+    for version, name, apply, fill in MIGRATIONS:
+        with db.write_transaction(conn):
+            # Re-read under the write lock; another process may have migrated meanwhile
+            if conn.execute(f"SELECT 1 FROM {MIGRATIONS_TABLE} WHERE version = ?", (version,)).fetchone():
+                continue
+            apply(conn)
+            if fill is None:
+                _record(conn, version, name)
+        if fill is not None:
+            fill(db_path)
+            with db.write_transaction(conn):
+                _record(conn, version, name)
+        applied_now.append(version)
+
+    if applied_now:
+        analyze(db_path)
+    return applied_now
+
+def pending_too_large(db_path: str) -> bool:
+    """Whether migrations are pending on a store too large to migrate while the bridge runs."""
+    if current_version(db_path) >= LATEST_VERSION:
+        return False
+    latest = db.fetchone(db_path, "SELECT MAX(rowid) FROM messages")[0] or 0
+    return latest > AUTO_MIGRATE_MAX_MESSAGES
+
+def analyze(db_path: str) -> None:
+    """Gather planner statistics (sqlite_stat1) for every index."""
+    conn = db.get_write_connection(db_path)
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    with conn:
+        conn.execute("ANALYZE")
+
+def backfill_epochs(db_path: str) -> int:
+    """Fill `ts_epoch` for rows written before migration 3.
+
+    Works through the rowid range in committed batches. Rows whose
+    timestamp can't be parsed keep a NULL epoch.
+
+    Returns:
+        Number of rows updated
+    """
+    first = db.fetchone(db_path, "SELECT MIN(rowid) FROM messages WHERE ts_epoch IS NULL")[0]
+    if first is None:
+        return 0
+    latest = db.fetchone(db_path, "SELECT MAX(rowid) FROM messages")[0]
+
+    conn = db.get_write_connection(db_path)
+    updated = 0
+    lower = first - 1
+    while lower < latest:
+        upper = min(lower + BACKFILL_BATCH_ROWS, latest)
+        with conn:
+            cursor = conn.execute(f"""
+                UPDATE messages SET ts_epoch = {db.EPOCH_EXPRESSION.format('timestamp')}
+                WHERE rowid > ? AND rowid <= ? AND ts_epoch IS NULL
+            """, (lower, upper))
+            updated += cursor.rowcount
+        lower = upper
+    return updated
+
+def ensure_schema(db_path: str) -> bool:
+    """Migrate and backfill db_path once per process; cheap on every later call.
+
+    Failures are printed rather than raised and retried after
+    RETRY_SECONDS; until then queries needing the new columns will fail.
+    Stores with more than AUTO_MIGRATE_MAX_MESSAGES messages are not
+    migrated here (see the module docstring); that is reported the same way.
+
+    Returns:
+        True if the database is at the latest version
+    """
+    if db_path in _ready:
+        return True
+    with _lock:
+        if db_path in _ready:
+            return True
+        if time.monotonic() - _failed_at.get(db_path, float("-inf")) < RETRY_SECONDS:
+            return False
+        try:
+            if pending_too_large(db_path):
+                _failed_at[db_path] = time.monotonic()
+                print(
+                    f"{db_path} needs schema migrations that would lock out the bridge; stop the bridge, "
+                    f"run `python schema.py migrate` and start it again",
+                    file=sys.stderr
+                )
+                return False
+            migrate(db_path)
+            backfill_epochs(db_path)
+        except sqlite3.Error as e:
+            _failed_at[db_path] = time.monotonic()
+            # stderr: this runs inside tool calls, while the MCP server owns stdout
+            print(f"Schema migration failed: {e}", file=sys.stderr)
+            return False
+        _ready.add(db_path)
+        return True
+
+def _query_cases(db_path: str) -> List[Tuple[str, Callable[[], object]]]:
+    """Every query function in whatsapp.py, called with arguments drawn from the database."""
+    import whatsapp
+
+    chat_jid, sender, message_id, timestamp = db.fetchone(db_path, """
+        SELECT chat_jid, sender, id, timestamp FROM messages
+        WHERE chat_jid NOT LIKE '%@g.us'
+        ORDER BY rowid DESC LIMIT 1
+    """)
+    phone = chat_jid.split("@")[0]
+    moment = datetime.fromisoformat(timestamp)
+    date_range = (moment - timedelta(days=7), moment)
+    word = (db.fetchone(db_path, "SELECT content FROM messages WHERE content <> '' ORDER BY rowid DESC LIMIT 1")[0] or "a").split()[0]
+    message_cursor = whatsapp.list_messages(limit=1, include_context=False)[0].cursor
+    chat_cursor = whatsapp.list_chats(limit=1)[0].cursor
+    name_cursor = whatsapp.list_chats(limit=1, sort_by="name")[0].cursor
+    chat_jids = [chat.jid for chat in whatsapp.list_chats(limit=50, include_last_message=False)]
+    # A feed position 1000 rows back
+    feed_cursor = whatsapp._encode_cursor("feed", max(0, db.fetchone(db_path, "SELECT MAX(rowid) FROM messages")[0] - 1000))
+
+    return [
+        ("print_recent_messages()", lambda: whatsapp.print_recent_messages()),
+        ("list_messages()", lambda: whatsapp.list_messages(include_context=False)),
+        ("list_messages(cursor)", lambda: whatsapp.list_messages(include_context=False, cursor=message_cursor)),
+        ("list_messages(chat_jid)", lambda: whatsapp.list_messages(chat_jid=chat_jid, include_context=False)),
+        ("list_messages(sender_phone_number)", lambda: whatsapp.list_messages(sender_phone_number=sender, include_context=False)),
+        ("list_messages(date_range)", lambda: whatsapp.list_messages(date_range=date_range, include_context=False)),
+        ("list_messages(query)", lambda: whatsapp.list_messages(query=word, include_context=False)),
+        ("list_messages(query, rank_by_relevance)", lambda: whatsapp.list_messages(query=word, include_context=False, rank_by_relevance=True, include_snippets=True)),
+        ("list_messages(include_context)", lambda: whatsapp.list_messages(chat_jid=chat_jid)),
+        ("get_message_context()", lambda: whatsapp.get_message_context(message_id)),
+        ("list_chats()", lambda: whatsapp.list_chats()),
+        ("list_chats(cursor)", lambda: whatsapp.list_chats(cursor=chat_cursor)),
+        ("list_chats(sort_by='name', cursor)", lambda: whatsapp.list_chats(sort_by="name", cursor=name_cursor)),
+        ("list_chats(query)", lambda: whatsapp.list_chats(query=phone[-4:])),
+        ("search_contacts()", lambda: whatsapp.search_contacts(phone[-4:])),
+        ("get_contact_chats()", lambda: whatsapp.get_contact_chats(chat_jid)),
+        ("get_last_interaction()", lambda: whatsapp.get_last_interaction(chat_jid)),
+        ("get_chat()", lambda: whatsapp.get_chat(chat_jid)),
+        ("get_direct_chat_by_contact()", lambda: whatsapp.get_direct_chat_by_contact(phone)),
+        ("get_chats()", lambda: whatsapp.get_chats(chat_jids)),
+        ("get_last_interactions()", lambda: whatsapp.get_last_interactions(chat_jids + [phone])),
+        ("get_new_messages(since_cursor)", lambda: whatsapp.get_new_messages(feed_cursor)),
+        ("get_new_messages(since_cursor, chat_jid)", lambda: whatsapp.get_new_messages(feed_cursor, chat_jid=chat_jid)),
+    ]
+
+_SQL_KEYWORDS = {"AS", "ON", "JOIN", "LEFT", "INNER", "CROSS", "WHERE", "GROUP", "ORDER", "LIMIT", "USING"}
+
+def _table_aliases(sql: str, tables: set) -> Dict[str, str]:
+    """Map each name a table is referred to by in sql (itself or an alias) to the table."""
+    aliases = {table: table for table in tables}
+    for table, alias in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.IGNORECASE):
+        if table in tables and alias and alias.upper() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+def _is_full_scan(detail: str, aliases: Dict[str, str]) -> bool:
+    """Whether a plan step reads a whole table without using an index."""
+    words = detail.split()
+    if words[0] != "SCAN" or len(words) < 2 or words[1] not in aliases:
+        return False
+    # "SCAN t USING INDEX i" walks an index in order (cut short by LIMIT)
+    return "USING" not in words and "VIRTUAL" not in words
+
+def explain_report(db_path: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """EXPLAIN QUERY PLAN for every statement the whatsapp.py queries issue.
+
+    Returns:
+        The printable report, and a (case, plan step) pair for each full table scan
+    """
+    import whatsapp
+
+    ensure_schema(db_path)
+    previous_path, whatsapp.MESSAGES_DB_PATH = whatsapp.MESSAGES_DB_PATH, db_path
+    try:
+        tables = {row[0] for row in db.fetchall(db_path, "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        conn = db.get_connection(db_path)
+        lines, full_scans = [], []
+        for label, call in _query_cases(db_path):
+            # A cache hit would issue no statements
+            whatsapp.RESULT_CACHE.clear()
+            with db.capture_statements() as statements, contextlib.redirect_stdout(io.StringIO()):
+                call()
+            lines.append(f"\n{label}")
+            lines.append("=" * 100)
+            seen = set()
+            for path, sql, params in statements:
+                if path != db_path or sql in seen:
+                    continue
+                seen.add(sql)
+                lines.append("  " + " ".join(sql.split())[:96])
+                aliases = _table_aliases(sql, tables)
+                depth = {0: 0}
+                for node, parent, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+                    depth[node] = depth.get(parent, 0) + 1
+                    flag = ""
+                    if _is_full_scan(detail, aliases):
+                        flag = "   <-- FULL SCAN"
+                        full_scans.append((label, detail))
+                    lines.append(f"    {'  ' * depth[node]}{detail}{flag}")
+        lines.append(f"\n{len(full_scans)} full table scan(s)")
+        return "\n".join(lines), full_scans
+    finally:
+        whatsapp.MESSAGES_DB_PATH = previous_path
+
+if __name__ == "__main__":
+    from whatsapp import MESSAGES_DB_PATH
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("migrate", "backfill", "status", "explain"):
+        print("Usage: python schema.py [migrate|backfill|status|explain] [db_path]")
+        sys.exit(1)
+
+    path = sys.argv[2] if len(sys.argv) > 2 else MESSAGES_DB_PATH
+    if sys.argv[1] == "migrate":
+        applied = migrate(path)
+        print(f"Applied migrations {applied}" if applied else f"Already at version {LATEST_VERSION}")
+        print(f"Backfilled epoch timestamps for {backfill_epochs(path)} messages")
+    elif sys.argv[1] == "backfill":
+        migrate(path)
+        print(f"Backfilled epoch timestamps for {backfill_epochs(path)} messages")
+    elif sys.argv[1] == "status":
+        print(f"Schema version {current_version(path)} of {LATEST_VERSION}")
+    else:
+        report, scans = explain_report(path)
+        print(report)
+        sys.exit(1 if scans else 0)
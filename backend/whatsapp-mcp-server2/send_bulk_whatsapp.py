@@ -5,6 +5,9 @@ import argparse
 import re
 from whatsapp import send_message as whatsapp_send_message
 from whatsapp import check_connection
+from whatsapp import is_suppressed, refresh_suppression, SUPPRESSION
+from suppression import filter_recipients
+from phones import normalize as normalize_phone
 import random
 import time
 import requests
@@ -404,13 +407,26 @@ def send_bulk_messages(excel_path: str, image_dir: str = None, min_delay: int =
         if 'phone_number' not in df.columns:
             print("Error: Column 'phone_number' not found in Excel file")
             return
+
+        # Message each number once, and never numbers that replied STOP
+        opted_out, opted_in = refresh_suppression()
+        print(f"Suppression list: {len(SUPPRESSION)} numbers ({opted_out} new opt-outs, {opted_in} opted back in)")
+        recipients, skipped = filter_recipients(df['phone_number'], SUPPRESSION)
+        failed = 0
+        for entry in skipped:
+            if entry["reason"] == "invalid":
+                print(f"FAILED: {entry['phone_number']} is not a valid phone number")
+                failed += 1
+            else:
+                print(f"SKIPPED: {entry['phone_number']} ({entry['reason'].replace('_', ' ')})")
+        skipped_count = len(skipped) - failed
+        df = pd.DataFrame({'phone_number': recipients})
         
         # Shuffle the dataframe to avoid sequential patterns
         df = df.sample(frac=1).reset_index(drop=True)
         
         total = len(df)
         success = 0
-        failed = 0
         
         # Check if image mode is enabled
         use_images = False
@@ -454,10 +470,12 @@ def send_bulk_messages(excel_path: str, image_dir: str = None, min_delay: int =
             
             for index, row in batch.iterrows():
                 phone = row['phone_number']
-                # Clean the phone number
-                clean_phone = str(phone).strip().replace("+", "").replace(" ", "").replace("-", "")
-                if not clean_phone.startswith("91"):
-                    clean_phone = "91" + clean_phone
+                # Clean the phone number (numbers without a country code are taken as Indian)
+                clean_phone = normalize_phone(phone)
+                if not clean_phone:
+                    print(f"FAILED: {phone} is not a valid phone number")
+                    failed += 1
+                    continue
                 
                 print(f"Processing: {phone} -> {clean_phone}")
                 
@@ -480,6 +498,13 @@ def send_bulk_messages(excel_path: str, image_dir: str = None, min_delay: int =
                 
                 # Send with image if in image mode
                 if use_images:
+                    # The list was applied when the run started, but a STOP can arrive during
+                    # an hours-long run (text sends are checked inside whatsapp.send_message)
+                    if is_suppressed(clean_phone):
+                        print(f"SKIPPED: {clean_phone} (opted out)")
+                        skipped_count += 1
+                        continue
+
                     # Choose image avoiding recently used ones if possible
                     available_choices = [img for img in available_images if img not in recent_images]
                     if not available_choices:
@@ -549,7 +574,7 @@ def send_bulk_messages(excel_path: str, image_dir: str = None, min_delay: int =
                     time.sleep(batch_break)
         
         print("-" * 50)
-        print(f"Summary: Total={total}, Success={success}, Failed={failed}")
+        print(f"Summary: Total={total}, Success={success}, Failed={failed}, Skipped={skipped_count}")
         
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Opt-out (suppression) list checked before every send.
+
+Recipients opt out by replying STOP (or UNSUBSCRIBE, "stop all", ...), and
+opt back in with START. `harvest` reads such replies from messages.db,
+oldest first. It only reads incoming messages in direct chats, and only
+rows past the last one it has seen, so a harvest costs as much as the new
+traffic. Numbers can also be added and removed by hand.
+
+Numbers are stored normalized (phones.normalize) as 64-bit integers in an
+on-disk open-addressing hash table. A file is a 32-byte header followed
+by a power-of-two array of slots, little-endian, at most half full:
+
+    magic (8 bytes) | entries | harvested rowid | slot count | slots...
+
+Loading reads the array straight into memory with no parsing, and a
+lookup hashes the number and probes a few slots. Both stay fast with
+millions of entries, at 16 bytes or less per number. Changed numbers are
+written to a new file that replaces the old one, so other processes never
+read a half-written list (only the harvest position is updated in place).
+`refresh` notices a changed file and reloads it.
+
+Usage: python suppression.py [add|remove|check] <number>... | import <file> | harvest [db_path] | count
+"""
+
+import os
+import re
+import sys
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import db
+import phones
+
+MAGIC = b"WASUPP01"
+# Fibonacci hashing multiplier (2^64 / golden ratio)
+_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK = (1 << 64) - 1
+MIN_SLOTS = 1024
+
+# Whole-message replies that opt out or back in, compared after _keyword()
+STOP_KEYWORDS = frozenset({
+    "stop", "stop all", "stopall", "unsubscribe", "unsub", "cancel", "end", "quit",
+    "opt out", "optout", "opt-out", "remove", "remove me", "don't message me", "do not message me",
+})
+START_KEYWORDS = frozenset({"start", "unstop", "subscribe", "opt in", "optin", "opt-in"})
+# A reply longer than this is a conversation, not a keyword
+MAX_KEYWORD_LENGTH = max(map(len, STOP_KEYWORDS | START_KEYWORDS)) + 4
+
+def _keyword(content: str) -> str:
+    """Lowercase, trimmed, without surrounding punctuation ("STOP!" -> "stop")."""
+    return " ".join(re.sub(r"^[\W_]+|[\W_]+$", "", content.lower()).split())
+
+def _slot(number: int, bits: int) -> int:
+    return ((number * _MULTIPLIER) & _MASK) >> (64 - bits)
+
+def _table(numbers: Set[int]) -> Tuple[array, int]:
+    """Slots holding numbers at most half full, and log2 of their count."""
+    bits = max(MIN_SLOTS.bit_length() - 1, (len(numbers) * 2 - 1).bit_length())
+    slots = array("Q", bytes(8 << bits))
+    mask = (1 << bits) - 1
+    for number in numbers:
+        i = _slot(number, bits)
+        while slots[i]:
+            i = (i + 1) & mask
+        slots[i] = number
+    return slots, bits
+
+class SuppressionList:
+    """Normalized numbers that must not be messaged, backed by a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # (slots, log2 of their count), replaced as a whole so lookups need no lock
+        self._table = (array("Q", bytes(8 * MIN_SLOTS)), MIN_SLOTS.bit_length() - 1)
+        self._count = 0
+        self.harvested_rowid = 0
+        self._signature = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, number: object) -> bool:
+        """Whether a number (in any format phones.normalize accepts) is suppressed."""
+        digits = phones.normalize(number) if not isinstance(number, int) else number
+        if not digits:
+            return False
+        value = int(digits)
+        slots, bits = self._table
+        mask = (1 << bits) - 1
+        i = _slot(value, bits)
+        while True:
+            slot = slots[i]
+            if slot == value:
+                return True
+            if not slot:
+                return False
+            i = (i + 1) & mask
+
+    def __iter__(self) -> Iterator[int]:
+        return (slot for slot in self._table[0] if slot)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_ino, stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def load(self) -> "SuppressionList":
+        """(Re)read the file; a missing file is an empty list."""
+        with self._lock:
+            self._load()
+        return self
+
+    def _load(self) -> None:
+        signature = self._file_signature()
+        if signature is None:
+            self._table = (array("Q", bytes(8 * MIN_SLOTS)), MIN_SLOTS.bit_length() - 1)
+            self._count, self.harvested_rowid = 0, 0
+        else:
+            with open(self.path, "rb") as f:
+                header = f.read(32)
+                if len(header) != 32 or header[:8] != MAGIC:
+                    raise ValueError(f"{self.path} is not a suppression list")
+                count, rowid, size = (int.from_bytes(header[i:i + 8], "little") for i in (8, 16, 24))
+                # A truncated or padded file would otherwise load as a wrong table or raise EOFError
+                if size < MIN_SLOTS or size & (size - 1) or os.fstat(f.fileno()).st_size != 32 + 8 * size:
+                    raise ValueError(f"{self.path} is truncated or corrupt")
+                slots = array("Q")
+                slots.fromfile(f, size)
+            if sys.byteorder == "big":
+                slots.byteswap()
+            self._table, self._count, self.harvested_rowid = (slots, size.bit_length() - 1), count, rowid
+        self._signature = signature
+
+    def refresh(self) -> None:
+        """Reload if another process replaced the file since it was read."""
+        if self._file_signature() != self._signature:
+            self.load()
+
+    def _save(self, numbers: Set[int]) -> None:
+        self._write(*_table(numbers), len(numbers))
+
+    def _write(self, slots: array, bits: int, count: int) -> None:
+        """Replace the file with these slots and use them from now on."""
+        header = MAGIC + b"".join(value.to_bytes(8, "little") for value in (count, self.harvested_rowid, 1 << bits))
+        if sys.byteorder == "big":
+            slots.byteswap()
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(header)
+            slots.tofile(f)
+        os.replace(temporary, self.path)
+        if sys.byteorder == "big":
+            slots.byteswap()
+        self._table, self._count = (slots, bits), count
+        self._signature = self._file_signature()
+
+    def _write_rowid(self) -> None:
+        """Record a new harvest position without rewriting the slots."""
+        with open(self.path, "r+b") as f:
+            f.seek(16)
+            f.write(self.harvested_rowid.to_bytes(8, "little"))
+        self._signature = self._file_signature()
+
+    def update(self, add: Iterable[object] = (), remove: Iterable[object] = (), harvested_rowid: Optional[int] = None) -> Tuple[int, int]:
+        """Add and remove numbers and write the file.
+
+        Additions that fit are inserted into a copy of the table; removals
+        and growth rebuild it.
+
+        Returns:
+            (numbers added, numbers removed), not counting no-ops
+        """
+        with self._lock:
+            # Start from the latest file, so concurrent writers don't lose each other's changes
+            if self._file_signature() != self._signature:
+                self._load()
+            removing = {int(digits) for digits in map(phones.normalize, remove) if digits}
+            adding = {int(digits) for digits in map(phones.normalize, add) if digits} - removing
+            adding = {number for number in adding if number not in self}
+            removing = {number for number in removing if number in self}
+            if harvested_rowid is not None:
+                self.harvested_rowid = max(self.harvested_rowid, harvested_rowid)
+
+            current, bits = self._table
+            if removing or (self._count + len(adding)) * 2 > len(current):
+                self._save((set(self) | adding) - removing)
+            elif adding or self._signature is None:
+                slots = array("Q", current)
+                mask = len(slots) - 1
+                for number in adding:
+                    i = _slot(number, bits)
+                    while slots[i]:
+                        i = (i + 1) & mask
+                    slots[i] = number
+                self._write(slots, bits, self._count + len(adding))
+            elif harvested_rowid is not None:
+                self._write_rowid()
+            return len(adding), len(removing)
+
+    def add(self, numbers: Iterable[object]) -> int:
+        return self.update(add=numbers)[0]
+
+    def remove(self, numbers: Iterable[object]) -> int:
+        return self.update(remove=numbers)[1]
+
+    def harvest(self, db_path: str) -> Tuple[int, int]:
+        """Apply STOP / START replies received since the last harvest.
+
+        Returns:
+            (numbers opted out, numbers opted back in)
+        """
+        self.refresh()
+        latest = db.fetchone(db_path, "SELECT MAX(rowid) FROM messages")[0] or 0
+        if latest <= self.harvested_rowid:
+            return 0, 0
+        rows = db.fetchall(db_path, f"""
+            SELECT sender, content FROM messages
+            WHERE rowid > ? AND rowid <= ? AND is_from_me = 0
+            AND chat_jid NOT LIKE '%@{phones.GROUP_SERVER}'
+            AND length(content) <= ?
+            ORDER BY rowid
+        """, (self.harvested_rowid, latest, MAX_KEYWORD_LENGTH))
+        # The latest reply from each number decides
+        decisions: Dict[str, bool] = {}
+        for sender, content in rows:
+            keyword = _keyword(content or "")
+            digits = phones.normalize(sender) if sender else None
+            if digits and (keyword in STOP_KEYWORDS or keyword in START_KEYWORDS):
+                decisions[digits] = keyword in STOP_KEYWORDS
+        return self.update(
+            add=[digits for digits, stop in decisions.items() if stop],
+            remove=[digits for digits, stop in decisions.items() if not stop],
+            harvested_rowid=latest
+        )
+
+def filter_recipients(numbers: Iterable[object], suppressed: SuppressionList) -> Tuple[List[str], List[Dict[str, str]]]:
+    """Split raw numbers into normalized ones to send to and the ones to skip.
+
+    Returns:
+        (numbers to send to, in order, without duplicates;
+         skipped entries as {"phone_number", "reason"}, reason being
+         "invalid", "duplicate" or "opted_out")
+    """
+    send: List[str] = []
+    skipped: List[Dict[str, str]] = []
+    seen: Set[str] = set()
+    for raw in numbers:
+        digits = phones.normalize(raw)
+        if not digits:
+            skipped.append({"phone_number": str(raw), "reason": "invalid"})
+        elif digits in seen:
+            skipped.append({"phone_number": digits, "reason": "duplicate"})
+        elif digits in suppressed:
+            skipped.append({"phone_number": digits, "reason": "opted_out"})
+        else:
+            send.append(digits)
+        seen.add(digits)
+    return send, skipped
+
+if __name__ == "__main__":
+    from whatsapp import MESSAGES_DB_PATH, SUPPRESSION
+
+    command, arguments = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("", [])
+    SUPPRESSION.load()
+    if command == "add" and arguments:
+        print(f"Added {SUPPRESSION.add(arguments)} numbers ({len(SUPPRESSION)} suppressed)")
+    elif command == "remove" and arguments:
+        print(f"Removed {SUPPRESSION.remove(arguments)} numbers ({len(SUPPRESSION)} suppressed)")
+    elif command == "check" and arguments:
+        for number in arguments:
+            print(f"{number}: {'opted out' if number in SUPPRESSION else 'ok'}")
+    elif command == "import" and len(arguments) == 1:
+        with open(arguments[0], encoding="utf-8") as f:
+            added = SUPPRESSION.add(line.strip() for line in f if line.strip())
+        print(f"Added {added} numbers ({len(SUPPRESSION)} suppressed)")
+    elif command == "harvest" and len(arguments) <= 1:
+        stopped, started = SUPPRESSION.harvest(arguments[0] if arguments else MESSAGES_DB_PATH)
+        print(f"{stopped} opted out, {started} opted back in ({len(SUPPRESSION)} suppressed)")
+    elif command == "count" and not arguments:
+        print(len(SUPPRESSION))
+    else:
+        print("Usage: python suppression.py [add|remove|check] <number>... | import <file> | harvest [db_path] | count")
+        sys.exit(1)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Generate synthetic messages.db files for benchmarking the query layer.
+
+The schema mirrors `NewMessageStore` in whatsapp-bridge/main.go and the
+timestamps are written in the same text format the bridge's SQLite driver
+uses, so every query in whatsapp.py sees realistic data.
+
+The distributions follow a typical account: chat activity is heavily
+skewed (Zipf-like, a few chats carry most of the traffic), about one chat
+in ten is a group whose members are drawn from the contact list, outgoing
+messages come from the account's own number, and gaps between messages
+are exponential over a two-year span. Output is deterministic for a given
+seed and size.
+
+Usage: python synthetic_db.py [small|medium|large|<messages>] [db_path] [--chats N] [--seed N]
+"""
+
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+# Preset sizes: name -> (messages, chats)
+SIZES: Dict[str, Tuple[int, int]] = {
+    "small": (10_000, 200),
+    "medium": (1_000_000, 5_000),
+    "large": (10_000_000, 20_000),
+}
+
+# The account's own number, the sender of every outgoing message
+OWN_NUMBER = "919000000001"
+# Messages are spread over this many days before END_TIME
+SPAN_DAYS = 730
+END_TIME = datetime(2025, 1, 1, tzinfo=timezone(timedelta(hours=5, minutes=30)))
+
+FIRST_NAMES = (
+    "Aarav Aditi Akash Amit Ananya Anjali Arjun Ayesha Deepak Divya Farhan Gaurav Ishaan Kavya Karan "
+    "Lakshmi Manish Meera Mohit Nandini Neha Nikhil Pooja Pradeep Priya Rahul Rajesh Ravi Rohan Sakshi "
+    "Sanjay Shreya Siddharth Sneha Sunita Tanvi Varun Vikram Yash Zoya"
+).split()
+LAST_NAMES = (
+    "Agarwal Bhat Chopra Das Desai Gupta Iyer Jain Joshi Kapoor Khan Kulkarni Kumar Mehta Menon Mishra "
+    "Nair Pandey Patel Pillai Rao Reddy Saxena Shah Sharma Singh Sinha Srinivasan Thakur Verma"
+).split()
+
+# Keep in sync with NewMessageStore in whatsapp-bridge/main.go
+BRIDGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    jid TEXT PRIMARY KEY,
+    name TEXT,
+    last_message_time TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT,
+    chat_jid TEXT,
+    sender TEXT,
+    content TEXT,
+    timestamp TIMESTAMP,
+    is_from_me BOOLEAN,
+    PRIMARY KEY (id, chat_jid),
+    FOREIGN KEY (chat_jid) REFERENCES chats(jid)
+);
+"""
+
+# go-sqlite3 stores time.Time values as "2006-01-02 15:04:05.999999999-07:00"
+BRIDGE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S%z"
+
+WORDS = (
+    "hello hi ok thanks meeting tomorrow today class zoom link please call "
+    "kathak dance math course free join group video youtube certificate "
+    "time week evening morning yes no sure great done sent received photo"
+).split()
+
+def format_bridge_time(value: datetime) -> str:
+    """Format a datetime the way the Go bridge stores it."""
+    text = value.strftime(BRIDGE_TIME_FORMAT)
+    # strftime gives +0530, the bridge writes +05:30
+    return f"{text[:-2]}:{text[-2:]}"
+
+def _contacts(rng: random.Random, count: int) -> List[Tuple[str, str]]:
+    """Distinct (phone, name) pairs; some contacts share a name, as in real address books."""
+    phones = set()
+    result = []
+    while len(result) < count:
+        phone = f"91{rng.randrange(6000000000, 9999999999)}"
+        if phone in phones or phone == OWN_NUMBER:
+            continue
+        phones.add(phone)
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        # Saved without a surname, or not saved at all (the bridge then uses the number)
+        roll = rng.random()
+        if roll < 0.1:
+            name = name.split()[0]
+        elif roll < 0.15:
+            name = phone
+        result.append((phone, name))
+    return result
+
+def _chats(rng: random.Random, chats: int) -> List[Tuple[str, str, List[str]]]:
+    """Build (jid, name, possible senders) for each chat; about one in ten is a group."""
+    groups = chats // 10
+    contacts = _contacts(rng, chats - groups)
+    result = [(f"{phone}@s.whatsapp.net", name, [phone]) for phone, name in contacts]
+    phones = [phone for phone, _ in contacts]
+    for index in range(groups):
+        # Group sizes are skewed too: most are small, a few are large
+        size = min(len(phones), max(3, int(rng.paretovariate(1.2) * 4)))
+        members = rng.sample(phones, size)
+        result.append((f"1203630{index:08d}@g.us", f"Group {rng.choice(LAST_NAMES)} {index}", members))
+    rng.shuffle(result)
+    return result
+
+def generate(
+    db_path: str,
+    messages: int = 10_000,
+    chats: int = 200,
+    seed: int = 0,
+    batch_size: int = 10_000
+) -> str:
+    """Write a deterministic synthetic messages.db.
+
+    Args:
+        db_path: Where to create the database (an existing file is replaced)
+        messages: Number of messages to generate
+        chats: Number of chats the messages are spread over
+        seed: Random seed; the same arguments always produce the same file
+        batch_size: Rows inserted per executemany batch
+
+    Returns:
+        The path of the generated database
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    rng = random.Random(seed)
+    chat_list = _chats(rng, chats)
+    # Zipf-like activity over a random ranking of the chats
+    cumulative = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(chat_list))))
+    total_weight = cumulative[-1]
+    mean_gap = SPAN_DAYS * 86400 / max(messages, 1)
+    clock = END_TIME - timedelta(days=SPAN_DAYS)
+    last_seen = {}
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executescript(BRIDGE_SCHEMA)
+        conn.execute("PRAGMA synchronous = OFF")
+        rows = []
+        for index in range(messages):
+            clock += timedelta(seconds=int(rng.expovariate(1 / mean_gap)))
+            jid, _, members = chat_list[bisect.bisect(cumulative, rng.random() * total_weight)]
+            is_from_me = rng.random() < 0.3
+            sender = OWN_NUMBER if is_from_me else rng.choice(members)
+            content = " ".join(rng.choice(WORDS) for _ in range(int(rng.paretovariate(1.5) * 3)))
+            stamp = format_bridge_time(clock)
+            rows.append((f"MSG{index:010d}", jid, sender, content, stamp, is_from_me))
+            last_seen[jid] = stamp
+            if len(rows) >= batch_size:
+                conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", rows)
+                rows = []
+        if rows:
+            conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        conn.executemany(
+            "INSERT INTO chats (jid, name, last_message_time) VALUES (?, ?, ?)",
+            [(jid, name, last_seen.get(jid)) for jid, name, _ in chat_list]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return db_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic messages.db")
+    parser.add_argument("size", help=f"One of {', '.join(SIZES)} or a number of messages")
+    parser.add_argument("db_path", nargs="?", help="Output path (default: synthetic-<size>.db)")
+    parser.add_argument("--chats", type=int, help="Number of chats (default: from the size preset)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    if args.size in SIZES:
+        messages, chats = SIZES[args.size]
+    else:
+        messages, chats = int(args.size), max(10, int(args.size) // 200)
+    chats = args.chats or chats
+    path = args.db_path or f"synthetic-{args.size}.db"
+    generate(path, messages=messages, chats=chats, seed=args.seed)
+    print(f"Wrote {messages} messages in {chats} chats to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""Cold start checks of the MCP server, the same ones `benchmark.py startup` fails on.
+
+Run with `python -m pytest test_startup.py` from this directory.
+"""
+
+import statistics
+
+from benchmark import LAZY_MODULES, STARTUP_BASELINE, STARTUP_BUDGET_MS, eagerly_imported, import_times
+
+# Fresh interpreters to take the median over, so one slow start doesn't fail the check
+STARTUP_RUNS = 3
+
+def test_heavy_modules_are_imported_lazily():
+    assert eagerly_imported("main", LAZY_MODULES) == []
+
+def test_import_main_within_budget():
+    runs = [import_times(STARTUP_BASELINE, "main")["main"][1] / 1000 for _ in range(STARTUP_RUNS)]
+    assert statistics.median(runs) <= STARTUP_BUDGET_MS, f"import main took {runs} ms after {STARTUP_BASELINE}"
@@ -0,0 +1,132 @@
+"""Run blocking tool work off the MCP server's event loop.
+
+FastMCP runs synchronous tools directly on its event loop, so one slow
+query or a hung request to the bridge stalls every other tool call. The
+tools in main.py are async instead and hand their blocking work to
+`run_tool`. It runs the work on one of two bounded thread pools: one for
+SQLite reads and one for calls to the bridge's HTTP API, so a stuck send
+cannot starve the readers (a third one holds long polls). It also enforces a timeout per call.
+
+When a database call times out, the SQLite statements running on its
+worker thread are interrupted, which frees the worker (and the read lock)
+right away. Work that waits between statements (long polls) can be handed
+the call's cancellation event and return once it is set. HTTP calls cannot
+be interrupted; the caller gets the timeout and the worker finishes the
+request in the background.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import db
+
+# Worker threads per pool. SQLite releases the GIL while it steps a
+# statement, so reads on separate pooled connections really overlap.
+DB_WORKERS = 4
+HTTP_WORKERS = 2
+# Long polls (wait_for_messages) mostly sleep, so they get their own
+# pool and never hold up the readers
+WAIT_WORKERS = 8
+
+DB_POOL = "db"
+HTTP_POOL = "http"
+WAIT_POOL = "wait"
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+class ToolTimeout(TimeoutError):
+    """A tool call did not finish within its timeout."""
+
+class _Call:
+    """Tracks which worker is running a call, so it can be interrupted."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = False
+        self.done = False
+        self.connections: Optional[Dict] = None
+        # Set once the caller gave up on the call
+        self.cancelled = threading.Event()
+
+    def interrupt(self) -> None:
+        """Abort the SQLite statements of the call, if it is still running."""
+        with self.lock:
+            self.done = True
+            self.cancelled.set()
+            if not self.running:
+                return
+            for conn in list(self.connections.values()):
+                try:
+                    conn.interrupt()
+                except Exception:
+                    pass
+
+def _executor(pool: str) -> ThreadPoolExecutor:
+    with _pools_lock:
+        executor = _pools.get(pool)
+        if executor is None:
+            workers = {HTTP_POOL: HTTP_WORKERS, WAIT_POOL: WAIT_WORKERS}.get(pool, DB_WORKERS)
+            executor = _pools[pool] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"mcp-{pool}")
+        return executor
+
+def _run(call: _Call, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    with call.lock:
+        if call.done:
+            # Timed out while still queued; don't start the work at all
+            raise ToolTimeout("Cancelled before it started")
+        call.running = True
+        call.connections = db.thread_connections()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        with call.lock:
+            call.running = False
+
+async def run_tool(name: str, fn: Callable[..., Any], *args, timeout: Optional[float], pool: str = DB_POOL,
+                   cancel_arg: Optional[str] = None, **kwargs) -> Any:
+    """Run fn(*args, **kwargs) on a worker thread and await its result.
+
+    Args:
+        name: Tool name, used in the timeout message
+        fn: The blocking function to run
+        timeout: Seconds to wait, including time spent queued for a worker
+                 (None to wait indefinitely)
+        pool: DB_POOL for SQLite reads, HTTP_POOL for calls to the bridge,
+              WAIT_POOL for long polls
+        cancel_arg: Keyword argument of fn to pass a threading.Event in,
+                    set when the call times out or is cancelled
+
+    Raises:
+        ToolTimeout: If fn does not finish in time. The call is cancelled
+        if it has not started yet, and its SQLite statements are
+        interrupted if it has. The same happens when the awaiting task is
+        cancelled (e.g. the client cancels the request).
+    """
+    call = _Call()
+    if cancel_arg:
+        kwargs[cancel_arg] = call.cancelled
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor(pool), _run, call, fn, args, kwargs)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        if future.done() and not future.cancelled():
+            # fn raised TimeoutError itself
+            raise
+        call.interrupt()
+        raise ToolTimeout(f"{name} timed out after {timeout:g}s") from None
+    except asyncio.CancelledError:
+        call.interrupt()
+        raise
+
+def shutdown() -> None:
+    """Stop the worker pools (waiting for running calls) and close their connections."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for executor in pools:
+        executor.shutdown(wait=True, cancel_futures=True)
+    db.close_connections()
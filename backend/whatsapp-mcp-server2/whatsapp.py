@@ -1,28 +1,91 @@
 import sqlite3
+import threading
+import time
 from datetime import datetime
+from contextlib import closing
 from dataclasses import dataclass
-from typing import Optional, List, Tuple
+from typing import Any, Callable, Dict, Iterator, Optional, List, Sequence, Tuple
 import os.path
-import requests
 import json
 import mimetypes
 import base64
 import subprocess
+import sys
+import bridge_status
+import db
+import fts
+import phones
+import query_log
+import schema
+from contact_index import ContactIndex
+from result_cache import ResultCache, cached
+from suppression import SuppressionList
+
+# Rows per query when streaming with iter_messages
+ITER_WINDOW_ROWS = 50_000
+# Default page size of get_new_messages
+FEED_LIMIT = 100
+# wait_for_messages: how often the store's files are checked for changes, how
+# often the database is queried regardless, and the longest allowed wait
+WAIT_POLL_SECONDS = 0.05
+WAIT_RECHECK_SECONDS = 1.0
+MAX_WAIT_SECONDS = 300.0
+# Rows read at a time while filling a max_bytes budget, so the query stops soon after it is spent
+BUDGET_BATCH_ROWS = 16
 
 MESSAGES_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'whatsapp-bridge', 'store', 'messages.db')
-WHATSAPP_API_BASE_URL = "http://localhost:9090/api"
+WHATSAPP_API_BASE_URL = bridge_status.WHATSAPP_API_BASE_URL
+# (connect, read) seconds for requests to the bridge, so a hung bridge can't hold a worker forever
+HTTP_TIMEOUT = (3, 30)
+
+# Results of the hot read functions, dropped whenever the database changes
+RESULT_CACHE = ResultCache()
+_cached = cached(RESULT_CACHE, lambda: MESSAGES_DB_PATH)
+# Names and numbers of personal chats, for search_contacts
+CONTACT_INDEX = ContactIndex()
+# Numbers that opted out, harvested from STOP replies; checked before every send
+SUPPRESSION_LIST_PATH = os.path.join(os.path.dirname(MESSAGES_DB_PATH), 'suppression.bin')
+SUPPRESSION = SuppressionList(SUPPRESSION_LIST_PATH)
+# Slow-query log, off unless WHATSAPP_QUERY_LOG is set
+query_log.enable_from_env()
 
-@dataclass
+# Message fields are in the order of _MESSAGE_COLUMNS, so a row maps straight onto one
+@dataclass(slots=True)
 class Message:
-    timestamp: datetime
+    ts_epoch: int
     sender: str
+    chat_name: Optional[str]
     content: str
     is_from_me: bool
     chat_jid: str
     id: str
-    chat_name: Optional[str] = None
+    snippet: Optional[str] = None
+    cursor: Optional[str] = None
+
+    @property
+    def timestamp(self) -> datetime:
+        """When the message was sent, decoded from ts_epoch on access."""
+        return _from_epoch(self.ts_epoch)
+
+    def to_dict(self, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """The message as a plain dict, with the decoded timestamp (for MCP responses).
 
-@dataclass
+        With `fields`, only those keys (MESSAGE_FIELDS) and the cursor.
+        """
+        result = {
+            "timestamp": self.timestamp,
+            "sender": self.sender,
+            "content": self.content,
+            "is_from_me": self.is_from_me,
+            "chat_jid": self.chat_jid,
+            "id": self.id,
+            "chat_name": self.chat_name,
+            "snippet": self.snippet,
+            "cursor": self.cursor,
+        }
+        return {field: result[field] for field in (*fields, "cursor")} if fields else result
+
+@dataclass(slots=True)
 class Chat:
     jid: str
     name: Optional[str]
@@ -30,24 +93,168 @@ class Chat:
     last_message: Optional[str] = None
     last_sender: Optional[str] = None
     last_is_from_me: Optional[bool] = None
+    last_message_id: Optional[str] = None
+    message_count: Optional[int] = None
+    unread_count: Optional[int] = None
+    cursor: Optional[str] = None
 
     @property
     def is_group(self) -> bool:
         """Determine if chat is a group based on JID pattern."""
         return self.jid.endswith("@g.us")
 
-@dataclass
+    def to_dict(self, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """The chat as a plain dict (for MCP responses); with `fields`, only those keys (CHAT_FIELDS) and the cursor."""
+        result = {
+            "jid": self.jid,
+            "name": self.name,
+            "last_message_time": self.last_message_time,
+            "last_message": self.last_message,
+            "last_sender": self.last_sender,
+            "last_is_from_me": self.last_is_from_me,
+            "last_message_id": self.last_message_id,
+            "message_count": self.message_count,
+            "unread_count": self.unread_count,
+            "cursor": self.cursor,
+        }
+        return {field: result[field] for field in (*fields, "cursor")} if fields else result
+
+@dataclass(slots=True)
 class Contact:
     phone_number: str
     name: Optional[str]
     jid: str
 
-@dataclass
+@dataclass(slots=True)
 class MessageContext:
     message: Message
     before: List[Message]
     after: List[Message]
 
+    def to_dict(self) -> Dict[str, Any]:
+        """The context as plain dicts (for MCP responses)."""
+        return {
+            "message": self.message.to_dict(),
+            "before": [msg.to_dict() for msg in self.before],
+            "after": [msg.to_dict() for msg in self.after],
+        }
+
+@dataclass(slots=True)
+class MessageFeed:
+    messages: List[Message]
+    # Pass back as since_cursor to continue after these messages
+    cursor: Optional[str]
+    # More new messages are waiting beyond `limit`; call again right away
+    has_more: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The feed as plain dicts (for MCP responses)."""
+        return {
+            "messages": [msg.to_dict() for msg in self.messages],
+            "cursor": self.cursor,
+            "has_more": self.has_more,
+        }
+
+# Columns selected for a Message, in field order; queries join chats for the name
+_MESSAGE_COLUMNS = "messages.ts_epoch, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id"
+
+def _message_row(cursor: sqlite3.Cursor, row: Tuple) -> Message:
+    """sqlite3 row factory for queries selecting _MESSAGE_COLUMNS."""
+    return Message(*row)
+
+# Keys of Message.to_dict and Chat.to_dict, for `fields` projections
+MESSAGE_FIELDS = ("timestamp", "sender", "content", "is_from_me", "chat_jid", "id", "chat_name", "snippet", "cursor")
+CHAT_FIELDS = (
+    "jid", "name", "last_message_time", "last_message", "last_sender", "last_is_from_me",
+    "last_message_id", "message_count", "unread_count", "cursor"
+)
+
+def _check_fields(fields: Optional[Sequence[str]], known: Tuple[str, ...]) -> Optional[Tuple[str, ...]]:
+    """Validate a `fields` projection; None (or empty) means every field."""
+    if not fields:
+        return None
+    unknown = [field for field in fields if field not in known]
+    if unknown:
+        raise ValueError(f"Unknown fields {unknown}, choose from {list(known)}")
+    return tuple(fields)
+
+def _truncated(column: str, max_length: Optional[int]) -> str:
+    """SQL for a text column cut to max_length characters, ending in … when cut."""
+    if max_length is None:
+        return column
+    if max_length < 1:
+        raise ValueError(f"max_content_length must be at least 1, got {max_length}")
+    n = int(max_length)
+    return f"CASE WHEN length({column}) > {n} THEN substr({column}, 1, {n}) || '…' ELSE {column} END"
+
+def _message_columns(fields: Optional[Sequence[str]], max_content_length: Optional[int], table: str = "messages") -> str:
+    """_MESSAGE_COLUMNS for messages aliased `table`, projected and truncated in SQL.
+
+    Fields left out of `fields` are selected as NULL, so long content is
+    never read into Python. The timestamp, chat JID and id are always
+    selected: cursors and context windows need them.
+    """
+    def wanted(field: str) -> bool:
+        return fields is None or field in fields
+
+    return ", ".join([
+        f"{table}.ts_epoch",
+        f"{table}.sender" if wanted("sender") else "NULL",
+        "chats.name" if wanted("chat_name") else "NULL",
+        _truncated(f"{table}.content", max_content_length) if wanted("content") else "NULL",
+        f"{table}.is_from_me" if wanted("is_from_me") else "NULL",
+        "chats.jid",
+        f"{table}.id",
+    ])
+
+def _json_size(item: Dict[str, Any]) -> int:
+    """Bytes of item as JSON, about what an MCP client receives for it."""
+    return len(json.dumps(item, default=str))
+
+def _fetch_within_budget(sql: str, params: Tuple, build: Callable[[Tuple], Any],
+                         fields: Optional[Sequence[str]], max_bytes: int) -> List[Any]:
+    """Build items from a query's rows until their to_dict(fields) JSON would exceed max_bytes.
+
+    Rows are read a few at a time and the statement is closed once the
+    budget is spent, so the rest of the result is never fetched. The first
+    item is always returned, so a listing can always move on.
+    """
+    schema.ensure_schema(MESSAGES_DB_PATH)
+    items = []
+    used = 0
+    with closing(db.iterate(MESSAGES_DB_PATH, sql, params, batch_size=BUDGET_BATCH_ROWS)) as rows:
+        for row in rows:
+            item = build(row)
+            used += _json_size(item.to_dict(fields))
+            if items and used > max_bytes:
+                break
+            items.append(item)
+    return items
+
+def _trim_to_budget(messages: List[Message], matches: List[Message],
+                    fields: Optional[Sequence[str]], max_bytes: int) -> List[Message]:
+    """Cut a listing with context windows to max_bytes of JSON, keeping at least the first match.
+
+    Matches past the cut are listed again on the next page. A merged window
+    can keep a match that sorts after one that was cut; cursors are cleared
+    from the first cut match on, so the last cursor left never skips it.
+    """
+    is_match = {id(match) for match in matches}
+    kept = []
+    used = 0
+    kept_match = False
+    for message in messages:
+        used += _json_size(message.to_dict(fields))
+        if kept_match and used > max_bytes:
+            break
+        kept.append(message)
+        kept_match = kept_match or id(message) in is_match
+    kept_ids = {id(message) for message in kept}
+    first_cut = next((index for index, match in enumerate(matches) if id(match) not in kept_ids), len(matches))
+    for match in matches[first_cut:]:
+        match.cursor = None
+    return kept
+
 def print_message(message: Message, show_chat_info: bool = True) -> None:
     """Print a single message with consistent formatting."""
     direction = "→" if message.is_from_me else "←"
@@ -130,49 +337,62 @@ CREATE TABLE chats (
 		)
 """
 
+def _encode_cursor(kind: str, *values) -> str:
+    """Build an opaque pagination token pointing just past a row."""
+    raw = json.dumps([kind, *values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(token: str, kind: str) -> list:
+    """Unpack a token made by _encode_cursor, checking it belongs to `kind`."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {token!r}")
+    if not isinstance(values, list) or not values or values[0] != kind:
+        raise ValueError(f"Cursor {token!r} does not belong to this listing")
+    return values[1:]
+
+def _to_epoch(value: datetime) -> int:
+    """Unix seconds for a datetime; naive datetimes are taken as local time."""
+    return int(value.timestamp())
+
+def _from_epoch(epoch: int) -> datetime:
+    """Local, timezone-aware datetime for a `messages.ts_epoch` value."""
+    return datetime.fromtimestamp(epoch).astimezone()
+
+def _fetchall(sql: str, params: Tuple = (), row_factory: Optional[db.RowFactory] = None) -> List[Any]:
+    """Run a read query on this thread's pooled connection to the message store.
+
+    The first query against a database applies the schema migrations
+    (indexes) from schema.py.
+    """
+    schema.ensure_schema(MESSAGES_DB_PATH)
+    return db.fetchall(MESSAGES_DB_PATH, sql, params, row_factory)
+
+def _fetchone(sql: str, params: Tuple = (), row_factory: Optional[db.RowFactory] = None) -> Optional[Any]:
+    """Run a read query on the pooled connection and return the first row."""
+    schema.ensure_schema(MESSAGES_DB_PATH)
+    return db.fetchone(MESSAGES_DB_PATH, sql, params, row_factory)
+
 def print_recent_messages(limit=10) -> List[Message]:
     try:
-        # Connect to the SQLite database
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
         # Query recent messages with chat info
-        query = """
-        SELECT 
-            m.timestamp,
-            m.sender,
-            c.name,
-            m.content,
-            m.is_from_me,
-            c.jid,
-            m.id
-        FROM messages m
-        JOIN chats c ON m.chat_jid = c.jid
-        ORDER BY m.timestamp DESC
+        query = f"""
+        SELECT {_MESSAGE_COLUMNS}
+        FROM messages
+        JOIN chats ON messages.chat_jid = chats.jid
+        ORDER BY messages.ts_epoch DESC, messages.rowid DESC
         LIMIT ?
         """
         
-        cursor.execute(query, (limit,))
-        messages = cursor.fetchall()
+        result = _fetchall(query, (limit,), _message_row)
         
-        if not messages:
+        if not result:
             print("No messages found in the database.")
             return []
             
-        result = []
-        
-        # Convert to Message objects
-        for msg in messages:
-            message = Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2] or "Unknown Chat",
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6]
-            )
-            result.append(message)
+        for message in result:
+            message.chat_name = message.chat_name or "Unknown Chat"
         
         # Print messages using helper function
         print_messages_list(result, title=f"Last {limit} messages:")
@@ -184,9 +404,6 @@ def print_recent_messages(limit=10) -> List[Message]:
     except Exception as e:
         print(f"Unexpected error: {e}")
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def list_messages(
@@ -198,200 +415,593 @@ def list_messages(
     page: int = 0,
     include_context: bool = True,
     context_before: int = 1,
-    context_after: int = 1
+    context_after: int = 1,
+    search_mode: str = "prefix",
+    rank_by_relevance: bool = False,
+    include_snippets: bool = False,
+    cursor: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+    max_content_length: Optional[int] = None,
+    max_bytes: Optional[int] = None
 ) -> List[Message]:
-    """Get messages matching the specified criteria with optional context."""
+    """Get messages matching the specified criteria with optional context.
+
+    Content searches (`query`) use the FTS5 index in fts.py. `search_mode`
+    controls how the query is interpreted (see fts.build_match_query; a raw
+    query that isn't valid FTS5 syntax raises ValueError),
+    `rank_by_relevance` orders matches by BM25 instead of recency and
+    `include_snippets` fills `Message.snippet` with the matching fragment,
+    matched terms wrapped in `**`. If the index can't be used, the query is
+    matched as a plain case-insensitive substring whatever the
+    `search_mode`, and there is no ranking or snippets.
+
+    Matched messages carry a `cursor` (context messages don't); pass the
+    last one back as `cursor` to get the next page. Unlike `page`, this seeks straight to the
+    (ts_epoch, rowid) position, so deep pages cost the same as the first
+    and rows inserted meanwhile don't shift the results. `page` is ignored
+    when a cursor is given. Cursors are not available with
+    `rank_by_relevance`.
+
+    `fields` (MESSAGE_FIELDS) and `max_content_length` are applied in the
+    SELECT: left-out fields stay None and long content is cut in SQL,
+    ending in "…". With `max_bytes`, messages are read until the JSON of
+    their to_dict(fields) reaches that size, so fewer than `limit` may be
+    returned; the last cursor in the result continues the listing.
+    """
+    if cursor and rank_by_relevance:
+        raise ValueError("cursor pagination is not supported with rank_by_relevance, use page")
+    if max_bytes is not None and rank_by_relevance:
+        raise ValueError("max_bytes is not supported with rank_by_relevance, lower the limit instead")
+    fields = _check_fields(fields, MESSAGE_FIELDS)
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
+        use_fts, source, where_clauses, params = _message_filters(date_range, sender_phone_number, chat_jid, query, search_mode)
+
         # Build base query
-        query_parts = ["SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id FROM messages"]
-        query_parts.append("JOIN chats ON messages.chat_jid = chats.jid")
-        where_clauses = []
-        params = []
-        
-        # Add filters
-        if date_range:
-            where_clauses.append("messages.timestamp BETWEEN ? AND ?")
-            params.extend([date_range[0].isoformat(), date_range[1].isoformat()])
-            
-        if sender_phone_number:
-            where_clauses.append("messages.sender = ?")
-            params.append(sender_phone_number)
-            
-        if chat_jid:
-            where_clauses.append("messages.chat_jid = ?")
-            params.append(chat_jid)
+        # Message fields (snippet included), then the rowid for the cursor
+        with_snippet = use_fts and include_snippets and (fields is None or "snippet" in fields)
+        snippet = f"snippet({fts.FTS_TABLE}, 0, '**', '**', '…', 12)" if with_snippet else "NULL"
+        columns = _message_columns(fields, max_content_length)
+        query_parts = [f"SELECT {columns}, {snippet}, messages.rowid FROM {source}"]
             
-        if query:
-            where_clauses.append("LOWER(messages.content) LIKE LOWER(?)")
-            params.append(f"%{query}%")
+        if cursor:
+            position = _decode_cursor(cursor, "message")
+            if not all(isinstance(value, int) for value in position):
+                raise ValueError(f"Cursor {cursor!r} predates epoch timestamps, restart the listing without it")
+            where_clauses.append("(messages.ts_epoch, messages.rowid) < (?, ?)")
+            params.extend(position)
             
         if where_clauses:
             query_parts.append("WHERE " + " AND ".join(where_clauses))
             
         # Add pagination
-        offset = page * limit
-        query_parts.append("ORDER BY messages.timestamp DESC")
+        offset = 0 if cursor else page * limit
+        ranked = use_fts and rank_by_relevance
+        if ranked:
+            query_parts.append(f"ORDER BY bm25({fts.FTS_TABLE}), messages.ts_epoch DESC")
+        else:
+            query_parts.append("ORDER BY messages.ts_epoch DESC, messages.rowid DESC")
         query_parts.append("LIMIT ? OFFSET ?")
         params.extend([limit, offset])
         
-        cursor.execute(" ".join(query_parts), tuple(params))
-        messages = cursor.fetchall()
-        
-        result = []
-        for msg in messages:
-            message = Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6]
-            )
-            result.append(message)
+        def build(msg: Tuple) -> Message:
+            return Message(*msg[:8], cursor=None if ranked else _encode_cursor("message", msg[0], msg[8]))
+
+        if max_bytes is None:
+            result = [build(msg) for msg in _fetchall(" ".join(query_parts), tuple(params))]
+        else:
+            result = _fetch_within_budget(" ".join(query_parts), tuple(params), build, fields, max_bytes)
             
         if include_context and result:
-            # Add context for each message
-            messages_with_context = []
-            for msg in result:
-                context = get_message_context(msg.id, context_before, context_after)
-                messages_with_context.extend(context.before)
-                messages_with_context.append(context.message)
-                messages_with_context.extend(context.after)
-            return messages_with_context
+            # Fetch every context window in one query instead of one per match
+            with_context = _with_context_windows(
+                result, context_before, context_after, _message_columns(fields, max_content_length, "m")
+            )
+            if max_bytes is None:
+                return with_context
+            return _trim_to_budget(with_context, result, fields, max_bytes)
             
         return result
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
+def _message_filters(
+    date_range: Optional[Tuple[datetime, datetime]],
+    sender_phone_number: Optional[str],
+    chat_jid: Optional[str],
+    query: Optional[str],
+    search_mode: str
+) -> Tuple[bool, str, List[str], list]:
+    """Translate the list_messages filters into SQL.
+
+    Returns:
+        (whether the FTS index is used, FROM clause joining messages and
+        chats, WHERE conditions, their parameters)
+    """
+    match_query = fts.build_match_query(query, search_mode) if query else ""
+    use_fts = bool(match_query) and _sync_search_index()
+    if use_fts and search_mode == "raw":
+        fts.check_match_query(MESSAGES_DB_PATH, match_query)
+    if use_fts:
+        source = f"{fts.FTS_TABLE} JOIN messages ON messages.rowid = {fts.FTS_TABLE}.rowid"
+    else:
+        source = "messages"
+    source += " JOIN chats ON messages.chat_jid = chats.jid"
+    where_clauses = []
+    params = []
+    
+    if date_range:
+        where_clauses.append("messages.ts_epoch BETWEEN ? AND ?")
+        params.extend([_to_epoch(date_range[0]), _to_epoch(date_range[1])])
+        
+    if sender_phone_number:
+        where_clauses.append("messages.sender = ?")
+        params.append(sender_phone_number)
+        
+    if chat_jid:
+        where_clauses.append("messages.chat_jid = ?")
+        params.append(chat_jid)
+        
+    if use_fts:
+        where_clauses.append(f"{fts.FTS_TABLE} MATCH ?")
+        params.append(match_query)
+    elif query:
+        where_clauses.append("LOWER(messages.content) LIKE LOWER(?)")
+        params.append(f"%{query}%")
+    return use_fts, source, where_clauses, params
+
+def iter_messages(
+    date_range: Optional[Tuple[datetime, datetime]] = None,
+    sender_phone_number: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    query: Optional[str] = None,
+    search_mode: str = "prefix",
+    batch_size: int = 1000,
+    window_size: int = ITER_WINDOW_ROWS
+) -> Iterator[Message]:
+    """Stream every message matching the filters, oldest first, in constant memory.
+
+    Takes the same filters as list_messages. Rows are read with fetchmany
+    in `batch_size` chunks. The result is walked in keyset windows of
+    `window_size` rows, each a separate query, so the read lock is given
+    up between windows and the bridge can keep writing during a long
+    export. Messages written during the walk are included if they sort
+    after the current position.
+
+    Raises sqlite3.Error on database errors, unlike list_messages.
+    """
+    schema.ensure_schema(MESSAGES_DB_PATH)
+    _, source, where_clauses, params = _message_filters(date_range, sender_phone_number, chat_jid, query, search_mode)
+    position = None
+    while True:
+        clauses = list(where_clauses)
+        window_params = list(params)
+        if position:
+            clauses.append("(messages.ts_epoch, messages.rowid) > (?, ?)")
+            window_params.extend(position)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = db.iterate(
+            MESSAGES_DB_PATH,
+            f"""
+                SELECT {_MESSAGE_COLUMNS}, messages.rowid FROM {source}
+                {where}
+                ORDER BY messages.ts_epoch, messages.rowid
+                LIMIT ?
+            """,
+            (*window_params, window_size),
+            batch_size=batch_size
+        )
+        count = 0
+        for row in rows:
+            count += 1
+            position = (row[0], row[7])
+            yield Message(*row[:7])
+        if count < window_size:
+            return
+
+def _sync_search_index() -> bool:
+    """Bring the full-text index up to date; False if it can't be used."""
+    try:
+        fts.sync(MESSAGES_DB_PATH)
+        return True
+    except sqlite3.Error as e:
+        # stderr: searches run inside tool calls, while the MCP server owns stdout
+        print(f"Search index unavailable, falling back to a full scan: {e}", file=sys.stderr)
+        return False
+
+def _context_windows(targets: List[Tuple[str, Optional[str]]], before: int, after: int,
+                     columns: Optional[str] = None) -> List[Tuple]:
+    """Fetch the messages around each target message in one statement.
+
+    A chat's messages are ordered by (ts_epoch, rowid), so messages sharing
+    a timestamp keep a stable order and none are skipped. For each target,
+    two correlated subqueries walk the (chat_jid, ts_epoch) index `before`
+    rows back and `after` rows forward to find the window's first and last
+    row, and the window is then read as one index range. The cost is
+    O(log n + before + after) per target, however long the chat is.
+
+    Args:
+        targets: (message id, chat JID) pairs; with a chat JID of None the
+            message is looked up by id alone, taking the lowest chat JID if
+            the id occurs in several chats
+        before: Messages to include before each target
+        after: Messages to include after each target
+        columns: The Message columns of `m`, from _message_columns (default: all)
+
+    Returns:
+        Rows of (target index, side, *Message fields, rowid), where side is
+        -1 before the target, 0 for the target itself and 1 after it;
+        ordered by target, then chronologically. Targets that don't exist
+        have no rows.
+    """
+    columns = columns or _message_columns(None, None, "m")
+    return _fetchall(f"""
+        WITH targets AS MATERIALIZED (
+            SELECT json_each.key AS ordinal, messages.rowid AS row_id, messages.chat_jid, messages.ts_epoch
+            FROM json_each(?)
+            JOIN messages ON messages.rowid = (
+                SELECT rowid FROM messages
+                WHERE id = json_extract(json_each.value, '$[0]')
+                AND (json_extract(json_each.value, '$[1]') IS NULL OR chat_jid = json_extract(json_each.value, '$[1]'))
+                ORDER BY chat_jid
+                LIMIT 1
+            )
+        ),
+        bounds AS MATERIALIZED (
+            SELECT
+                t.ordinal,
+                t.row_id,
+                t.chat_jid,
+                t.ts_epoch,
+                COALESCE((
+                    SELECT row_id FROM (
+                        SELECT m.rowid AS row_id, m.ts_epoch AS ts FROM messages m
+                        WHERE m.chat_jid = t.chat_jid AND (m.ts_epoch, m.rowid) < (t.ts_epoch, t.row_id)
+                        ORDER BY m.ts_epoch DESC, m.rowid DESC
+                        LIMIT ?
+                    )
+                    ORDER BY ts, row_id
+                    LIMIT 1
+                ), t.row_id) AS first_row,
+                COALESCE((
+                    SELECT row_id FROM (
+                        SELECT m.rowid AS row_id, m.ts_epoch AS ts FROM messages m
+                        WHERE m.chat_jid = t.chat_jid AND (m.ts_epoch, m.rowid) > (t.ts_epoch, t.row_id)
+                        ORDER BY m.ts_epoch, m.rowid
+                        LIMIT ?
+                    )
+                    ORDER BY ts DESC, row_id DESC
+                    LIMIT 1
+                ), t.row_id) AS last_row
+            FROM targets t
+        )
+        SELECT
+            bounds.ordinal,
+            CASE
+                WHEN m.rowid = bounds.row_id THEN 0
+                WHEN (m.ts_epoch, m.rowid) < (bounds.ts_epoch, bounds.row_id) THEN -1
+                ELSE 1
+            END,
+            {columns}, m.rowid
+        FROM bounds
+        JOIN messages first_msg ON first_msg.rowid = bounds.first_row
+        JOIN messages last_msg ON last_msg.rowid = bounds.last_row
+        JOIN messages m ON m.chat_jid = bounds.chat_jid
+            AND (m.ts_epoch, m.rowid) >= (first_msg.ts_epoch, first_msg.rowid)
+            AND (m.ts_epoch, m.rowid) <= (last_msg.ts_epoch, last_msg.rowid)
+        JOIN chats ON chats.jid = bounds.chat_jid
+        ORDER BY bounds.ordinal, m.ts_epoch, m.rowid
+    """, (json.dumps(targets), before, after))
+
+def _with_context_windows(matches: List[Message], before: int, after: int, columns: Optional[str] = None) -> List[Message]:
+    """Expand matched messages with the messages around them, using one query.
+
+    Overlapping windows in the same chat are merged, so each message
+    appears once. Windows are emitted in the order of their first match,
+    each in chronological order.
+    """
+    rows = _context_windows([(msg.id, msg.chat_jid) for msg in matches], before, after, columns)
+    windows: List[List[Tuple]] = [[] for _ in matches]
+    for row in rows:
+        windows[row[0]].append(row)
+
+    # Merge windows that share a message into runs (union-find over message keys)
+    run_of = list(range(len(matches)))
+
+    def find(index: int) -> int:
+        while run_of[index] != index:
+            run_of[index] = run_of[run_of[index]]
+            index = run_of[index]
+        return index
+
+    owner = {}
+    for index, window in enumerate(windows):
+        for row in window:
+            key = (row[8], row[7])
+            if key in owner:
+                run_of[find(index)] = find(owner[key])
+            else:
+                owner[key] = index
+
+    matched = {(msg.id, msg.chat_jid): msg for msg in matches}
+    runs = {}
+    for index, window in enumerate(windows):
+        runs.setdefault(find(index), []).extend(window)
+
+    messages_with_context = []
+    emitted = set()
+    for index, match in enumerate(matches):
+        if not windows[index]:
+            # Match disappeared between the two queries; keep it without context
+            messages_with_context.append(match)
+            continue
+        run = find(index)
+        if run in emitted:
+            continue
+        emitted.add(run)
+        seen = set()
+        for row in sorted(runs[run], key=lambda row: (row[2], row[9])):
+            key = (row[8], row[7])
+            if key in seen:
+                continue
+            seen.add(key)
+            messages_with_context.append(matched.get(key) or Message(*row[2:9]))
+    return messages_with_context
+
+
+def get_new_messages(since_cursor: Optional[str] = None, chat_jid: Optional[str] = None, limit: int = FEED_LIMIT) -> MessageFeed:
+    """Get the messages stored after a cursor, oldest first.
+
+    The cursor is a rowid watermark: each call reads a range of the rowid
+    b-tree starting just past it, so polling costs as much as the traffic
+    since the last call, however large the archive. Without a cursor the
+    feed starts at the newest message: nothing is returned yet, only the
+    cursor to poll from. Messages the bridge stores again (INSERT OR
+    REPLACE) get a new rowid and show up again.
+
+    Args:
+        since_cursor: The `cursor` of the previous call
+        chat_jid: Only return messages of this chat
+        limit: Maximum number of messages to return, at least 1
+    """
+    if limit < 1:
+        raise ValueError(f"limit must be at least 1, got {limit}")
+    try:
+        latest = _fetchone("SELECT MAX(rowid) FROM messages")[0] or 0
+        position = latest
+        if since_cursor:
+            position, = _decode_cursor(since_cursor, "feed")
+            if not isinstance(position, int):
+                raise ValueError(f"Invalid cursor: {since_cursor!r}")
+            # Past the end: the database was recreated, so start again from its end
+            position = min(position, latest)
+
+        where_clauses = ["messages.rowid > ?", "messages.rowid <= ?"]
+        params: List[Any] = [position, latest]
+        if chat_jid:
+            where_clauses.append("messages.chat_jid = ?")
+            params.append(chat_jid)
+        # chat_jid from messages and a LEFT JOIN: a message whose chat row
+        # is missing must not be skipped for good
+        rows = _fetchall(f"""
+            SELECT messages.ts_epoch, messages.sender, chats.name, messages.content, messages.is_from_me,
+                messages.chat_jid, messages.id, messages.rowid
+            FROM messages LEFT JOIN chats ON chats.jid = messages.chat_jid
+            WHERE {" AND ".join(where_clauses)}
+            ORDER BY messages.rowid
+            LIMIT ?
+        """, (*params, limit + 1))
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        # Without more rows the whole range up to `latest` has been read,
+        # including rows another chat_jid filtered out
+        next_position = rows[-1][7] if has_more else latest
+        return MessageFeed(
+            messages=[Message(*row[:7]) for row in rows],
+            cursor=_encode_cursor("feed", next_position),
+            has_more=has_more
+        )
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        return MessageFeed(messages=[], cursor=since_cursor)
+
+def _store_signature() -> Tuple:
+    """Size and mtime of messages.db and its journal / WAL; any commit changes one of them."""
+    signature = []
+    for suffix in ("", "-journal", "-wal"):
+        try:
+            stat = os.stat(MESSAGES_DB_PATH + suffix)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+def wait_for_messages(
+    chat_jid: Optional[str] = None,
+    timeout: float = 30.0,
+    since_cursor: Optional[str] = None,
+    limit: int = FEED_LIMIT,
+    cancel: Optional[threading.Event] = None
+) -> MessageFeed:
+    """Block until new messages arrive (or timeout), then return them.
+
+    Returns at once if messages newer than `since_cursor` are already
+    waiting. Otherwise it sleeps, checking every WAIT_POLL_SECONDS whether
+    the store's files changed. That is a stat call, so an idle wait costs
+    next to no CPU. Only after a change, or every WAIT_RECHECK_SECONDS in
+    case a change went unnoticed, is the database queried (get_new_messages).
+
+    Args:
+        chat_jid: Only wait for messages of this chat
+        timeout: Seconds to wait at most (capped at MAX_WAIT_SECONDS)
+        since_cursor: The `cursor` of the previous call, so nothing that
+                      arrives between calls is missed (default: from now)
+        limit: Maximum number of messages to return
+        cancel: Stop waiting as soon as this is set (tool_pool sets it when
+                the tool call times out or is cancelled)
+
+    Returns:
+        The new messages and the cursor to continue from; no messages if
+        the timeout passed first or the wait was cancelled
+    """
+    deadline = time.monotonic() + min(max(timeout, 0.0), MAX_WAIT_SECONDS)
+    cancel = cancel or threading.Event()
+    # Taken before each query, so a commit that lands during it is noticed
+    signature = _store_signature()
+    feed = get_new_messages(since_cursor, chat_jid, limit)
+    checked = time.monotonic()
+    while not feed.messages:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if cancel.wait(min(WAIT_POLL_SECONDS, remaining)):
+            break
+        current = _store_signature()
+        if current != signature or time.monotonic() - checked >= WAIT_RECHECK_SECONDS:
+            signature = current
+            feed = get_new_messages(feed.cursor, chat_jid, limit)
+            checked = time.monotonic()
+    return feed
+
 def get_message_context(
     message_id: str,
     before: int = 5,
-    after: int = 5
+    after: int = 5,
+    chat_jid: Optional[str] = None
 ) -> MessageContext:
-    """Get context around a specific message."""
+    """Get context around a specific message.
+
+    Args:
+        message_id: The ID of the message
+        before: Number of messages to include before it
+        after: Number of messages to include after it
+        chat_jid: The chat the message belongs to, if known. Message IDs are
+            only unique within a chat; without it the lowest chat JID wins.
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get the target message first
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.chat_jid
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.id = ?
-        """, (message_id,))
-        msg_data = cursor.fetchone()
-        
-        if not msg_data:
+        rows = _context_windows([(message_id, chat_jid)], before, after)
+        if not rows:
             raise ValueError(f"Message with ID {message_id} not found")
             
-        target_message = Message(
-            timestamp=datetime.fromisoformat(msg_data[0]),
-            sender=msg_data[1],
-            chat_name=msg_data[2],
-            content=msg_data[3],
-            is_from_me=msg_data[4],
-            chat_jid=msg_data[5],
-            id=msg_data[6]
-        )
-        
-        # Get messages before
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.chat_jid = ? AND messages.timestamp < ?
-            ORDER BY messages.timestamp DESC
-            LIMIT ?
-        """, (msg_data[7], msg_data[0], before))
-        
-        before_messages = []
-        for msg in cursor.fetchall():
-            before_messages.append(Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6]
-            ))
-        
-        # Get messages after
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.chat_jid = ? AND messages.timestamp > ?
-            ORDER BY messages.timestamp ASC
-            LIMIT ?
-        """, (msg_data[7], msg_data[0], after))
-        
-        after_messages = []
-        for msg in cursor.fetchall():
-            after_messages.append(Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6]
-            ))
+        messages = {-1: [], 0: [], 1: []}
+        for msg in rows:
+            messages[msg[1]].append(Message(*msg[2:9]))
         
+        # `before` runs from the nearest message backwards
         return MessageContext(
-            message=target_message,
-            before=before_messages,
-            after=after_messages
+            message=messages[0][0],
+            before=messages[-1][::-1],
+            after=messages[1]
         )
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         raise
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
+# Chat columns, with the last message from the chat_summary table (chat_summary.py)
+_CHAT_COLUMNS = """
+    chats.jid,
+    chats.name,
+    chats.last_message_time,
+    chat_summary.last_preview,
+    chat_summary.last_sender,
+    chat_summary.last_is_from_me,
+    chat_summary.last_message_id,
+    chat_summary.message_count,
+    chat_summary.unread_count
+"""
+_CHAT_COLUMNS_WITHOUT_SUMMARY = "chats.jid, chats.name, chats.last_message_time, NULL, NULL, NULL, NULL, NULL, NULL"
+# Chat fields read from chat_summary, in _CHAT_COLUMNS order
+_CHAT_SUMMARY_COLUMNS = (
+    ("last_message", "chat_summary.last_preview"),
+    ("last_sender", "chat_summary.last_sender"),
+    ("last_is_from_me", "chat_summary.last_is_from_me"),
+    ("last_message_id", "chat_summary.last_message_id"),
+    ("message_count", "chat_summary.message_count"),
+    ("unread_count", "chat_summary.unread_count"),
+)
+
+def _chat_columns(fields: Optional[Sequence[str]], max_content_length: Optional[int]) -> Tuple[str, bool]:
+    """_CHAT_COLUMNS projected to `fields`, with the last message cut in SQL.
+
+    Returns:
+        (the columns, whether any of them come from chat_summary); the JID,
+        name and last message time are always selected for the cursor
+    """
+    summary = [
+        "NULL" if fields is not None and field not in fields
+        else _truncated(column, max_content_length) if field == "last_message"
+        else column
+        for field, column in _CHAT_SUMMARY_COLUMNS
+    ]
+    return ", ".join(["chats.jid", "chats.name", "chats.last_message_time", *summary]), summary != ["NULL"] * len(summary)
+
+def _chat_from_row(chat_data: Tuple, cursor: Optional[str] = None) -> Chat:
+    """Build a Chat from a row selected with _CHAT_COLUMNS."""
+    return Chat(
+        jid=chat_data[0],
+        name=chat_data[1],
+        last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
+        last_message=chat_data[3],
+        last_sender=chat_data[4],
+        last_is_from_me=chat_data[5],
+        last_message_id=chat_data[6],
+        message_count=chat_data[7],
+        unread_count=chat_data[8],
+        cursor=cursor
+    )
+
+def _chats_after(column: str, jid_column: str, value, jid: str, descending: bool) -> Tuple[str, list]:
+    """Keyset predicate for chats ordered by (column, jid), past the given position.
+
+    SQLite sorts NULLs lowest: last in a descending listing, first in an
+    ascending one.
+    """
+    if descending:
+        if value is None:
+            return f"({column} IS NULL AND {jid_column} < ?)", [jid]
+        return f"(({column}, {jid_column}) < (?, ?) OR {column} IS NULL)", [value, jid]
+    if value is None:
+        return f"(({column} IS NULL AND {jid_column} > ?) OR {column} IS NOT NULL)", [jid]
+    return f"({column}, {jid_column}) > (?, ?)", [value, jid]
+
+
+@_cached
 def list_chats(
     query: Optional[str] = None,
     limit: int = 20,
     page: int = 0,
     include_last_message: bool = True,
-    sort_by: str = "last_active"
+    sort_by: str = "last_active",
+    cursor: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+    max_content_length: Optional[int] = None,
+    max_bytes: Optional[int] = None
 ) -> List[Chat]:
-    """Get chats matching the specified criteria."""
+    """Get chats matching the specified criteria.
+
+    Pass the `cursor` of the last returned chat to get the next page by
+    keyset instead of OFFSET; `page` is ignored when a cursor is given.
+
+    `fields` (CHAT_FIELDS), `max_content_length` (of the last message) and
+    `max_bytes` work as in list_messages; chat_summary isn't joined unless
+    one of its fields is wanted.
+    """
+    fields = _check_fields(fields, CHAT_FIELDS)
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
         # Build base query
-        query_parts = ["""
-            SELECT 
-                chats.jid,
-                chats.name,
-                chats.last_message_time,
-                messages.content as last_message,
-                messages.sender as last_sender,
-                messages.is_from_me as last_is_from_me
-            FROM chats
-        """]
-        
         if include_last_message:
-            query_parts.append("""
-                LEFT JOIN messages ON chats.jid = messages.chat_jid 
-                AND chats.last_message_time = messages.timestamp
-            """)
+            columns, join_summary = _chat_columns(fields, max_content_length)
+        else:
+            columns, join_summary = _CHAT_COLUMNS_WITHOUT_SUMMARY, False
+        query_parts = [f"SELECT {columns} FROM chats"]
+        if join_summary:
+            query_parts.append("LEFT JOIN chat_summary ON chat_summary.chat_jid = chats.jid")
             
         where_clauses = []
         params = []
@@ -400,313 +1010,325 @@ def list_chats(
             where_clauses.append("(LOWER(chats.name) LIKE LOWER(?) OR chats.jid LIKE ?)")
             params.extend([f"%{query}%", f"%{query}%"])
             
+        by_activity = sort_by == "last_active"
+        sort_column = "chats.last_message_time" if by_activity else "chats.name"
+        cursor_kind = f"chat:{sort_by}"
+        if cursor:
+            clause, clause_params = _chats_after(sort_column, "chats.jid", *_decode_cursor(cursor, cursor_kind), descending=by_activity)
+            where_clauses.append(clause)
+            params.extend(clause_params)
+            
         if where_clauses:
             query_parts.append("WHERE " + " AND ".join(where_clauses))
             
         # Add sorting
-        order_by = "chats.last_message_time DESC" if sort_by == "last_active" else "chats.name"
+        order_by = "chats.last_message_time DESC, chats.jid DESC" if by_activity else "chats.name, chats.jid"
         query_parts.append(f"ORDER BY {order_by}")
         
         # Add pagination
-        offset = (page ) * limit
+        offset = 0 if cursor else page * limit
         query_parts.append("LIMIT ? OFFSET ?")
         params.extend([limit, offset])
         
-        cursor.execute(" ".join(query_parts), tuple(params))
-        chats = cursor.fetchall()
-        
-        result = []
-        for chat_data in chats:
-            chat = Chat(
-                jid=chat_data[0],
-                name=chat_data[1],
-                last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-                last_message=chat_data[3],
-                last_sender=chat_data[4],
-                last_is_from_me=chat_data[5]
+        def build(chat_data: Tuple) -> Chat:
+            return _chat_from_row(
+                chat_data,
+                cursor=_encode_cursor(cursor_kind, chat_data[2] if by_activity else chat_data[1], chat_data[0])
             )
-            result.append(chat)
-            
-        return result
+
+        if max_bytes is not None:
+            return _fetch_within_budget(" ".join(query_parts), tuple(params), build, fields, max_bytes)
+        return [build(chat_data) for chat_data in _fetchall(" ".join(query_parts), tuple(params))]
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
+@_cached
 def search_contacts(query: str) -> List[Contact]:
-    """Search contacts by name or phone number."""
+    """Search contacts by name or phone number.
+
+    Matches are ranked: the query found in the name or number first, then
+    names similar to it (tolerating typos). See contact_index.py.
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        # Split query into characters to support partial matching
-        search_pattern = '%' +query + '%'
-        
-        cursor.execute("""
-            SELECT DISTINCT 
-                jid,
-                name
-            FROM chats
-            WHERE 
-                (LOWER(name) LIKE LOWER(?) OR LOWER(jid) LIKE LOWER(?))
-                AND jid NOT LIKE '%@g.us'
-            ORDER BY name, jid
-            LIMIT 50
-        """, (search_pattern, search_pattern))
-        
-        contacts = cursor.fetchall()
-        
-        result = []
-        for contact_data in contacts:
-            contact = Contact(
-                phone_number=contact_data[0].split('@')[0],
-                name=contact_data[1],
-                jid=contact_data[0]
-            )
-            result.append(contact)
-            
-        return result
+        CONTACT_INDEX.refresh(MESSAGES_DB_PATH)
+        return [
+            Contact(phone_number=jid.split('@')[0], name=name, jid=jid)
+            for jid, name in CONTACT_INDEX.search(query, limit=50)
+        ]
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
-def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Chat]:
+def load_contact_index() -> int:
+    """Build the contact search index up front instead of on the first search.
+
+    Returns:
+        Number of contacts indexed (0 if the database isn't available yet)
+    """
+    try:
+        schema.ensure_schema(MESSAGES_DB_PATH)
+        CONTACT_INDEX.refresh(MESSAGES_DB_PATH)
+    except sqlite3.Error as e:
+        # stderr: this runs while the MCP server owns stdout
+        print(f"Database error: {e}", file=sys.stderr)
+    return len(CONTACT_INDEX)
+
+
+def get_contact_chats(jid: str, limit: int = 20, page: int = 0, cursor: Optional[str] = None) -> List[Chat]:
     """Get all chats involving the contact.
     
     Args:
         jid: The contact's JID to search for
         limit: Maximum number of chats to return (default 20)
         page: Page number for pagination (default 0)
+        cursor: The `cursor` of the last chat of the previous page; when
+            given, the next page is found by keyset and `page` is ignored
     """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT DISTINCT
-                c.jid,
-                c.name,
-                c.last_message_time,
-                m.content as last_message,
-                m.sender as last_sender,
-                m.is_from_me as last_is_from_me
-            FROM chats c
-            JOIN messages m ON c.jid = m.chat_jid
-            WHERE m.sender = ? OR c.jid = ?
-            ORDER BY c.last_message_time DESC
+        keyset, keyset_params = "", []
+        if cursor:
+            keyset, keyset_params = _chats_after("chats.last_message_time", "chats.jid", *_decode_cursor(cursor, "contact_chat"), descending=True)
+            keyset = "WHERE " + keyset
+            
+        chats = _fetchall(f"""
+            WITH contact_chats(jid) AS (
+                -- Their direct chat, and every chat they have written in
+                SELECT ? UNION SELECT chat_jid FROM chat_participants WHERE participant_jid = ?
+            )
+            SELECT {_CHAT_COLUMNS}
+            -- CROSS JOIN keeps the lookup per contact chat instead of a walk over
+            -- every chat in last_message_time order
+            FROM contact_chats
+            CROSS JOIN chats ON chats.jid = contact_chats.jid
+            LEFT JOIN chat_summary ON chat_summary.chat_jid = chats.jid
+            {keyset}
+            ORDER BY chats.last_message_time DESC, chats.jid DESC
             LIMIT ? OFFSET ?
-        """, (jid, jid, limit, page * limit))
-        
-        chats = cursor.fetchall()
+        """, (jid, phones.jid_user(jid), *keyset_params, limit, 0 if cursor else page * limit))
         
         result = []
         for chat_data in chats:
-            chat = Chat(
-                jid=chat_data[0],
-                name=chat_data[1],
-                last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-                last_message=chat_data[3],
-                last_sender=chat_data[4],
-                last_is_from_me=chat_data[5]
-            )
+            chat = _chat_from_row(chat_data, cursor=_encode_cursor("contact_chat", chat_data[2], chat_data[0]))
             result.append(chat)
             
         return result
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
+@_cached
 def get_last_interaction(jid: str) -> Optional[Message]:
     """Get most recent message involving the contact."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                m.timestamp,
-                m.sender,
-                c.name,
-                m.content,
-                m.is_from_me,
-                c.jid,
-                m.id
-            FROM messages m
-            JOIN chats c ON m.chat_jid = c.jid
-            WHERE m.sender = ? OR c.jid = ?
-            ORDER BY m.timestamp DESC
+        return _fetchone(f"""
+            SELECT {_MESSAGE_COLUMNS}
+            FROM messages
+            JOIN chats ON messages.chat_jid = chats.jid
+            WHERE messages.rowid IN (
+                -- Latest message sent by the contact in any chat, and latest in
+                -- their chat: one summary row each instead of an OR across the join
+                SELECT last_rowid FROM (
+                    SELECT last_rowid FROM chat_participants WHERE participant_jid = ?
+                    ORDER BY last_seen DESC, last_rowid DESC LIMIT 1
+                )
+                UNION ALL
+                SELECT last_rowid FROM chat_summary WHERE chat_jid = ?
+            )
+            ORDER BY messages.ts_epoch DESC
             LIMIT 1
-        """, (jid, jid))
-        
-        msg_data = cursor.fetchone()
-        
-        if not msg_data:
-            return None
-            
-        return Message(
-            timestamp=datetime.fromisoformat(msg_data[0]),
-            sender=msg_data[1],
-            chat_name=msg_data[2],
-            content=msg_data[3],
-            is_from_me=msg_data[4],
-            chat_jid=msg_data[5],
-            id=msg_data[6]
-        )
+        """, (phones.jid_user(jid), jid), _message_row)
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
+def get_last_interactions(jids: List[str]) -> Dict[str, Optional[Message]]:
+    """Batch get_last_interaction: the most recent message of each contact, in one query.
+
+    Returns:
+        A dict keyed by every JID asked for, in the order given; None for
+        JIDs without messages
+    """
+    jids = list(dict.fromkeys(jids))
+    if not jids:
+        return {}
+    try:
+        rows = _fetchall(f"""
+            WITH requested(jid) AS MATERIALIZED (SELECT DISTINCT value FROM json_each(?)),
+            candidates(jid, row_id) AS (
+                -- Per JID, as in get_last_interaction: the newest message sent
+                -- by the contact anywhere, and the newest in their chat
+                SELECT jid, (
+                    SELECT last_rowid FROM chat_participants
+                    WHERE participant_jid = {phones.JID_USER_EXPRESSION.format('requested.jid')}
+                    ORDER BY last_seen DESC, last_rowid DESC LIMIT 1
+                ) FROM requested
+                UNION ALL
+                SELECT requested.jid, chat_summary.last_rowid
+                FROM requested CROSS JOIN chat_summary ON chat_summary.chat_jid = requested.jid
+            )
+            -- With a single MAX(), SQLite takes the bare columns from the row holding the maximum
+            SELECT candidates.jid, {_MESSAGE_COLUMNS}, MAX(messages.ts_epoch)
+            FROM candidates
+            CROSS JOIN messages ON messages.rowid = candidates.row_id
+            JOIN chats ON messages.chat_jid = chats.jid
+            GROUP BY candidates.jid
+        """, (json.dumps(jids),))
+        found = {row[0]: Message(*row[1:8]) for row in rows}
+        return {jid: found.get(jid) for jid in jids}
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        return {}
+
+
+def get_chats(chat_jids: List[str], include_last_message: bool = True) -> Dict[str, Optional[Chat]]:
+    """Batch get_chat: metadata of many chats in one query.
+
+    Returns:
+        A dict keyed by every JID asked for, in the order given; None for
+        unknown chats
+    """
+    chat_jids = list(dict.fromkeys(chat_jids))
+    if not chat_jids:
+        return {}
+    try:
+        if include_last_message:
+            columns, summary = _CHAT_COLUMNS, "LEFT JOIN chat_summary ON chat_summary.chat_jid = chats.jid"
+        else:
+            columns, summary = _CHAT_COLUMNS_WITHOUT_SUMMARY, ""
+        rows = _fetchall(f"""
+            SELECT {columns}
+            FROM json_each(?) AS requested
+            CROSS JOIN chats ON chats.jid = requested.value
+            {summary}
+        """, (json.dumps(chat_jids),))
+        found = {row[0]: _chat_from_row(row) for row in rows}
+        return {jid: found.get(jid) for jid in chat_jids}
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        return {}
+
+
+@_cached
 def get_chat(chat_jid: str, include_last_message: bool = True) -> Optional[Chat]:
     """Get chat metadata by JID."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT 
-                c.jid,
-                c.name,
-                c.last_message_time,
-                m.content as last_message,
-                m.sender as last_sender,
-                m.is_from_me as last_is_from_me
-            FROM chats c
-        """
-        
         if include_last_message:
-            query += """
-                LEFT JOIN messages m ON c.jid = m.chat_jid 
-                AND c.last_message_time = m.timestamp
-            """
+            query = f"SELECT {_CHAT_COLUMNS} FROM chats LEFT JOIN chat_summary ON chat_summary.chat_jid = chats.jid"
+        else:
+            query = f"SELECT {_CHAT_COLUMNS_WITHOUT_SUMMARY} FROM chats"
             
-        query += " WHERE c.jid = ?"
+        query += " WHERE chats.jid = ?"
         
-        cursor.execute(query, (chat_jid,))
-        chat_data = cursor.fetchone()
+        chat_data = _fetchone(query, (chat_jid,))
         
         if not chat_data:
             return None
             
-        return Chat(
-            jid=chat_data[0],
-            name=chat_data[1],
-            last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-            last_message=chat_data[3],
-            last_sender=chat_data[4],
-            last_is_from_me=chat_data[5]
-        )
+        return _chat_from_row(chat_data)
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def get_direct_chat_by_contact(sender_phone_number: str) -> Optional[Chat]:
-    """Get chat metadata by sender phone number."""
+    """Get chat metadata by sender phone number.
+
+    The number may be in any common format, or a JID (see phones.normalize);
+    numbers without a country code are taken as phones.DEFAULT_COUNTRY_CODE.
+    Only an exact match on the whole number counts, and a chat whose number
+    is exactly the digits as given wins over the one with the country code
+    added, since numbers like 6591234567 are international already.
+    """
+    digits = phones.normalize(sender_phone_number)
+    if not digits:
+        return None
+    given = phones.normalize(sender_phone_number, default_country_code="") or digits
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                c.jid,
-                c.name,
-                c.last_message_time,
-                m.content as last_message,
-                m.sender as last_sender,
-                m.is_from_me as last_is_from_me
-            FROM chats c
-            LEFT JOIN messages m ON c.jid = m.chat_jid 
-                AND c.last_message_time = m.timestamp
-            WHERE c.jid LIKE ? AND c.jid NOT LIKE '%@g.us'
+        chat_data = _fetchone(f"""
+            SELECT {_CHAT_COLUMNS}
+            FROM chats
+            LEFT JOIN chat_summary ON chat_summary.chat_jid = chats.jid
+            WHERE chats.phone_digits IN (?, ?)
+            -- Prefer the canonical personal JID over device or other-server variants
+            ORDER BY chats.phone_digits = ? DESC, chats.jid IN (?, ?) DESC, chats.last_message_time DESC
             LIMIT 1
-        """, (f"%{sender_phone_number}%",))
-        
-        chat_data = cursor.fetchone()
+        """, (given, digits, given, f"{given}@{phones.USER_SERVER}", f"{digits}@{phones.USER_SERVER}"))
         
         if not chat_data:
             return None
             
-        return Chat(
-            jid=chat_data[0],
-            name=chat_data[1],
-            last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-            last_message=chat_data[3],
-            last_sender=chat_data[4],
-            last_is_from_me=chat_data[5]
-        )
+        return _chat_from_row(chat_data)
         
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
+        print(f"Database error: {e}", file=sys.stderr)
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
-def check_connection() -> Tuple[bool, str]:
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the result cache used by list_chats, search_contacts, get_chat and get_last_interaction."""
+    return RESULT_CACHE.stats()
+
+def check_connection(max_age: Optional[float] = None) -> Tuple[bool, str]:
     """Check if WhatsApp is connected and return status.
-    
+
+    The answer is cached briefly (see bridge_status.py), so repeated checks
+    don't each ask the bridge.
+
+    Args:
+        max_age: Accept a cached status at most this many seconds old
+                 (default bridge_status.TTL_SECONDS; 0 always asks the bridge)
+
     Returns:
         tuple: (connected status boolean, status message string)
     """
-    try:
-        # Use the QR code endpoint which returns connection status
-        response = requests.get(f"{WHATSAPP_API_BASE_URL}/qrcode")
-        if response.status_code == 200:
-            data = response.json()
-            status = data.get("status")
-            message = data.get("message", "")
-            
-            if status == "connected":
-                return True, "Connected to WhatsApp"
-            elif status == "qrcode":
-                return False, "QR code available for scanning"
-            elif status == "needs_qr":
-                return False, "Waiting for QR code generation"
-            else:
-                return False, f"Status: {status} - {message}"
-        else:
-            return False, f"Error: HTTP {response.status_code}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
-    except Exception as e:
-        return False, f"Unexpected error: {str(e)}"
-        
+    return bridge_status.check_connection(max_age)
+
 def is_connected() -> bool:
     """Check if WhatsApp is connected (simple boolean check).
     
     Returns:
         bool: True if connected, False otherwise
     """
+    connected, _ = check_connection()
+    return connected
+
+def refresh_suppression() -> Tuple[int, int]:
+    """Pick up new STOP / START replies and changes to the suppression list file.
+
+    On errors the list stays as it was loaded, and the error is printed to stderr.
+
+    Returns:
+        (numbers opted out, numbers opted back in) since the last refresh
+    """
     try:
-        connected, _ = check_connection()
-        return connected
-    except:
-        # In case of any error, check if the connected status file exists (backup method)
-        connected_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'whatsapp-bridge', 'whatsapp_connected.txt') 
-        return os.path.exists(connected_file)
+        SUPPRESSION.refresh()
+        return SUPPRESSION.harvest(MESSAGES_DB_PATH)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        # stderr: this runs while the MCP server owns stdout
+        print(f"Suppression list error: {e}", file=sys.stderr)
+        return 0, 0
+
+# send_message's status for a recipient on the suppression list
+OPTED_OUT_MESSAGE = "Not sent: {recipient} has opted out of messages"
+
+def is_suppressed(recipient: str) -> bool:
+    """Whether recipient (a phone number or personal JID) has opted out of messages.
+
+    Group JIDs are never suppressed.
+    """
+    refresh_suppression()
+    return recipient in SUPPRESSION
 
 def send_message(recipient: str, message: str) -> Tuple[bool, str]:
     """Send a WhatsApp message to the specified recipient. For group messages use the JID.
@@ -719,10 +1341,16 @@ def send_message(recipient: str, message: str) -> Tuple[bool, str]:
     Returns:
         Tuple[bool, str]: A tuple containing success status and a status message
     """
+    # Imported here: only sending needs it, and read-only use shouldn't pay for it
+    import requests
+
     try:
         # Validate input
         if not recipient:
             return False, "Recipient must be provided"
+
+        if is_suppressed(recipient):
+            return False, OPTED_OUT_MESSAGE.format(recipient=recipient)
         
         url = f"{WHATSAPP_API_BASE_URL}/send"
         payload = {
@@ -730,7 +1358,7 @@ def send_message(recipient: str, message: str) -> Tuple[bool, str]:
             "message": message
         }
         
-        response = requests.post(url, json=payload)
+        response = bridge_status.session().post(url, json=payload, timeout=HTTP_TIMEOUT)
         
         # Check if the request was successful
         if response.status_code == 200:
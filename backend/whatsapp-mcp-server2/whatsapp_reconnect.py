@@ -8,12 +8,12 @@ This module provides functions to monitor, check, and reconnect the WhatsApp API
 import os
 import time
 import subprocess
-import requests
-import signal
 import sys
 from typing import Tuple, Optional
 import logging
 
+import bridge_status
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -27,10 +27,13 @@ logging.basicConfig(
 logger = logging.getLogger("whatsapp_reconnect")
 
 # Constants
-WHATSAPP_API_BASE_URL = "http://localhost:9090/api"
-WHATSAPP_BRIDGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'whatsapp-bridge')
-CONNECTED_FILE = os.path.join(WHATSAPP_BRIDGE_PATH, 'whatsapp_connected.txt')
-QR_FILE = os.path.join(WHATSAPP_BRIDGE_PATH, 'latest_qr.txt')
+WHATSAPP_API_BASE_URL = bridge_status.WHATSAPP_API_BASE_URL
+WHATSAPP_BRIDGE_PATH = bridge_status.WHATSAPP_BRIDGE_PATH
+CONNECTED_FILE = bridge_status.CONNECTED_FILE
+QR_FILE = bridge_status.QR_FILE
+# Seconds between checks while connected, and the longest wait while not
+MONITOR_INTERVAL = 30.0
+MAX_MONITOR_INTERVAL = 300.0
 
 def check_connection() -> Tuple[bool, str]:
     """Check if WhatsApp is connected and return status.
@@ -38,28 +41,42 @@ def check_connection() -> Tuple[bool, str]:
     Returns:
         tuple: (connected status boolean, status message string)
     """
-    try:
-        # Use the QR code endpoint which returns connection status
-        response = requests.get(f"{WHATSAPP_API_BASE_URL}/qrcode")
-        if response.status_code == 200:
-            data = response.json()
-            status = data.get("status")
-            message = data.get("message", "")
-            
-            if status == "connected":
-                return True, "Connected to WhatsApp"
-            elif status == "qrcode":
-                return False, "QR code available for scanning"
-            elif status == "needs_qr":
-                return False, "Waiting for QR code generation"
-            else:
-                return False, f"Status: {status} - {message}"
+    # Always ask the bridge: this is a one-off check from the command line
+    return bridge_status.check_connection(max_age=0)
+
+def _wait(seconds: float) -> None:
+    """Sleep for `seconds`, waking early if the bridge's status files change."""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(min(1.0, deadline - time.monotonic()))
+        if bridge_status.STATE.changed():
+            return
+
+def monitor(interval: float = MONITOR_INTERVAL, max_interval: float = MAX_MONITOR_INTERVAL) -> None:
+    """Watch the connection and log every change of state until interrupted.
+
+    Checks every `interval` seconds while connected. While disconnected or
+    unreachable the wait doubles after each failed check, up to
+    `max_interval`, and drops back to `interval` once connected again. A
+    change to the bridge's status files triggers a check straight away.
+    """
+    logger.info(f"Monitoring WhatsApp connection every {interval:g}s")
+    last_status = None
+    failures = 0
+    while True:
+        status = bridge_status.STATE.get(max_age=0)
+        if status.status != last_status:
+            log = logger.info if status.connected else logger.warning
+            log(f"WhatsApp status: {status.status} - {status.message}")
+            last_status = status.status
+        if status.connected:
+            failures = 0
+            delay = interval
         else:
-            return False, f"Error: HTTP {response.status_code}"
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
-    except Exception as e:
-        return False, f"Unexpected error: {str(e)}"
+            delay = min(interval * 2 ** failures, max_interval)
+            failures += 1
+            logger.info(f"Not connected, checking again in {delay:g}s")
+        _wait(delay)
 
 if __name__ == "__main__":
     # Handle command-line arguments
@@ -71,6 +88,17 @@ if __name__ == "__main__":
             status = "Connected" if connected else "Disconnected"
             print(f"WhatsApp Statusss: {status} - {message}")
             sys.exit(0 if connected else 1)
+
+        elif cmd == "monitor":
+            try:
+                interval = float(sys.argv[2]) if len(sys.argv) > 2 else MONITOR_INTERVAL
+            except ValueError:
+                print("Usage: python whatsapp_reconnect.py monitor [interval_seconds]")
+                sys.exit(1)
+            try:
+                monitor(interval)
+            except KeyboardInterrupt:
+                logger.info("Monitoring stopped")
             
         else:
             print("Unknown command. Available commands: check, reconnect, force, monitor [interval]")
@@ -82,4 +110,4 @@ if __name__ == "__main__":
         print("  check     - Check WhatsApp connection status")
         print("  reconnect - Attempt to reconnect WhatsApp")
         print("  force     - Force reconnection by restarting service")
-        print("  monitor   - Start connection monitoring")
\ No newline at end of file
+        print("  monitor   - Start connection monitoring (monitor [interval_seconds])")
\ No newline at end of file